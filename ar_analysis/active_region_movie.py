@@ -1,47 +1,32 @@
 import numpy as np
-import pandas as pd
-import matplotlib.pyplot as plt 
-from sunpy.time import parse_time
-import sunpy.map
-from sunpy.coordinates import frames
-from astropy.coordinates import SkyCoord
-from astropy import units as u
-import datetime
-import subprocess
-import pylab
-from matplotlib import dates
-
-# read in the data as a pandas DataFrame
-all_data = pd.read_csv('concat_1996-2020.csv')
-all_data = all_data[all_data['event_starttime'] >'2008-01-01']
-# get the time as datetime objects
-tt = list(pd.to_datetime(all_data['event_starttime']))
-# get the time in seconds from initial time (for plotting)
-times = [(t - tt[0]).total_seconds() for t in tt]
-# make these columns of DataFrame
-all_data['times'] = times
-all_data['tt'] = tt
-
-# we want to make a list of all the dates from 2010-2020 for
-# plotting, this will allow us to pull out the active regions 
-# for each day (or not if none on a certain day) for plotting.
-tstart = parse_time(all_data['event_starttime'].min()).datetime
-tfinal = parse_time(all_data['event_endtime'].max()).datetime
-time_over = [tstart.strftime('%Y-%m-%dT%H:%M:%S')]
-t0 = tstart
-while t0 < tfinal:
-    t0 = t0 + datetime.timedelta(days=1)
-    time_over.append(t0.strftime('%Y-%m-%dT%H:%M:%S'))
-
-# this is a rough conversion for area of active region at disk
-# center in km to area in arcsec (as observed from Earth). If you 
-# want to be more precise you would calculate for each day, but
-# its grand for this purpose.
-all_data['area_arcsec'] = all_data['area_atdiskcenter']/(725**2)
-
-
-
-def plot_ar_butterfly(i, savedir='./plots_joy/', cmap='binary_r'):
+from ar_dataset import get_dataset
+from render_frames import render_movie, save_png
+from profiling import profiled, checkpoint
+
+# The data (all_data, time_over etc.) is only read in when it's first
+# needed, see ar_dataset.ARDataset. Only the active regions from 2008
+# on are used. matplotlib is only imported in the functions that use it
+# so that importing this is quick.
+data_file = 'concat_1996-2020.csv'
+
+
+def dataset():
+    """
+    The active region data for the plots (an `ar_dataset.ARDataset`).
+    """
+    return get_dataset(data_file, since='2008-01-01')
+
+
+def __getattr__(name):
+    # so that active_region_movie.all_data etc. still work, loading the data when first used
+    if name in ('all_data', 'ar_days', 'time_over'):
+        return getattr(dataset(), name)
+    raise AttributeError('module {!r} has no attribute {!r}'.format(__name__, name))
+
+
+
+@profiled(frame=True)
+def plot_ar_butterfly(i, savedir='./plots_joy/', cmap='binary_r', butterfly='raster'):
     """
     This function plots the Sun with the daily active regions, the butterfly diagram, 
     and histogram for the data up to the date time_over[i].
@@ -53,28 +38,35 @@ def plot_ar_butterfly(i, savedir='./plots_joy/', cmap='binary_r'):
     ----------
     i : ~int
         the index of the `time_over` list for which to plot. 
+    cmap : ~str
+        the colormap of the butterfly diagram.
+    butterfly : ~str
+        'raster' draws the butterfly diagram from the precomputed image (see
+        `frame_aggregates.ButterflyRaster`), 'scatter' scatters all the past data.
 
     """
 
+    import matplotlib.pyplot as plt
+    import pylab
+    from matplotlib import dates
+
+    data = dataset()
+    all_data, ar_days = data.all_data, data.ar_days
+
     plt.style.use('dark_background')
     # find the active region data for the day from the dataframe
-    data_for_day = all_data[all_data['event_starttime'].isin([time_over[i]])]
+    data_for_day = ar_days.day(i)
 
     # get the daya for the past 10 days previous to timestep i. This is to plot the previous
     # active regions with a colormap to highlight the active region evolution.
-    if i < 10:
-        data_for_days = all_data[all_data['event_starttime'].isin(time_over[0:i])]
-    else:
-        data_for_days = all_data[all_data['event_starttime'].isin(time_over[i-10:i])]
+    data_for_days = ar_days.previous(i, 10)
 
     # get the data for the past 100 days from i for faint active region plot
-    if i < 100:
-        data_for_past = all_data[all_data['event_starttime'].isin(time_over[0:i])]
-    else:
-        data_for_past = all_data[all_data['event_starttime'].isin(time_over[i-100:i])]
+    data_for_past = ar_days.previous(i, 100)
    
     # all previous data up to date (i) for butterfly diagram.
-    data_all_past = all_data[all_data['event_starttime'].isin(time_over[0:i])]
+    data_all_past = ar_days.all_past(i)
+    checkpoint('select')
 
     #########################################
     # where plot happens
@@ -110,18 +102,23 @@ def plot_ar_butterfly(i, savedir='./plots_joy/', cmap='binary_r'):
                     edgecolor='k', lw=0.4)        
 
 
-    # plotting histogram to right of Sun
-    na, bins, patches = ax2.hist(data_all_past['hpc_y'], bins=100, orientation='horizontal', color='lightgrey')
+    # plotting histogram to right of Sun, the histograms of the past
+    # data for every day are worked out once in the dataset
+    data.lat_histograms.draw(ax2, i, color='lightgrey')
     ax2.set_ylim(-1101, 1101)
     ax2.tick_params(labelleft=False, which='both', direction='in')
     ax2.set_xlabel('No. active regions')
     ax2.set_xlim(0, 300)
 
     # plotting butterfly diagram
-    ax3.scatter(data_all_past['tt'], data_all_past['hgc_y'], c=data_all_past['times'], alpha=0.3, 
-              s=np.sqrt(data_all_past['area_arcsec']), 
-              edgecolor='k', lw=0.4, cmap=cmap)
-    ax3.axvline(parse_time(time_over[i]).datetime, color='w', ls='dashed')
+    ax3.xaxis_date()
+    if butterfly == 'raster':
+        data.butterfly_raster.draw(ax3, i, cmap=cmap)
+    else:
+        ax3.scatter(data_all_past['tt'], data_all_past['hgc_y'], c=data_all_past['times'], alpha=0.3, 
+                  s=np.sqrt(data_all_past['area_arcsec']), 
+                  edgecolor='k', lw=0.4, cmap=cmap)
+    ax3.axvline(ar_days.days[i], color='w', ls='dashed')
     ax3.set_xlabel('Time (UT)')
     ax3.set_ylabel('Latitude (deg)')
     ax3.tick_params(which='both', direction='in')
@@ -135,17 +132,30 @@ def plot_ar_butterfly(i, savedir='./plots_joy/', cmap='binary_r'):
     ax3.patch.set_alpha(0.0)
     ax2.patch.set_alpha(0.0)
     ax1.patch.set_alpha(0.0)
+    checkpoint('draw')
 
     # save the plot
-    plt.savefig(savedir + 'test_2_{:04d}.png'.format(i), dpi=200)#, transparent=True)
+    save_png(savedir + 'test_2_{:04d}.png'.format(i), dpi=200)#, transparent=True)
     plt.close()
+    checkpoint('savefig')
 
 
-def make_movie_final():
-    for i in range(4120, len(time_over)):
-        print(i)
-        plot_ar_butterfly(i, cmap='binary_r')
+def make_movie_final(start=0, subset=None, processes=None, mode='png'):
+    """
+    Render the `plot_ar_butterfly` frames from `start` onwards over a pool of
+    processes and make the movie once they are all there. Frames that are
+    already rendered are skipped and `subset` renders only part of the range.
 
-    # subprocess.call(['ffmpeg','-r', '10' ,'-f', 'image2', '-s', 
-    #             '1920x1080', '-i', './plots/test_2_%04d.png', 
-    #             '-vcodec', 'libx264', '-crf', '25',  '-pix_fmt', 'yuv420p', 'test_mov23.mp4'])
+    With mode='stream' the figure is instead built once and the frames are
+    piped straight into ffmpeg without writing any pngs.
+    """
+    data = dataset()
+    if mode == 'stream':
+        from stream_render import ARFrameRenderer, BUTTERFLY_STYLE
+        renderer = ARFrameRenderer.from_dataset(data, look=BUTTERFLY_STYLE)
+        renderer.stream_movie(range(start, len(data.time_over)), 'test_mov23.mp4')
+        return
+
+    render_movie(plot_ar_butterfly, range(start, len(data.time_over)), 'test_mov23.mp4',
+                 savedir='./plots_joy/', filename='test_2_{:04d}.png', data_file=data_file,
+                 subset=subset, processes=processes, cmap='binary_r')
@@ -0,0 +1,103 @@
+import numpy as np
+import pandas as pd
+from ar_store import make_day_grid, day_offsets
+
+# weights of the 13-month smoothing used by SILSO for the smoothed
+# sunspot number, half weight for the first and last months.
+SMOOTH_13_MONTH = np.r_[0.5, np.ones(11), 0.5]/12.
+
+
+class DailyARCounts:
+    """
+    Number of active regions, number of spots and the sunspot number
+    (10*regions + spots) for each day, computed from the active region table.
+
+    The days are the same as `time_over` in the plotting scripts, days
+    without any active regions are 0.
+
+    Parameters
+    ----------
+    data : ~pandas.DataFrame
+        the active region data, needs `event_starttime`, `event_endtime` and
+        `ar_numspots`.
+    """
+
+    def __init__(self, data):
+        tstart = pd.to_datetime(data['event_starttime']).min()
+        tfinal = pd.to_datetime(data['event_endtime']).max()
+        self.days = make_day_grid(tstart, tfinal)
+        self.n_regions = np.zeros(len(self.days), dtype=np.int64)
+        self.n_spots = np.zeros(len(self.days), dtype=np.int64)
+        self._add(data)
+
+    def _add(self, data):
+        offsets, exact = day_offsets(data['event_starttime'], self.days[0])
+        exact &= (offsets >= 0) & (offsets < len(self.days))
+        offsets = offsets[exact]
+        spots = np.nan_to_num(np.asarray(data['ar_numspots'], dtype=float)[exact])
+
+        self.n_regions += np.bincount(offsets, minlength=len(self.days))
+        self.n_spots += np.rint(np.bincount(offsets, weights=spots,
+                                            minlength=len(self.days))).astype(np.int64)
+
+    def extend(self, new_data):
+        """
+        Add new active region records (e.g. newly fetched days). The day grid
+        is extended to cover them and only the new rows are counted, the
+        counts for the days already there are not recomputed.
+
+        Parameters
+        ----------
+        new_data : ~pandas.DataFrame
+            the new active region records, none can be before the first day.
+        """
+        if pd.to_datetime(new_data['event_starttime']).min() < self.days[0]:
+            raise ValueError('new data starts before the first day of the counts')
+
+        tfinal = max(pd.to_datetime(new_data['event_endtime']).max(), pd.Timestamp(self.days[-1]))
+        days = make_day_grid(self.days[0], tfinal)
+        extra = len(days) - len(self.days)
+        if extra > 0:
+            self.days = days
+            self.n_regions = np.r_[self.n_regions, np.zeros(extra, dtype=np.int64)]
+            self.n_spots = np.r_[self.n_spots, np.zeros(extra, dtype=np.int64)]
+        self._add(new_data)
+
+    @property
+    def regions(self):
+        """
+        pandas.Series of the number of active regions each day.
+        """
+        return pd.Series(self.n_regions, index=pd.DatetimeIndex(self.days))
+
+    @property
+    def spots(self):
+        """
+        pandas.Series of the total number of spots each day.
+        """
+        return pd.Series(self.n_spots, index=pd.DatetimeIndex(self.days))
+
+    @property
+    def wolf(self):
+        """
+        pandas.Series of the daily sunspot (Wolf) number, 10*regions + spots.
+        """
+        return pd.Series(10*self.n_regions + self.n_spots, index=pd.DatetimeIndex(self.days))
+
+    def smoothed(self, window='30D'):
+        """
+        The sunspot number averaged over bins of `window`, e.g. the 30 day
+        means used for the sunspot number panel of `ploty`.
+        """
+        return self.wolf.resample(window).mean()
+
+    def smoothed_13_month(self):
+        """
+        The 13-month smoothed sunspot number: the monthly means smoothed with
+        the tapered 13-month running mean, NaN for the first and last 6 months.
+        """
+        monthly = self.wolf.resample('MS').mean()
+        smoothed = np.full(len(monthly), np.nan)
+        if len(monthly) >= len(SMOOTH_13_MONTH):
+            smoothed[6:-6] = np.convolve(monthly.values, SMOOTH_13_MONTH, mode='valid')
+        return pd.Series(smoothed, index=monthly.index)
@@ -1,17 +1,28 @@
+import os
+import time
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+import pandas as pd
 from sunpy.net import hek
-client = hek.HEKClient()
+from flare_match import goes_flux
 
-# tstart = '2010-01-01'
-# #tend = '2010-02-01'
-# tend = '2020-08-21'
+# only interested in these columns from the HEK query
+AR_COLUMNS = ['ar_noaanum', 'event_starttime', 'event_endtime',
+              'hpc_x', 'hpc_y', 'hgs_x', 'hgs_y', 'hgc_x', 'hgc_y',
+              'frm_humanflag', 'frm_name',
+              'frm_daterun', 'ar_mtwilsoncls', 'ar_mcintoshcls', 'SOL_standard',
+              'ar_numspots', 'area_atdiskcenter', 'area_unit']
 
-# tstart = '1996-09-01'
-# tend = '2010-01-01'
+# what is asked of the HEK, this goes into the cache key so that
+# changing the query doesn't pick up old cached windows.
+AR_QUERY = dict(event_type='AR', frm_name='NOAA SWPC Observer', columns=AR_COLUMNS)
 
-tstart = '1986-09-01'
-tend = '1996-09-01'
+# the GOES flares above C1.0, as in since_1986_c1_solarcycle_flares.csv
+FLARE_COLUMNS = ['event_starttime', 'event_peaktime', 'event_endtime', 'fl_goescls', 'ar_noaanum']
+FLARE_QUERY = dict(event_type='FL', observatory='GOES', min_class='C1.0', columns=FLARE_COLUMNS)
 
-def get_ar_data(tstart, tend):
+
+def get_ar_data(tstart, tend, client=None):
 	"""
 	Fucntion to get the active region data from NOAA SPWC by
 	querying the HEK.
@@ -22,6 +33,9 @@ def get_ar_data(tstart, tend):
 		the start time of the query
 	tend : ~str
 		the end time of the query
+	client : optional
+		the HEK client to use, defaults to a new `hek.HEKClient`.
+		Anything with the same `search` method can be passed, e.g. for testing.
 
 
 	Returns
@@ -29,33 +43,212 @@ def get_ar_data(tstart, tend):
 	astropy.table.Table
 		an astropy table with the data
 	"""
+	if client is None:
+		client = hek.HEKClient()
 
 	result = client.search(hek.attrs.Time(tstart, tend),
-	                       hek.attrs.EventType('AR'),
-	                       hek.attrs.FRM.Name == 'NOAA SWPC Observer')
-
-	# only interested in these columns from the HEK query
-	new_columns = ['ar_noaanum', 'event_starttime', 'event_endtime', 
-	               'hpc_x', 'hpc_y', 'hgs_x', 'hgs_y', 'hgc_x', 'hgc_y', 
-	               'frm_humanflag', 'frm_name',
-	               'frm_daterun', 'ar_mtwilsoncls', 'ar_mcintoshcls', 'SOL_standard', 
-	               'ar_numspots', 'area_atdiskcenter', 'area_unit']
+	                       hek.attrs.EventType(AR_QUERY['event_type']),
+	                       hek.attrs.FRM.Name == AR_QUERY['frm_name'])
 
+	# an empty query doesn't have any of the columns
+	if len(result) == 0:
+		return None
 
-	new_table = result[new_columns]
+	new_table = result[AR_COLUMNS]
 
 	return new_table
 
 
-# get the data
-ar_data = get_ar_data('2010-01-01', '2020-08-21')
-# save the data as a csv file so that it can be read in again. 
-ar_data.write('all_ar_2010-2020.csv', format='csv')
+def get_flare_data(tstart, tend, client=None):
+	"""
+	Get the GOES flares above C1.0 from the HEK, with the columns of
+	since_1986_c1_solarcycle_flares.csv (what make_goes_flare_csv in
+	solar_flare_and_snn.ipynb made).
 
+	Parameters
+	----------
+	tstart : ~str
+		the start time of the query
+	tend : ~str
+		the end time of the query
+	client : optional
+		the HEK client to use, defaults to a new `hek.HEKClient`.
 
+	Returns
+	-------
+	pandas.DataFrame
+		the flares sorted by start time, one per start time, with the peak
+		flux `goes_class` and the peak time `flare_times`.
+	"""
+	if client is None:
+		client = hek.HEKClient()
 
-# new_table.write('all_ar_2010-2020.csv', format='csv')
+	result = client.search(hek.attrs.Time(tstart, tend),
+	                       hek.attrs.EventType(FLARE_QUERY['event_type']),
+	                       hek.attrs.FL.GOESCls > FLARE_QUERY['min_class'],
+	                       hek.attrs.OBS.Observatory == FLARE_QUERY['observatory'])
 
-# new_table.write('all_ar_1996-2010.csv', format='csv')
+	columns = FLARE_COLUMNS + ['goes_class', 'flare_times']
+	if len(result) == 0:
+		return pd.DataFrame(columns=columns)
 
-new_table.write('all_ar_1986-1996.csv', format='csv')
+	flares = result[FLARE_COLUMNS].to_pandas()
+	# the times as strings like the ones in the csv files
+	for name in ['event_starttime', 'event_peaktime', 'event_endtime']:
+		flares[name] = pd.to_datetime(flares[name]).dt.strftime('%Y-%m-%dT%H:%M:%S')
+	flares['goes_class'] = goes_flux(flares['fl_goescls'])
+	flares['flare_times'] = pd.to_datetime(flares['event_peaktime']).dt.strftime('%Y-%m-%d %H:%M:%S')
+
+	flares = flares[flares['goes_class'] != 0]
+	flares = flares.sort_values('event_starttime', kind='stable').drop_duplicates('event_starttime')
+	return flares[columns].reset_index(drop=True)
+
+
+def time_windows(tstart, tend, freq='MS'):
+	"""
+	Split the time range into windows, by default one per calendar month.
+
+	Parameters
+	----------
+	tstart : ~str
+		the start time
+	tend : ~str
+		the end time
+	freq : ~str
+		a pandas frequency for the window edges, e.g. 'MS' or 'YS'.
+
+	Returns
+	-------
+	list
+		list of (start, end) strings for each window.
+	"""
+	tstart, tend = pd.Timestamp(tstart), pd.Timestamp(tend)
+	edges = [t for t in pd.date_range(tstart, tend, freq=freq) if tstart < t < tend]
+	edges = [tstart] + edges + [tend]
+	fmt = '%Y-%m-%dT%H:%M:%S'
+	return [(edges[i].strftime(fmt), edges[i+1].strftime(fmt)) for i in range(len(edges) - 1)]
+
+
+def window_cache_file(cache_dir, tstart, tend, query=AR_QUERY):
+	"""
+	The cache file for a window, keyed on the window and a hash of the query.
+	"""
+	key = hashlib.sha1(repr(sorted(query.items())).encode()).hexdigest()[:10]
+	name = 'ar_{:s}_{:s}_{:s}.csv'.format(tstart, tend, key).replace(':', '')
+	return os.path.join(cache_dir, name)
+
+
+def fetch_window(tstart, tend, client, cache_dir, retries=3, backoff=2.):
+	"""
+	Get one window from the cache, or query the HEK for it and cache the result.
+	Failed queries are retried `retries` times, waiting backoff*2**n seconds
+	before the n-th retry.
+
+	Returns
+	-------
+	pandas.DataFrame
+	"""
+	cache_file = window_cache_file(cache_dir, tstart, tend)
+	if not os.path.exists(cache_file):
+		for attempt in range(retries + 1):
+			try:
+				result = get_ar_data(tstart, tend, client=client)
+				break
+			except Exception:
+				if attempt == retries:
+					raise
+				time.sleep(backoff * 2**attempt)
+
+		if result is None:
+			result = pd.DataFrame(columns=AR_COLUMNS)
+		else:
+			result = result.to_pandas()
+		# write to a temporary file first so an interrupted write
+		# doesn't leave a broken window in the cache
+		result.to_csv(cache_file + '.part', index=False)
+		os.replace(cache_file + '.part', cache_file)
+
+	return pd.read_csv(cache_file)
+
+
+def fetch_ar_data(tstart, tend, freq='MS', max_workers=4, cache_dir='./hek_cache/',
+                  client=None, retries=3, backoff=2.):
+	"""
+	Get the active region data for any time range by splitting it into windows
+	(monthly by default) that are queried on a pool of threads. Each window is
+	cached in `cache_dir`, so running again only queries the windows that are missing
+	(e.g. after a failed query).
+
+	Parameters
+	----------
+	tstart : ~str
+		the start time of the query
+	tend : ~str
+		the end time of the query
+	freq : ~str
+		pandas frequency of the windows.
+	max_workers : ~int
+		the number of queries run at once.
+	cache_dir : ~str
+		where the windows are cached.
+	client : optional
+		the HEK client, defaults to `hek.HEKClient`.
+	retries : ~int
+		number of times a failed window is retried.
+	backoff : ~float
+		seconds to wait before the first retry, doubled for each one after.
+
+	Returns
+	-------
+	pandas.DataFrame
+		all the windows stitched together, sorted by start time and NOAA number.
+	"""
+	if client is None:
+		client = hek.HEKClient()
+	os.makedirs(cache_dir, exist_ok=True)
+
+	windows = time_windows(tstart, tend, freq=freq)
+	with ThreadPoolExecutor(max_workers=max_workers) as pool:
+		futures = [pool.submit(fetch_window, t0, t1, client, cache_dir, retries, backoff)
+		           for t0, t1 in windows]
+		# wait for all of them so that the windows that worked are cached
+		errors = [f.exception() for f in futures]
+
+	failed = [i for i, e in enumerate(errors) if e is not None]
+	if len(failed) > 0:
+		first = failed[0]
+		raise RuntimeError('{:d} of {:d} windows failed (first is {:s} - {:s}), '
+		                   'rerun to fetch them again'.format(len(failed), len(windows), *windows[first])) \
+		                   from errors[first]
+
+	# an event that starts on a window edge is returned by both windows, so
+	# each window only keeps the events that start in [t0, t1). The first and
+	# last windows also keep anything before/after that, like a single query would.
+	tables = []
+	for n, ((t0, t1), f) in enumerate(zip(windows, futures)):
+		table = f.result()
+		start = pd.to_datetime(table['event_starttime'])
+		keep = pd.Series(True, index=table.index)
+		if n > 0:
+			keep &= start >= pd.Timestamp(t0)
+		if n < len(windows) - 1:
+			keep &= start < pd.Timestamp(t1)
+		tables.append(table[keep])
+	tables = [t for t in tables if len(t) > 0]
+	if len(tables) == 0:
+		return pd.DataFrame(columns=AR_COLUMNS)
+
+	new_table = pd.concat(tables, ignore_index=True)
+	new_table = new_table.sort_values(['event_starttime', 'ar_noaanum'], kind='stable')
+
+	return new_table.reset_index(drop=True)
+
+
+if __name__ == '__main__':
+	# get the data for each time range and save the data as a csv file so
+	# that it can be read in again.
+	for tstart, tend, filename in [('1986-09-01', '1996-09-01', 'all_ar_1986-1996.csv'),
+	                               ('1996-09-01', '2010-01-01', 'all_ar_1996-2010.csv'),
+	                               ('2010-01-01', '2020-08-21', 'all_ar_2010-2020.csv')]:
+		ar_data = fetch_ar_data(tstart, tend)
+		ar_data.to_csv(filename, index=False)
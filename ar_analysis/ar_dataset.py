@@ -0,0 +1,172 @@
+from functools import lru_cache, cached_property
+import numpy as np
+import pandas as pd
+from ar_store import ARDayStore
+from ar_counts import DailyARCounts
+from data_cache import load_csv
+from profiling import profiled, checkpoint
+
+
+class ARDataset:
+    """
+    The active region data that the plotting scripts use. Nothing is read
+    until it is first asked for, and everything is only worked out once,
+    so importing the scripts is quick and each pool worker only loads the
+    data the first time it renders a frame.
+
+    Parameters
+    ----------
+    data_file : ~str
+        the active region csv file, e.g. 'all_ar_2010-2020.csv'.
+    since : ~str, optional
+        only keep the active regions that start at or after this time.
+    """
+
+    def __init__(self, data_file, since=None):
+        self.data_file = data_file
+        self.since = since
+
+    @cached_property
+    @profiled('all_data')
+    def all_data(self):
+        """
+        The active region table, with the extra columns used for plotting.
+        """
+        # read in the data as a pandas DataFrame
+        all_data = load_csv(self.data_file)
+        checkpoint('read_csv')
+        if self.since is not None:
+            all_data = all_data[all_data['event_starttime'] >= pd.Timestamp(self.since)]
+        # get the time as datetime objects
+        tt = pd.to_datetime(all_data['event_starttime'])
+        # get the time in seconds from initial time (for plotting)
+        all_data['times'] = (tt - tt.iloc[0]).dt.total_seconds()
+        all_data['tt'] = tt
+
+        # this is a rough conversion for area of active region at disk
+        # center in km to area in arcsec (as observed from Earth). If you
+        # want to be more precise you would calculate for each day, but
+        # its grand for this purpose.
+        all_data['area_arcsec'] = all_data['area_atdiskcenter']/(725**2)
+        return all_data
+
+    @cached_property
+    @profiled('ar_days')
+    def ar_days(self):
+        """
+        The data sorted by day (see `ar_store.ARDayStore`), so that the data for
+        any range of days is a contiguous slice.
+        """
+        return ARDayStore(self.all_data)
+
+    @cached_property
+    def time_over(self):
+        """
+        All the days from the first to the last active region as strings.
+        """
+        return self.ar_days.time_over
+
+    @property
+    def tstart(self):
+        return pd.Timestamp(self.all_data['event_starttime'].min()).to_pydatetime()
+
+    @property
+    def tfinal(self):
+        return pd.Timestamp(self.all_data['event_endtime'].max()).to_pydatetime()
+
+    @property
+    def tlims(self):
+        """
+        The time limits of the butterfly diagrams, the first and last active region start times.
+        """
+        return self.all_data['tt'].min(), self.all_data['tt'].max()
+
+    @cached_property
+    @profiled('lat_histograms')
+    def lat_histograms(self):
+        """
+        The latitude histogram of all the past active regions for each day (see
+        `frame_aggregates.LatitudeHistograms`).
+        """
+        from frame_aggregates import LatitudeHistograms
+        return LatitudeHistograms(self.ar_days)
+
+    @cached_property
+    @profiled('butterfly_raster')
+    def butterfly_raster(self):
+        """
+        The butterfly diagram of the movie frames as an image (see `frame_aggregates.ButterflyRaster`).
+        """
+        from frame_aggregates import ButterflyRaster
+        return ButterflyRaster(self.ar_days, self.tlims)
+
+    @cached_property
+    @profiled('tracks')
+    def tracks(self):
+        """
+        The data as one track per NOAA region (see `ar_tracks.ARTracks`), for
+        per region lifetimes, peaks, drifts and class changes.
+        """
+        from ar_tracks import ARTracks
+        return ARTracks(self.all_data)
+
+    @cached_property
+    @profiled('positions')
+    def positions(self):
+        """
+        The data indexed by time and heliographic position (see
+        `position_index.PositionIndex`), for box and radius queries.
+        """
+        from position_index import PositionIndex
+        return PositionIndex(self.all_data, time_column='tt')
+
+    @cached_property
+    @profiled('cycles')
+    def cycles(self):
+        """
+        The data split up by solar cycle (see `solar_cycles.CyclePartition`),
+        with the cycles found from the monthly sunspot number file.
+        """
+        from solar_cycles import CyclePartition, solar_cycles
+        return CyclePartition(self.all_data, solar_cycles(), time_column='tt')
+
+    def save_aggregates(self, filename):
+        """
+        Save the arrays of `lat_histograms` and `butterfly_raster` to a .npz
+        file, so that other processes can `load_aggregates` them rather than
+        working them out again.
+        """
+        hists, raster = self.lat_histograms, self.butterfly_raster
+        np.savez(filename, n_rows=len(self.ar_days.data), n_days=len(self.ar_days.days),
+                 hist_counts=hists.counts, hist_edges=hists.edges,
+                 raster_count=raster.count, raster_time_sum=raster.time_sum, raster_edges=raster.edges)
+
+    def load_aggregates(self, filename):
+        """
+        Use the `lat_histograms` and `butterfly_raster` saved by `save_aggregates`.
+        A ValueError is raised if they were made from different data.
+        """
+        from frame_aggregates import LatitudeHistograms, ButterflyRaster
+        with np.load(filename) as f:
+            if (f['n_rows'], f['n_days']) != (len(self.ar_days.data), len(self.ar_days.days)):
+                raise ValueError('{:s} was made from different active region data'.format(filename))
+            self.lat_histograms = LatitudeHistograms.from_arrays(f['hist_counts'], f['hist_edges'])
+            self.butterfly_raster = ButterflyRaster(self.ar_days, self.tlims, layers=(
+                f['raster_count'], f['raster_time_sum'], f['raster_edges']))
+
+    @cached_property
+    @profiled('counts')
+    def counts(self):
+        """
+        The daily number of regions, spots and sunspot number (see `ar_counts.DailyARCounts`).
+        """
+        return DailyARCounts(self.all_data)
+
+
+@lru_cache(maxsize=None)
+def get_dataset(data_file, since=None):
+    """
+    Get the (memoized) `ARDataset` for a file, so that every caller in
+    a process shares the same loaded data.
+    """
+    return ARDataset(data_file, since=since)
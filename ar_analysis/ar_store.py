@@ -0,0 +1,146 @@
+import numpy as np
+import pandas as pd
+
+# one day in nanoseconds, the day grid is built on int64 ns offsets
+# so that no strings need to be compared when slicing.
+ONE_DAY = np.timedelta64(1, 'D').astype('timedelta64[ns]').astype(np.int64)
+
+
+def make_day_grid(tstart, tfinal):
+    """
+    Build the list of days from tstart until the first day >= tfinal,
+    i.e. the same days the `time_over` while loops in the plotting
+    scripts produce.
+
+    Parameters
+    ----------
+    tstart : ~str or ~datetime.datetime
+        the first day of the grid (time of day is kept).
+    tfinal : ~str or ~datetime.datetime
+        the grid is extended until it reaches this time.
+
+    Returns
+    -------
+    numpy.ndarray
+        datetime64[ns] array of the days.
+    """
+    tstart = np.datetime64(pd.Timestamp(tstart).to_datetime64(), 'ns')
+    tfinal = np.datetime64(pd.Timestamp(tfinal).to_datetime64(), 'ns')
+    span = (tfinal - tstart).astype(np.int64)
+    n_days = 1 + max(0, -(-span // ONE_DAY))
+    return tstart + np.arange(n_days) * np.timedelta64(ONE_DAY, 'ns')
+
+
+def day_offsets(tt, tstart):
+    """
+    Get the day index of each time relative to tstart.
+
+    Only times that land exactly on tstart + k days are given a valid
+    index, which is what `isin(time_over)` on the start time strings
+    did before.
+
+    Parameters
+    ----------
+    tt : array-like
+        the event times (anything `pd.to_datetime` understands).
+    tstart : ~numpy.datetime64
+        the first day of the grid.
+
+    Returns
+    -------
+    offsets : numpy.ndarray
+        int64 day index for each time.
+    exact : numpy.ndarray
+        boolean mask, True where the time falls exactly on a grid day.
+    """
+    tt = pd.to_datetime(np.asarray(tt)).values.astype('datetime64[ns]')
+    delta = (tt - np.datetime64(tstart, 'ns')).astype(np.int64)
+    offsets, remainder = np.divmod(delta, ONE_DAY)
+    exact = (remainder == 0) & ~np.isnat(tt)
+    return offsets, exact
+
+
+class ARDayStore:
+    """
+    Active region data sorted by day with the row offsets where each day
+    starts, so that the data for any run of days is a contiguous slice.
+
+    Slicing replaces the `all_data['event_starttime'].isin(time_over[a:b])`
+    filters in the plotting scripts; a slice for days [a, b) is just
+    `data.iloc[bounds[a]:bounds[b]]`.
+
+    Parameters
+    ----------
+    data : ~pandas.DataFrame
+        the active region data, needs `event_starttime` and `event_endtime`.
+    """
+
+    def __init__(self, data):
+        tt = pd.to_datetime(data['event_starttime'])
+        tstart = tt.min()
+        tfinal = pd.to_datetime(data['event_endtime']).max()
+        self.days = make_day_grid(tstart, tfinal)
+
+        offsets, exact = day_offsets(tt, self.days[0])
+        exact &= (offsets >= 0) & (offsets < len(self.days))
+
+        # rows that are not on the day grid never matched the isin filters,
+        # so they are dropped. A stable sort keeps the original row order
+        # within each day.
+        keep = np.flatnonzero(exact)
+        order = keep[np.argsort(offsets[keep], kind='stable')]
+        self.data = data.iloc[order]
+        self.day_index = offsets[order]
+        self.bounds = np.searchsorted(self.day_index, np.arange(len(self.days) + 1))
+
+    @classmethod
+    def from_csv(cls, filename, **kwargs):
+        """
+        Read an active region csv file (e.g. all_ar_2010-2020.csv) and
+        build the store from it.
+        """
+        return cls(pd.read_csv(filename, **kwargs))
+
+    def __len__(self):
+        return len(self.days)
+
+    @property
+    def time_over(self):
+        """
+        The days as 'YYYY-mm-ddTHH:MM:SS' strings, same as the old `time_over` list.
+        """
+        return np.datetime_as_string(self.days, unit='s').tolist()
+
+    def days_between(self, start, stop):
+        """
+        Return the rows for days [start, stop) as a contiguous slice.
+
+        Parameters
+        ----------
+        start : ~int
+            the index of the first day (clipped at 0).
+        stop : ~int
+            the index one past the last day.
+        """
+        start = min(max(start, 0), len(self.days))
+        stop = min(max(stop, start), len(self.days))
+        return self.data.iloc[self.bounds[start]:self.bounds[stop]]
+
+    def day(self, i):
+        """
+        The active regions for day i, i.e. isin([time_over[i]]).
+        """
+        return self.days_between(i, i + 1)
+
+    def previous(self, i, n_days):
+        """
+        The active regions from the n_days days before day i (not including i),
+        i.e. isin(time_over[i-n_days:i]) or isin(time_over[0:i]) when i < n_days.
+        """
+        return self.days_between(i - n_days, i)
+
+    def all_past(self, i):
+        """
+        All active regions before day i, i.e. isin(time_over[0:i]).
+        """
+        return self.days_between(0, i)
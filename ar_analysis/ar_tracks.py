@@ -0,0 +1,327 @@
+import numpy as np
+import pandas as pd
+
+# The active regions as tracks: the daily records (one row per region per
+# day in all_ar_*.csv) sorted by NOAA number and time, with the row offset
+# where each region's track starts, and each column as one contiguous numpy
+# array. Per-region questions (lifetime, peak area, latitude drift, McIntosh
+# class changes ...) are then reduceat's over the offsets, one pass over the
+# arrays for all the regions at once rather than a groupby each time.
+#
+# NOAA numbers went past 9999 on 2002-06-14. Some catalogues then carry on
+# with 4 digits (0001, 0002 ...) and some use 5 (10001, 10002 ...), so
+# numbers below NOAA_WRAP_BELOW after NOAA_WRAP_DATE get 10000 added.
+
+NOAA_WRAP_DATE = '2002-06-14'
+NOAA_WRAP_BELOW = 5000
+
+# the columns kept in the tracks (if the table has them)
+TRACK_COLUMNS = ['hpc_x', 'hpc_y', 'hgs_x', 'hgs_y', 'hgc_x', 'hgc_y', 'ar_numspots',
+                 'area_atdiskcenter', 'ar_mcintoshcls', 'ar_mtwilsoncls']
+
+ONE_DAY_NS = np.timedelta64(1, 'D').astype('timedelta64[ns]').astype(np.int64)
+
+
+def unwrap_noaa(numbers, times):
+    """
+    The 5 digit NOAA numbers of records which might have 4 digit numbers
+    after the numbers wrapped around in 2002.
+
+    Parameters
+    ----------
+    numbers : array-like
+        the NOAA numbers (missing ones as NaN or 0).
+    times : array-like
+        the times of the records.
+
+    Returns
+    -------
+    numpy.ndarray
+        int64 numbers, 0 for the missing ones.
+    """
+    numbers = pd.to_numeric(pd.Series(np.asarray(numbers)), errors='coerce').fillna(0).values.astype(np.int64)
+    times = pd.to_datetime(pd.Series(np.asarray(times))).values
+    wrapped = (numbers > 0) & (numbers < NOAA_WRAP_BELOW) & (times >= np.datetime64(NOAA_WRAP_DATE))
+    return np.where(wrapped, numbers + 10000, numbers)
+
+
+class ARTracks:
+    """
+    The daily active region records grouped into one track per NOAA region,
+    stored as arrays: the rows are sorted by number and time, and the rows
+    of region k are `offsets[k]:offsets[k + 1]`. The reductions return one
+    value per region, in the order of `numbers`. Records without a NOAA
+    number are left out, repeated records are kept.
+
+    Parameters
+    ----------
+    table : ~pandas.DataFrame
+        the active region records, e.g. from all_ar_2010-2020.csv.
+    time_column : ~str
+        the time of each record.
+    columns : list of ~str
+        the columns to keep, by default the TRACK_COLUMNS the table has.
+        Text columns (the McIntosh and Mt Wilson classes) are kept as
+        integer codes into `categories[column]`.
+
+    Attributes
+    ----------
+    numbers : ~numpy.ndarray
+        the NOAA number of each region (unwrapped, see `unwrap_noaa`).
+    offsets : ~numpy.ndarray
+        the first row of each region, and the number of rows at the end.
+    times : ~numpy.ndarray
+        datetime64[ns] time of each row.
+    columns : dict
+        the arrays of the other columns.
+    """
+
+    def __init__(self, table, time_column='event_starttime', columns=None):
+        if columns is None:
+            columns = [c for c in TRACK_COLUMNS if c in table.columns]
+        times = pd.to_datetime(table[time_column]).values.astype('datetime64[ns]')
+        numbers = unwrap_noaa(table['ar_noaanum'], times)
+
+        keep = np.flatnonzero((numbers > 0) & ~np.isnat(times))
+        # sorted by number then time, stable so repeats keep their order
+        order = keep[np.lexsort((times[keep], numbers[keep]))]
+        numbers = numbers[order]
+        self.times = times[order]
+
+        starts = np.flatnonzero(np.r_[True, numbers[1:] != numbers[:-1]])[:len(numbers)]
+        self.numbers = numbers[starts]
+        self.offsets = np.r_[starts, len(numbers)]
+
+        self.columns = {}
+        self.categories = {}
+        for name in columns:
+            col = table[name]
+            if isinstance(col.dtype, pd.CategoricalDtype):
+                # e.g. from load_csv, which already has the codes
+                self.columns[name] = np.asarray(col.cat.codes, dtype=np.int64)[order]
+                self.categories[name] = col.cat.categories
+            elif col.dtype.kind in 'biuf':
+                self.columns[name] = np.asarray(col, dtype=float)[order]
+            else:
+                self.columns[name], self.categories[name] = pd.factorize(np.asarray(col, dtype=object)[order])
+
+    @classmethod
+    def from_csv(cls, filename, **kwargs):
+        """
+        Read an active region csv file (through the columnar cache, see
+        `data_cache.load_csv`) and build the tracks from it.
+        """
+        from data_cache import load_csv
+        return cls(load_csv(filename), **kwargs)
+
+    def __len__(self):
+        return len(self.numbers)
+
+    @property
+    def lengths(self):
+        """
+        The number of records of each region.
+        """
+        return np.diff(self.offsets)
+
+    @property
+    def region_of_row(self):
+        """
+        The index (into `numbers`) of the region of each row.
+        """
+        return np.repeat(np.arange(len(self)), self.lengths)
+
+    def index_of(self, number):
+        """
+        The index of a region from its NOAA number (4 or 5 digits), -1 if it isn't there.
+        """
+        number = int(number)
+        if number < NOAA_WRAP_BELOW and len(self) and self.numbers[-1] >= 10000:
+            number += 10000
+        k = np.searchsorted(self.numbers, number)
+        return int(k) if k < len(self) and self.numbers[k] == number else -1
+
+    def track(self, number):
+        """
+        The records of one region as a DataFrame indexed by time.
+        """
+        k = self.index_of(number)
+        if k < 0:
+            raise KeyError('no active region {}'.format(number))
+        rows = slice(self.offsets[k], self.offsets[k + 1])
+        return pd.DataFrame({name: self.column(name)[rows] for name in self.columns},
+                            index=pd.DatetimeIndex(self.times[rows], name='time'))
+
+    def column(self, name):
+        """
+        The values of a column for all the rows, with the text columns decoded ('' if missing).
+        """
+        return self._decode(name, self.columns[name])
+
+    def _decode(self, name, values):
+        if name in self.categories:
+            return np.where(values >= 0, np.asarray(self.categories[name], dtype=object)[values], '')
+        return values
+
+    ###################
+    # per region reductions
+
+    def _reduce(self, ufunc, values):
+        if len(self) == 0:
+            return np.array([], dtype=values.dtype)
+        return ufunc.reduceat(values, self.offsets[:-1])
+
+    def first_time(self):
+        """
+        The time of the first record of each region.
+        """
+        return self.times[self.offsets[:-1]]
+
+    def last_time(self):
+        """
+        The time of the last record of each region.
+        """
+        return self.times[self.offsets[1:] - 1]
+
+    def lifetime(self):
+        """
+        The days from the first to the last record of each region, inclusive
+        (so a region seen on one day has a lifetime of 1).
+        """
+        span = (self.last_time() - self.first_time()).astype(np.int64)
+        return span/ONE_DAY_NS + 1
+
+    def first(self, name):
+        """
+        The value of a column at the first record of each region.
+        """
+        return self._decode(name, self.columns[name][self.offsets[:-1]])
+
+    def last(self, name):
+        """
+        The value of a column at the last record of each region.
+        """
+        return self._decode(name, self.columns[name][self.offsets[1:] - 1])
+
+    def peak(self, name):
+        """
+        The largest value of a column for each region, ignoring NaNs.
+        """
+        return self._reduce(np.fmax, self.columns[name])
+
+    def peak_time(self, name):
+        """
+        The time of the first record at the peak of a column for each region
+        (NaT if it's all NaN).
+        """
+        values = self.columns[name]
+        at_peak = values == np.repeat(self.peak(name), self.lengths)
+        rows = self._reduce(np.minimum, np.where(at_peak, np.arange(len(values)), len(values)))
+        times = np.full(len(self), np.datetime64('NaT'), dtype='datetime64[ns]')
+        found = rows < len(values)
+        times[found] = self.times[rows[found]]
+        return times
+
+    def total(self, name):
+        """
+        The sum of a column over the records of each region, ignoring NaNs.
+        """
+        values = self.columns[name]
+        return self._reduce(np.add, np.where(np.isnan(values), 0., values))
+
+    def mean(self, name):
+        """
+        The mean of a column over the records of each region, ignoring NaNs.
+        """
+        good = self._reduce(np.add, (~np.isnan(self.columns[name])).astype(np.int64))
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return self.total(name)/good
+
+    def drift(self, name='hgs_y'):
+        """
+        The least squares rate of change of a column (by default the latitude)
+        in units per day for each region, NaN for regions with fewer than two
+        days of data.
+        """
+        y = self.columns[name]
+        # days since the start of the track, so the sums don't lose precision
+        t = (self.times - np.repeat(self.first_time(), self.lengths)).astype(np.int64)/ONE_DAY_NS
+        good = ~np.isnan(y)
+        t, y = np.where(good, t, 0.), np.where(good, y, 0.)
+        n = self._reduce(np.add, good.astype(float))
+        st, sy = self._reduce(np.add, t), self._reduce(np.add, y)
+        stt, sty = self._reduce(np.add, t*t), self._reduce(np.add, t*y)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            denominator = n*stt - st**2
+            return np.where(denominator > 0, (n*sty - st*sy)/denominator, np.nan)
+
+    def transitions(self, name='ar_mcintoshcls', zurich=False):
+        """
+        Every change of class from one record of a region to the next.
+
+        Parameters
+        ----------
+        name : ~str
+            a text column, e.g. 'ar_mcintoshcls' or 'ar_mtwilsoncls'.
+        zurich : ~bool
+            only compare the first letter (the modified Zurich class of the McIntosh class).
+
+        Returns
+        -------
+        pandas.DataFrame
+            ar_noaanum, time (of the record with the new class), from and to.
+            Records with a missing class are skipped over.
+        """
+        classes, known, codes, change = self._changes(name, zurich)
+        region = self.region_of_row[known[change]]
+        return pd.DataFrame({'ar_noaanum': self.numbers[region],
+                             'time': self.times[known[change]],
+                             'from': classes[codes[change - 1]],
+                             'to': classes[codes[change]]})
+
+    def transition_counts(self, name='ar_mcintoshcls', zurich=False):
+        """
+        The number of changes from each class (rows) to each other class (columns).
+        """
+        classes, known, codes, change = self._changes(name, zurich)
+        n = len(classes)
+        counts = np.bincount(codes[change - 1]*n + codes[change], minlength=n*n).reshape(n, n)
+        return pd.DataFrame(counts, index=pd.Index(classes, name='from'),
+                            columns=pd.Index(classes, name='to'))
+
+    def _changes(self, name, zurich):
+        # the classes, the rows with a class, their class codes, and where (in
+        # those rows) the class differs from the row before in the same region
+        labels = np.asarray(self.categories[name], dtype=object)
+        if zurich:
+            labels = np.array([str(c)[:1] for c in labels], dtype=object)
+        classes, codes = np.unique(labels, return_inverse=True)
+        values = self.columns[name]
+        known = np.flatnonzero(values >= 0)
+        codes = codes.astype(np.int64)[values[known]]
+        region = self.region_of_row[known]
+        change = np.flatnonzero((region[1:] == region[:-1]) & (codes[1:] != codes[:-1])) + 1
+        return classes, known, codes, change
+
+    def summary(self):
+        """
+        The usual per region numbers as a table indexed by NOAA number: first
+        and last time, number of records, lifetime (days), the peak area and
+        number of spots and when they were reached, the mean latitude and its
+        drift (degrees per day), and the first and last McIntosh class.
+        """
+        table = pd.DataFrame({'first_time': self.first_time(), 'last_time': self.last_time(),
+                              'n_records': self.lengths, 'lifetime': self.lifetime()},
+                             index=pd.Index(self.numbers, name='ar_noaanum'))
+        if 'area_atdiskcenter' in self.columns:
+            table['peak_area'] = self.peak('area_atdiskcenter')
+            table['peak_area_time'] = self.peak_time('area_atdiskcenter')
+        if 'ar_numspots' in self.columns:
+            table['peak_spots'] = self.peak('ar_numspots')
+        if 'hgs_y' in self.columns:
+            table['mean_latitude'] = self.mean('hgs_y')
+            table['latitude_drift'] = self.drift('hgs_y')
+        if 'ar_mcintoshcls' in self.columns:
+            table['first_mcintosh'] = self.first('ar_mcintoshcls')
+            table['last_mcintosh'] = self.last('ar_mcintoshcls')
+        return table
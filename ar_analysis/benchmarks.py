@@ -0,0 +1,585 @@
+import os
+import sys
+import json
+import time
+import timeit
+import platform
+import argparse
+import subprocess
+import numpy as np
+import pandas as pd
+
+# Benchmarks of the slow parts of the analysis (frame slicing, csv loading,
+# the daily sunspot numbers, reading the SILSO files and the flare
+# histograms), run on synthetic tables shaped like all_ar_2010-2020.csv and
+# since_1986_c1_solarcycle_flares.csv at 1x, 10x and 100x the size. The
+# results are saved as json so runs on different commits can be compared:
+#
+#   python benchmarks.py --scales 1 10 --output before.json
+#   ... change things ...
+#   python benchmarks.py --scales 1 10 --output after.json
+#   python benchmarks.py --compare before.json after.json
+#
+# The synthetic tables are kept in BENCH_DATA_DIR so they're only made once.
+
+BENCH_DATA_DIR = './.cache/bench/'
+
+# size of the real tables, which the synthetic ones are scaled from
+AR_DAYS = 3885
+AR_PER_DAY = 11901/3885.
+FLARE_ROWS = 39000
+
+AR_COLUMNS = ['ar_noaanum', 'event_starttime', 'event_endtime', 'hpc_x', 'hpc_y', 'hgs_x',
+              'hgs_y', 'hgc_x', 'hgc_y', 'frm_humanflag', 'frm_name', 'frm_daterun',
+              'ar_mtwilsoncls', 'ar_mcintoshcls', 'SOL_standard', 'ar_numspots',
+              'area_atdiskcenter', 'area_unit']
+
+FLARE_COLUMNS = ['event_starttime', 'event_peaktime', 'event_endtime', 'fl_goescls',
+                 'ar_noaanum', 'goes_class', 'flare_times']
+
+
+def _iso(t, sep='T'):
+    # datetime64 array to strings like the HEK ones, much faster than strftime
+    s = np.datetime_as_string(t.astype('datetime64[s]'), unit='s')
+    return s if sep == 'T' else np.char.replace(s, 'T', sep)
+
+
+def synthetic_ar_table(scale=1, seed=0, tstart='2010-01-01'):
+    """
+    Make a table of daily active region records like all_ar_2010-2020.csv. It
+    covers the same days as the real file, with `scale` times as many
+    regions each day.
+
+    Parameters
+    ----------
+    scale : ~int
+        how many times bigger than the real table.
+    seed : ~int
+        seed of the random numbers, so the same table is made every time.
+
+    Returns
+    -------
+    pandas.DataFrame
+    """
+    rng = np.random.default_rng(seed)
+    per_day = rng.poisson(AR_PER_DAY*scale, AR_DAYS)
+    n = per_day.sum()
+
+    days = np.datetime64(tstart, 'D') + np.repeat(np.arange(AR_DAYS), per_day)
+    lon = rng.uniform(-80, 80, n)
+    lat = rng.normal(0, 15, n).clip(-45, 45)
+    spots = rng.geometric(0.15, n)
+    mcintosh = np.array(['AXX', 'HSX', 'CSO', 'DAI', 'EKC', 'FKC'])
+    mtwilson = np.array(['ALPHA', 'BETA', 'BETA-GAMMA', 'BETA-GAMMA-DELTA'])
+
+    data = pd.DataFrame({'ar_noaanum': 11039 + np.arange(n)//(3*scale + 1),
+                         'event_starttime': _iso(days),
+                         'event_endtime': _iso(days + np.timedelta64(86399, 's')),
+                         # near enough to the projection for timing purposes
+                         'hpc_x': 960*np.sin(np.radians(lon))*np.cos(np.radians(lat)),
+                         'hpc_y': 960*np.sin(np.radians(lat)),
+                         'hgs_x': np.rint(lon).astype(int),
+                         'hgs_y': np.rint(lat).astype(int),
+                         'hgc_x': rng.uniform(0, 360, n),
+                         'hgc_y': np.rint(lat).astype(int),
+                         'frm_humanflag': 'true',
+                         'frm_name': 'NOAA SWPC Observer',
+                         'frm_daterun': '2012-04-12T23:32:04',
+                         'ar_mtwilsoncls': mtwilson[rng.integers(0, len(mtwilson), n)],
+                         'ar_mcintoshcls': mcintosh[rng.integers(0, len(mcintosh), n)],
+                         'ar_numspots': spots,
+                         'area_atdiskcenter': spots*rng.uniform(2e7, 8e7, n),
+                         'area_unit': 'km2'})
+    data['SOL_standard'] = 'SOL' + data['event_starttime'] + 'L' + data['hgs_x'].astype(str)
+    return data[AR_COLUMNS]
+
+
+def synthetic_flare_table(scale=1, seed=0, tstart='1986-09-01', tend='2020-08-01'):
+    """
+    Make a table of >=C1 flares like since_1986_c1_solarcycle_flares.csv,
+    with `scale` times as many flares over the same years. The peak fluxes
+    follow a power law with index 2.
+
+    Returns
+    -------
+    pandas.DataFrame
+    """
+    rng = np.random.default_rng(seed)
+    n = int(FLARE_ROWS*scale)
+    t0, t1 = np.datetime64(tstart, 's'), np.datetime64(tend, 's')
+    start = t0 + np.sort(rng.integers(0, (t1 - t0).astype(int), n)).astype('timedelta64[s]')
+    rise = rng.integers(1, 30, n).astype('timedelta64[m]')
+    decay = rng.integers(2, 90, n).astype('timedelta64[m]')
+    peak = start + rise
+
+    # rounded to 2 significant figures like the GOES classes, going through
+    # strings so the csv has e.g. 2.6e-06 rather than 2.5999999999999997e-06
+    flux = np.minimum(1e-6/(1 - rng.uniform(0, 1, n)), 2e-3)
+    exponent = np.floor(np.log10(flux)).astype(int)
+    mantissa = np.char.mod('%.1f', flux/10.**exponent)
+    flux = np.char.add(np.char.add(mantissa, 'e'), np.char.mod('%d', exponent)).astype(float)
+    exponent = np.floor(np.log10(flux)).astype(int)
+    letter = np.array(['C', 'M', 'X'])[np.clip(exponent + 6, 0, 2)]
+    goescls = np.char.add(letter, np.char.mod('%.1f', flux/10.**exponent.clip(-6, -4)))
+
+    return pd.DataFrame({'event_starttime': _iso(start),
+                         'event_peaktime': _iso(peak),
+                         'event_endtime': _iso(peak + decay),
+                         'fl_goescls': goescls,
+                         'ar_noaanum': rng.integers(4700, 12800, n),
+                         'goes_class': flux,
+                         'flare_times': _iso(peak, sep=' ')})[FLARE_COLUMNS]
+
+
+def synthetic_silso_monthly(seed=0, tstart='1749-01', tend='2020-08'):
+    """
+    Make a monthly sunspot number table like SN_m_tot_V2.0.csv (';' delimited,
+    no header), as a DataFrame with silso.MONTHLY_COLUMNS.
+    """
+    from silso import MONTHLY_COLUMNS
+    rng = np.random.default_rng(seed)
+    months = np.arange(np.datetime64(tstart, 'M'), np.datetime64(tend, 'M') + 1)
+    year = months.astype(int)//12 + 1970
+    month = months.astype(int) % 12 + 1
+    decimal_date = year + (month - 0.5)/12
+    ssn = np.round(np.clip(100*(1 - np.cos(2*np.pi*decimal_date/11.))
+                           + rng.normal(0, 20, len(months)), 0, None), 1)
+    return pd.DataFrame(dict(zip(MONTHLY_COLUMNS, [year, month, np.round(decimal_date, 3), ssn,
+                                                   np.round(rng.uniform(1, 20, len(months)), 1),
+                                                   rng.integers(0, 1500, len(months)),
+                                                   np.ones(len(months), dtype=int)])))
+
+
+def bench_files(scale, data_dir=BENCH_DATA_DIR):
+    """
+    The paths of the synthetic AR, flare and SILSO files for a scale, making
+    any that aren't there yet.
+
+    Returns
+    -------
+    dict
+        'ar', 'flares' and 'ssn' file names.
+    """
+    os.makedirs(data_dir, exist_ok=True)
+    files = {'ar': os.path.join(data_dir, 'ar_x{:d}.csv'.format(scale)),
+             'flares': os.path.join(data_dir, 'flares_x{:d}.csv'.format(scale)),
+             'ssn': os.path.join(data_dir, 'SN_m_synthetic.csv')}
+    if not os.path.exists(files['ar']):
+        synthetic_ar_table(scale).to_csv(files['ar'] + '.part', index=False)
+        os.replace(files['ar'] + '.part', files['ar'])
+    if not os.path.exists(files['flares']):
+        synthetic_flare_table(scale).to_csv(files['flares'] + '.part', index=False)
+        os.replace(files['flares'] + '.part', files['flares'])
+    if not os.path.exists(files['ssn']):
+        synthetic_silso_monthly().to_csv(files['ssn'] + '.part', sep=';', header=False, index=False)
+        os.replace(files['ssn'] + '.part', files['ssn'])
+    return files
+
+
+#########################################
+# the benchmarks. Each one is a function that is given the dict of files
+# from `bench_files`, does any setup and returns the function to be timed.
+
+BENCHMARKS = {}
+
+
+def benchmark(name, scales=None, number=1):
+    """
+    Register a benchmark. `scales` limits which scales it is run at (e.g. the
+    old python loops are too slow at 100x), `number` is the number of calls per timing.
+    """
+    def register(setup):
+        BENCHMARKS[name] = dict(setup=setup, scales=scales, number=number)
+        return setup
+    return register
+
+
+def _frame_index(time_over):
+    # a frame in the middle of the movie, so the past-data filters have half the table
+    return len(time_over)//2
+
+
+@benchmark('load_ar_csv')
+def bench_load_ar_csv(files):
+    return lambda: pd.read_csv(files['ar'])
+
+
+@benchmark('load_ar_csv_cached')
+def bench_load_ar_csv_cached(files):
+    from data_cache import load_csv
+    load_csv(files['ar'])  # builds the cache the first time
+    return lambda: load_csv(files['ar'])
+
+
+@benchmark('frame_filters_isin', scales=(1, 10), number=5)
+def bench_frame_filters_isin(files):
+    # the per frame filters that plot_as_datapoints used before ar_store.ARDayStore.
+    # load_csv gives event_starttime as datetime64, so the days are too (isin
+    # with the time_over strings wouldn't match anything).
+    from ar_dataset import get_dataset
+    ds = get_dataset(files['ar'])
+    all_data, time_over = ds.all_data, ds.ar_days.days
+    i = _frame_index(time_over)
+
+    def run():
+        all_data[all_data['event_starttime'].isin([time_over[i]])]
+        all_data[all_data['event_starttime'].isin(time_over[i-10:i])]
+        all_data[all_data['event_starttime'].isin(time_over[i-100:i])]
+        all_data[all_data['event_starttime'].isin(time_over[0:i])]
+    return run
+
+
+@benchmark('frame_filters_store', number=100)
+def bench_frame_filters_store(files):
+    from ar_dataset import get_dataset
+    ar_days = get_dataset(files['ar']).ar_days
+    i = _frame_index(ar_days.time_over)
+
+    def run():
+        ar_days.day(i)
+        ar_days.previous(i, 10)
+        ar_days.previous(i, 100)
+        ar_days.all_past(i)
+    return run
+
+
+@benchmark('plot_as_datapoints_frame')
+def bench_plot_as_datapoints(files):
+    import tempfile
+    import plotting_ar
+    plotting_ar.data_file = files['ar']
+    ds = plotting_ar.dataset()
+    i = _frame_index(ds.ar_days.time_over)
+    savedir = tempfile.mkdtemp()
+    plotting_ar.plot_as_datapoints(i, savedir=savedir)  # first one imports matplotlib
+    return lambda: plotting_ar.plot_as_datapoints(i, savedir=savedir)
+
+
+@benchmark('read_ssn', scales=(1,), number=5)
+def bench_read_ssn(files):
+    # the SILSO files don't grow with the catalogues, so this is only run at 1x
+    from silso import read_silso
+    return lambda: read_silso(files['ssn'])
+
+
+@benchmark('daily_ssn_loop', scales=(1, 10))
+def bench_daily_ssn_loop(files):
+    # the loop over days that plots_for_visual.py used before ar_counts.DailyARCounts
+    from ar_dataset import get_dataset
+    ds = get_dataset(files['ar'])
+    all_data, time_over = ds.all_data, ds.ar_days.days
+
+    def run():
+        spots = []
+        no_ar = []
+        for i in range(len(time_over)):
+            data_for_day = all_data[all_data['event_starttime'].isin([time_over[i]])]
+            spots.append(data_for_day['ar_numspots'].sum())
+            no_ar.append(len(data_for_day))
+        index = pd.DatetimeIndex(time_over)
+        return 10*pd.Series(no_ar, index=index) + pd.Series(spots, index=index)
+    return run
+
+
+@benchmark('daily_ssn_counts', number=5)
+def bench_daily_ssn_counts(files):
+    from ar_counts import DailyARCounts
+    from ar_dataset import get_dataset
+    all_data = get_dataset(files['ar']).all_data
+    return lambda: DailyARCounts(all_data).wolf
+
+
+@benchmark('flare_logbins_histograms', number=5)
+def bench_flare_histograms(files):
+    # the solar cycle flare histograms of solar_flare_and_snn.ipynb
+    from flare_distribution import get_logbins
+    flares = pd.read_csv(files['flares']).set_index('event_peaktime').sort_index()
+
+    def run():
+        flares_sc22 = flares.truncate('1989-09-01', '1996-08-01')
+        flares_sc23 = flares.truncate('1996-08-01', '2008-12-01')
+        flares_sc24 = flares.truncate('2008-12-01', '2019-12-02')
+        all_logbins = get_logbins(flares_sc23, bins=40)
+        return [np.histogram(f['goes_class'], bins=all_logbins)
+                for f in (flares_sc22, flares_sc23, flares_sc24)]
+    return run
+
+
+@benchmark('flare_cycle_distributions', number=5)
+def bench_flare_cycle_distributions(files):
+    from flare_distribution import cycle_distributions
+    flares = pd.read_csv(files['flares'])
+    return lambda: cycle_distributions(flares)
+
+
+@benchmark('flare_sliding_power_law', number=5)
+def bench_flare_sliding_power_law(files):
+    from flare_distribution import sliding_power_law
+    flares = pd.read_csv(files['flares'])
+    return lambda: sliding_power_law(flares)
+
+
+@benchmark('flare_ar_crossmatch')
+def bench_flare_ar_crossmatch(files):
+    from flare_match import match_flares
+    from ar_dataset import get_dataset
+    ar_data = get_dataset(files['ar']).all_data
+    flares = pd.read_csv(files['flares'])
+    # a third of the flares without a number but with a position, like the real list
+    rng = np.random.default_rng(0)
+    flares.loc[::3, 'ar_noaanum'] = 0
+    flares['hpc_x'] = rng.uniform(-900, 900, len(flares))
+    flares['hpc_y'] = rng.uniform(-900, 900, len(flares))
+    return lambda: match_flares(flares, ar_data)
+
+
+@benchmark('ar_track_groupby', number=5)
+def bench_ar_track_groupby(files):
+    # the per region numbers from a groupby of the whole table, as before ar_tracks.ARTracks
+    from ar_dataset import get_dataset
+    all_data = get_dataset(files['ar']).all_data
+
+    def run():
+        grouped = all_data.sort_values('tt').groupby('ar_noaanum')
+        return pd.DataFrame({'first_time': grouped['tt'].min(), 'last_time': grouped['tt'].max(),
+                             'n_records': grouped.size(),
+                             'peak_area': grouped['area_atdiskcenter'].max(),
+                             'peak_spots': grouped['ar_numspots'].max(),
+                             'mean_latitude': grouped['hgs_y'].mean(),
+                             'first_mcintosh': grouped['ar_mcintoshcls'].first(),
+                             'last_mcintosh': grouped['ar_mcintoshcls'].last()})
+    return run
+
+
+@benchmark('ar_track_summary', number=20)
+def bench_ar_track_summary(files):
+    from ar_dataset import get_dataset
+    tracks = get_dataset(files['ar']).tracks
+    return tracks.summary
+
+
+@benchmark('ar_track_transitions', number=20)
+def bench_ar_track_transitions(files):
+    from ar_dataset import get_dataset
+    tracks = get_dataset(files['ar']).tracks
+    return lambda: tracks.transition_counts(zurich=True)
+
+
+def _position_boxes(n=100, seed=0):
+    # boxes like the usual questions: a few months, a 10 degree latitude band and 40 degrees of longitude
+    rng = np.random.default_rng(seed)
+    tstart = np.datetime64('2010-01-01', 'ns') + rng.integers(0, AR_DAYS - 90, n)*np.timedelta64(1, 'D')
+    lat_min, lon_min = rng.uniform(-40, 30, n), rng.uniform(-80, 40, n)
+    return tstart, tstart + np.timedelta64(90, 'D'), lat_min, lat_min + 10, lon_min, lon_min + 40
+
+
+@benchmark('position_boxes_mask')
+def bench_position_boxes_mask(files):
+    # a boolean mask over the whole table for each box
+    from ar_dataset import get_dataset
+    all_data = get_dataset(files['ar']).all_data
+    tt, lat, lon = all_data['tt'].values, all_data['hgs_y'].values, all_data['hgs_x'].values
+    boxes = _position_boxes()
+
+    def run():
+        return [np.flatnonzero((tt >= t0) & (tt <= t1) & (lat >= y0) & (lat <= y1) & (lon >= x0) & (lon <= x1))
+                for t0, t1, y0, y1, x0, x1 in zip(*boxes)]
+    return run
+
+
+@benchmark('position_boxes_index', number=5)
+def bench_position_boxes_index(files):
+    from ar_dataset import get_dataset
+    positions = get_dataset(files['ar']).positions
+    boxes = _position_boxes()
+    return lambda: positions.query_boxes(*boxes)
+
+
+@benchmark('position_index_build')
+def bench_position_index_build(files):
+    from position_index import PositionIndex
+    from ar_dataset import get_dataset
+    all_data = get_dataset(files['ar']).all_data
+    return lambda: PositionIndex(all_data, time_column='tt')
+
+
+@benchmark('hgs_to_pixel_sunpy', scales=(1,))
+def bench_hgs_to_pixel_sunpy(files):
+    # the Stonyhurst positions of all the records into the pixels of one map through astropy
+    from astropy import units as u
+    from astropy.coordinates import SkyCoord
+    from sunpy.coordinates import frames
+    from map_grid import blank_map
+    from ar_dataset import get_dataset
+    all_data = get_dataset(files['ar']).all_data
+    lon, lat = all_data['hgs_x'].values, all_data['hgs_y'].values
+    mapy = blank_map('2014-01-01', scale=2, shape=(1500, 1500))
+
+    def run():
+        coords = SkyCoord(lon*u.deg, lat*u.deg, frame=frames.HeliographicStonyhurst(obstime=mapy.date))
+        return mapy.wcs.world_to_pixel(coords.transform_to(mapy.coordinate_frame))
+    return run
+
+
+@benchmark('hgs_to_pixel_numpy', number=10)
+def bench_hgs_to_pixel_numpy(files):
+    from projection import hgs_to_pixel
+    from map_grid import map_header
+    from ar_dataset import get_dataset
+    all_data = get_dataset(files['ar']).all_data
+    lon, lat = all_data['hgs_x'].values, all_data['hgs_y'].values
+    header = map_header('2014-01-01', scale=2, shape=(1500, 1500))
+    return lambda: hgs_to_pixel(lon, lat, header)
+
+
+@benchmark('flare_ssn_lag_surrogates', scales=(1, 10))
+def bench_flare_ssn_lag_surrogates(files):
+    # the daily M flare rate against the sunspot number (the monthly file
+    # held over each month) at all lags with 1000 surrogates on one process
+    from silso import read_silso
+    from lag_correlation import flare_rates, lag_correlation
+    flares = pd.read_csv(files['flares'])
+    ssn = read_silso(files['ssn'])['ssn'].resample('D').ffill()
+    rate = flare_rates(flares, freq='D')['M']
+    return lambda: lag_correlation(rate, ssn, n_surrogates=1000, processes=1, cache_dir=None)
+
+
+@benchmark('xrs_daily_indices', scales=(1,))
+def bench_xrs_daily_indices(files):
+    # 30 days of 1-s XRS-B flux (not from the tables, so only at 1x), added
+    # in CHUNK_ROWS chunks like the files are read
+    from xrs_indices import FluxAggregator
+    from goes_xrs import CHUNK_ROWS
+    rng = np.random.default_rng(0)
+    n = 30*86400
+    times = np.datetime64('2017-01-01', 'ns') + np.arange(n)*np.timedelta64(1, 's')
+    flux = 10**rng.normal(-6.5, 0.5, n)
+
+    def run():
+        aggregator = FluxAggregator(cadence='1s')
+        for start in range(0, n, CHUNK_ROWS):
+            aggregator.add(times[start:start + CHUNK_ROWS], flux[start:start + CHUNK_ROWS])
+        return aggregator.finish()
+    return run
+
+
+@benchmark('flare_bayesian_blocks', scales=(1, 10))
+def bench_flare_bayesian_blocks(files):
+    from rate_estimation import class_blocks
+    flares = pd.read_csv(files['flares'])
+    return lambda: class_blocks(flares)
+
+
+@benchmark('flare_kernel_rates', scales=(1, 10), number=10)
+def bench_flare_kernel_rates(files):
+    from rate_estimation import kernel_rates
+    flares = pd.read_csv(files['flares'])
+    return lambda: kernel_rates(flares, bandwidth='27D', bin='1h')
+
+
+@benchmark('flare_waiting_times', scales=(1, 10), number=10)
+def bench_flare_waiting_times(files):
+    from rate_estimation import waiting_times, waiting_time_distributions
+    from solar_cycles import solar_cycles
+    flares = pd.read_csv(files['flares'])
+    cycles = solar_cycles(files['ssn'])
+    return lambda: waiting_time_distributions(waiting_times(flares, cycles))
+
+
+#########################################
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(scales=(1, 10, 100), names=None, repeat=5, data_dir=BENCH_DATA_DIR):
+    """
+    Run the benchmarks at each scale.
+
+    Parameters
+    ----------
+    scales : iterable of ~int
+        sizes of the synthetic tables relative to the real ones.
+    names : list of ~str, optional
+        only run these benchmarks, default is all of them.
+    repeat : ~int
+        number of timings of each benchmark, the min and median are kept too.
+
+    Returns
+    -------
+    dict
+        the run info (commit, versions) and a list of results, one per benchmark and scale.
+    """
+    import matplotlib
+    matplotlib.use('Agg')
+
+    results = []
+    for scale in scales:
+        files = bench_files(scale, data_dir=data_dir)
+        for name, bench in BENCHMARKS.items():
+            if names is not None and name not in names:
+                continue
+            if bench['scales'] is not None and scale not in bench['scales']:
+                continue
+            func = bench['setup'](files)
+            times = timeit.Timer(func).repeat(repeat=repeat, number=bench['number'])
+            times = [t/bench['number'] for t in times]
+            results.append(dict(name=name, scale=scale, repeat=repeat, number=bench['number'],
+                                times=times, min=min(times), median=float(np.median(times))))
+            print('{:<28s} x{:<4d} min {:10.4f} s  median {:10.4f} s'.format(
+                  name, scale, results[-1]['min'], results[-1]['median']))
+
+    return dict(commit=_git_commit(), date=time.strftime('%Y-%m-%dT%H:%M:%S'),
+                python=platform.python_version(), numpy=np.__version__,
+                pandas=pd.__version__, machine=platform.platform(), results=results)
+
+
+def compare(old_file, new_file):
+    """
+    Print the median times of two saved runs and the ratio new/old
+    (less than 1 is faster).
+    """
+    with open(old_file) as f:
+        old = json.load(f)
+    with open(new_file) as f:
+        new = json.load(f)
+    old_times = {(r['name'], r['scale']): r['median'] for r in old['results']}
+
+    print('{:<28s} {:>5s} {:>12s} {:>12s} {:>7s}'.format('', 'scale', old['commit'] or 'old',
+                                                         new['commit'] or 'new', 'ratio'))
+    for r in new['results']:
+        key = (r['name'], r['scale'])
+        if key in old_times:
+            print('{:<28s} {:>5d} {:12.4f} {:12.4f} {:7.2f}'.format(
+                  r['name'], r['scale'], old_times[key], r['median'], r['median']/old_times[key]))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Time the analysis on synthetic data.')
+    parser.add_argument('--scales', type=int, nargs='+', default=[1, 10, 100])
+    parser.add_argument('--only', nargs='+', help='names of the benchmarks to run')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--output', default=None, help='json file for the results')
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'),
+                        help='compare two saved runs instead of running')
+    parser.add_argument('--list', action='store_true', help='list the benchmarks')
+    args = parser.parse_args()
+
+    if args.list:
+        print('\n'.join(BENCHMARKS))
+        sys.exit()
+    if args.compare:
+        compare(*args.compare)
+        sys.exit()
+
+    run = run_benchmarks(scales=args.scales, names=args.only, repeat=args.repeat)
+    output = args.output or 'bench_{:s}_{:s}.json'.format(run['commit'] or 'nocommit',
+                                                          time.strftime('%Y%m%d-%H%M%S'))
+    with open(output, 'w') as f:
+        json.dump(run, f, indent=1)
+    print('saved', output)
@@ -0,0 +1,399 @@
+import os
+import sys
+import json
+import hashlib
+import argparse
+import numpy as np
+import pandas as pd
+from data_cache import TIME_COLUMNS
+
+# The merged event catalogues (e.g. concat_1996-2020.csv of all the AR
+# records, since_1986_c1_solarcycle_flares.csv of the GOES flares) kept up to
+# date by appending, rather than fetched and concatenated from the start each
+# time:
+#
+#   python catalogue.py add concat_1996-2020.csv all_ar_1996-2010.csv all_ar_2010-2020.csv
+#   python catalogue.py update concat_1996-2020.csv --until 2021-01-01
+#   python catalogue.py update since_1986_c1_solarcycle_flares.csv --kind flare
+#   python catalogue.py info concat_1996-2020.csv
+#
+# The csv is kept sorted by time. Next to it (in .cache/, see data_cache)
+# is a small json state with the high water mark (the latest time in the
+# catalogue), the keys of the events at that time and the size of the file.
+# An update mostly looks at the new events: the ones before the mark are
+# checked against the keys in the file (and merged in if they're not), the
+# ones at the mark against the stored keys and the rest are sorted and
+# appended to the end of the file. The size before an append is saved
+# first, so an interrupted append is cut off by the next add. Any other
+# change to the file (e.g. rows added by hand) is an error until the state
+# is rebuilt.
+
+CATALOGUES = {
+    # records are the same if they have the same SOL_standard (it has the
+    # time and position), or time and number for files without it
+    'ar': dict(time_column='event_starttime', keys=[['SOL_standard'], ['event_starttime', 'ar_noaanum']],
+               since='1986-09-01'),
+    'flare': dict(time_column='event_starttime', keys=[['event_starttime', 'event_peaktime', 'fl_goescls']],
+                  since='1986-09-01'),
+}
+
+# the csv files are read as text so that the rows are written back as they were
+CSV_TEXT = dict(dtype=str, keep_default_na=False)
+
+# bytes at the end of the file that are hashed to check it's the file the state was made for
+TAIL_BYTES = 4096
+
+
+def state_file_for(filename):
+    """
+    The state file of a catalogue, e.g. ./.cache/concat_1996-2020.csv.catalogue.json
+    """
+    dirname, basename = os.path.split(os.path.abspath(filename))
+    return os.path.join(dirname, '.cache', basename + '.catalogue.json')
+
+
+def _iso(values, sep='T'):
+    # times as strings like the HEK ones
+    times = pd.to_datetime(pd.Series(values)).values.astype('datetime64[s]')
+    strings = np.datetime_as_string(times, unit='s').astype(object)
+    strings[np.isnat(times)] = ''
+    return strings if sep == 'T' else np.array([s.replace('T', sep) for s in strings], dtype=object)
+
+
+def _tail_hash(filename, size):
+    with open(filename, 'rb') as f:
+        f.seek(max(0, size - TAIL_BYTES))
+        return hashlib.sha1(f.read(size - max(0, size - TAIL_BYTES))).hexdigest()
+
+
+def event_key_columns(kind, columns):
+    """
+    The columns that identify an event of a kind ('ar' or 'flare'), the
+    first of the kind's keys (see CATALOGUES) that the columns have.
+    """
+    for keys in CATALOGUES[kind]['keys']:
+        if all(k in columns for k in keys):
+            return keys
+    raise ValueError('the {:s} catalogue needs one of the sets of columns {}'.format(kind, CATALOGUES[kind]['keys']))
+
+
+def event_keys(table, key_columns):
+    """
+    One string per event made from its `key_columns`, with the times and
+    numbers written the same way whatever their dtype. Events with the same
+    key are the same event, both here and in the merge of pipeline.py.
+    """
+    parts = []
+    for name in key_columns:
+        values = table[name]
+        if name in TIME_COLUMNS:
+            parts.append(_iso(values))
+            continue
+        # numbers read as text or as floats ('11745', '11745.0', 11745) are the same
+        numbers = pd.to_numeric(values, errors='coerce').values
+        strings = values.astype(str).values.astype(object)
+        is_number = ~np.isnan(numbers)
+        strings[is_number] = ['{:.17g}'.format(v) for v in numbers[is_number]]
+        parts.append(strings)
+    keys = parts[0]
+    for p in parts[1:]:
+        keys = keys + '|' + p
+    return keys
+
+
+class Catalogue:
+    """
+    A csv file of events sorted by time that new events are appended to,
+    without duplicates.
+
+    Parameters
+    ----------
+    filename : ~str
+        the csv file, made on the first `add` if it's not there.
+    kind : ~str
+        'ar' or 'flare', which says which column is the time and which
+        columns identify an event (see CATALOGUES).
+    rebuild : ~bool
+        make the state again from the file (see `rebuild`) rather than
+        loading it, e.g. after rows were added to the file by hand.
+
+    Attributes
+    ----------
+    state : dict
+        high_water (the latest event time, '' if empty), high_water_keys
+        (the keys of the events at that time), n_rows, size, tail (a hash
+        of the end of the file) and pending (the size before an append that
+        hasn't finished, None otherwise).
+    """
+
+    def __init__(self, filename, kind='ar', rebuild=False):
+        self.filename = filename
+        self.kind = kind
+        self.time_column = CATALOGUES[kind]['time_column']
+        self.state_file = state_file_for(filename)
+        self.state = self.rebuild() if rebuild else self._load_state()
+
+    def __len__(self):
+        return self.state['n_rows']
+
+    @property
+    def high_water(self):
+        """
+        The time of the latest event, None if the catalogue is empty.
+        """
+        return pd.Timestamp(self.state['high_water']) if self.state['high_water'] else None
+
+    @property
+    def columns(self):
+        """
+        The columns of the csv (None before anything is added).
+        """
+        if not os.path.exists(self.filename) or os.path.getsize(self.filename) == 0:
+            return None
+        return list(pd.read_csv(self.filename, nrows=0).columns)
+
+    def key_columns(self, columns):
+        """
+        The columns that identify an event, the first of the kind's keys that the columns have.
+        """
+        return event_key_columns(self.kind, columns)
+
+    ###################
+    # the state
+
+    def _empty_state(self):
+        return dict(high_water='', high_water_keys=[], n_rows=0, size=0, tail='', pending=None)
+
+    def _load_state(self):
+        # the file is never changed here, an interrupted append is only cut
+        # off by the next add (see _roll_back)
+        if not os.path.exists(self.filename):
+            return self._empty_state()
+        size = os.path.getsize(self.filename)
+        if not os.path.exists(self.state_file):
+            return self._scan(fix=False)
+        with open(self.state_file) as f:
+            state = json.load(f)
+        if state.get('version') != 2:
+            return self._scan(fix=False)
+        if size == state['size'] and _tail_hash(self.filename, size) == state['tail']:
+            return state
+        # an append that was started (pending has the size before it) and
+        # not finished, so the file is longer than it was with the same start
+        if (state.get('pending') is not None and size >= state['size']
+                and _tail_hash(self.filename, state['size']) == state['tail']):
+            return state
+        raise ValueError('{:s} has changed since it was last added to (it is {:d} bytes, not {:d}), '
+                         'run "python catalogue.py rebuild {:s}" if the changes should be kept'.format(
+                             self.filename, size, state['size'], self.filename))
+
+    def _save_state(self, pending=None):
+        if pending is None:
+            self.state['size'] = os.path.getsize(self.filename)
+            self.state['tail'] = _tail_hash(self.filename, self.state['size'])
+        self.state['pending'] = pending
+        self.state['version'] = 2
+        os.makedirs(os.path.dirname(self.state_file), exist_ok=True)
+        with open(self.state_file + '.part', 'w') as f:
+            json.dump(self.state, f)
+        os.replace(self.state_file + '.part', self.state_file)
+
+    def _roll_back(self):
+        # cut off the rows of an append that didn't finish
+        if self.state.get('pending') is not None and os.path.exists(self.filename):
+            with open(self.filename, 'r+b') as f:
+                f.truncate(self.state['size'])
+            self._save_state()
+
+    def _scan(self, fix):
+        # the state from reading the whole csv, a file that isn't sorted by
+        # time or has repeated events is sorted and the repeats dropped if
+        # fix, otherwise it's an error
+        state = self._empty_state()
+        if os.path.getsize(self.filename) == 0:
+            self.state = state
+            self._save_state()
+            return self.state
+        table = pd.read_csv(self.filename, **CSV_TEXT)
+        if len(table) > 0:
+            key_columns = self.key_columns(table.columns)
+            times = _iso(table[self.time_column])
+            keys = event_keys(table, key_columns)
+            repeated = pd.Series(keys).duplicated().values
+            if repeated.any() or (times[1:] < times[:-1]).any():
+                if not fix:
+                    raise ValueError('{:s} is not sorted by time or has repeated events, run '
+                                     '"python catalogue.py rebuild {:s}" to fix it'.format(
+                                         self.filename, self.filename))
+                order = np.argsort(times, kind='stable')
+                order = order[~repeated[order]]
+                table, times, keys = table.iloc[order], times[order], keys[order]
+                self._replace_file(table)
+            state.update(high_water=times[-1], high_water_keys=list(keys[times == times[-1]]),
+                         n_rows=len(table))
+        self.state = state
+        self._save_state()
+        return self.state
+
+    def _replace_file(self, table):
+        table.to_csv(self.filename + '.part', index=False)
+        os.replace(self.filename + '.part', self.filename)
+
+    def rebuild(self):
+        """
+        Read the whole csv to make the state again (e.g. after rows were
+        added to it by hand). A file that isn't sorted by time or has
+        repeated events is sorted and the repeats dropped.
+        """
+        if not os.path.exists(self.filename):
+            raise ValueError('there is no catalogue {:s} to rebuild'.format(self.filename))
+        return self._scan(fix=True)
+
+    def _file_keys(self, key_columns):
+        # the keys of all the events in the file
+        table = pd.read_csv(self.filename, usecols=key_columns, **CSV_TEXT)
+        return event_keys(table, key_columns)
+
+    ###################
+    # adding events
+
+    def add(self, table):
+        """
+        Add the events of a table that are new, i.e. whose keys aren't in the
+        catalogue or earlier in the table. New events after the high water
+        mark are appended in time order, new events before it (which needs
+        the keys of the whole file to find) are merged in by writing the
+        file again.
+
+        Returns
+        -------
+        dict
+            the number of events 'added', 'repeated' (already in or repeated
+            in the table), 'older' (the added ones that were before the high
+            water mark) and 'no_time' (left out, they can't be put in order).
+        """
+        counts = dict(added=0, repeated=0, older=0, no_time=0)
+        if len(table) == 0:
+            return counts
+        self._roll_back()
+        columns = self.columns or list(table.columns)
+        key_columns = self.key_columns(columns)
+
+        times = _iso(table[self.time_column])
+        keys = event_keys(table, key_columns)
+        high_water = self.state['high_water']
+        timed = times != ''
+        counts['no_time'] = int((~timed).sum())
+
+        repeated = pd.Series(keys).duplicated().values.copy()
+        at_mark = timed & (times == high_water)
+        repeated[at_mark] |= np.isin(keys[at_mark], self.state['high_water_keys'])
+        older = timed & (times < high_water)
+        if older.any():
+            repeated[older] |= np.isin(keys[older], self._file_keys(key_columns))
+        keep = np.flatnonzero(timed & ~repeated)
+        counts['repeated'] = int((timed & repeated).sum())
+        if len(keep) == 0:
+            return counts
+
+        order = keep[np.argsort(times[keep], kind='stable')]
+        new = table.iloc[order].reindex(columns=columns)
+        for name in new.columns:
+            if pd.api.types.is_datetime64_any_dtype(new[name]):
+                new[name] = _iso(new[name], sep=' ' if name == 'flare_times' else 'T')
+        counts['added'] = len(new)
+        counts['older'] = int(older[order].sum())
+
+        if counts['older'] > 0:
+            # merged in (the old rows first at equal times) and written again
+            old = pd.read_csv(self.filename, **CSV_TEXT)
+            merged = pd.concat([old, new], ignore_index=True)
+            merged = merged.iloc[np.argsort(_iso(merged[self.time_column]), kind='stable')]
+            self._replace_file(merged)
+            self._scan(fix=False)
+            return counts
+
+        # the size before the append is saved first, so an append that
+        # doesn't finish is cut off by the next add rather than left in
+        write_header = self.columns is None
+        if not os.path.exists(self.filename):
+            open(self.filename, 'a').close()
+            self._save_state()
+        self._save_state(pending=self.state['size'])
+        with open(self.filename, 'a', newline='') as f:
+            new.to_csv(f, index=False, header=write_header)
+            f.flush()
+            os.fsync(f.fileno())
+
+        new_times, new_keys = times[order], keys[order]
+        if new_times[-1] == high_water:
+            high_water_keys = self.state['high_water_keys'] + list(new_keys)
+        else:
+            high_water_keys = list(new_keys[new_times == new_times[-1]])
+        self.state.update(high_water=new_times[-1], high_water_keys=high_water_keys,
+                          n_rows=self.state['n_rows'] + len(new))
+        self._save_state()
+        return counts
+
+    def add_csv(self, filename, **kwargs):
+        """
+        Add the events of another csv file (e.g. all_ar_2010-2020.csv), the
+        rows are copied as they're written in the file.
+        """
+        return self.add(pd.read_csv(filename, **dict(CSV_TEXT, **kwargs)))
+
+    def update(self, until=None, since=None, fetch=None):
+        """
+        Fetch the events from the high water mark (or `since` for an empty
+        catalogue) until `until` and add them.
+
+        Parameters
+        ----------
+        until : ~str, optional
+            the end of the query, by default now.
+        since : ~str, optional
+            the start for an empty catalogue, by default the kind's (see CATALOGUES).
+        fetch : callable, optional
+            fetch(tstart, tend) returning a DataFrame, by default
+            `ar_data.fetch_ar_data` or `ar_data.get_flare_data`.
+
+        Returns
+        -------
+        dict
+            the counts of `add`.
+        """
+        if fetch is None:
+            # imported here, sunpy is only needed to fetch
+            import ar_data
+            fetch = ar_data.fetch_ar_data if self.kind == 'ar' else ar_data.get_flare_data
+        tstart = self.high_water or pd.Timestamp(since or CATALOGUES[self.kind]['since'])
+        tend = pd.Timestamp(until) if until is not None else pd.Timestamp.now().floor('s')
+        if tend <= tstart:
+            return dict(added=0, repeated=0, older=0, no_time=0)
+        fmt = '%Y-%m-%dT%H:%M:%S'
+        return self.add(fetch(tstart.strftime(fmt), tend.strftime(fmt)))
+
+    def info(self):
+        return dict(filename=self.filename, kind=self.kind, n_rows=len(self),
+                    high_water=self.state['high_water'], size=self.state['size'])
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Keep the merged AR and flare catalogues up to date.')
+    parser.add_argument('command', choices=['add', 'update', 'info', 'rebuild'])
+    parser.add_argument('catalogue', help='the merged csv, e.g. concat_1996-2020.csv')
+    parser.add_argument('files', nargs='*', help='csv files to add, in time order')
+    parser.add_argument('--kind', choices=list(CATALOGUES), default='ar')
+    parser.add_argument('--until', default=None, help='end of the query for update, default now')
+    parser.add_argument('--since', default=None, help='start of the query for an empty catalogue')
+    args = parser.parse_args()
+
+    catalogue = Catalogue(args.catalogue, kind=args.kind, rebuild=args.command == 'rebuild')
+    if args.command == 'add':
+        if not args.files:
+            sys.exit('nothing to add')
+        for filename in args.files:
+            print(filename, catalogue.add_csv(filename))
+    elif args.command == 'update':
+        print(catalogue.update(until=args.until, since=args.since))
+    print(catalogue.info())
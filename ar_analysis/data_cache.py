@@ -0,0 +1,175 @@
+import os
+import json
+import fcntl
+import shutil
+import tempfile
+import numpy as np
+import pandas as pd
+
+# Columnar cache for the csv files. The first time a csv is loaded it is
+# parsed once and each column is saved as a .npy file (times as datetime64,
+# repeated strings as categorical codes, whole numbers as the smallest int
+# type) in a .cache directory next to it. After that the columns are memory
+# mapped straight from the .npy files. The cache is rebuilt whenever the
+# csv file changes.
+#
+# Several processes can build the cache of the same file at once (e.g. the
+# render workers on a cold cache): each builds in its own temporary
+# directory and swaps it in under a lock file, and one that finds a good
+# cache already there when it gets the lock throws its own away. A cache
+# that's good is never removed, so readers can keep it memory mapped.
+
+CACHE_VERSION = 1
+
+# columns that are parsed as datetime64
+TIME_COLUMNS = ['event_starttime', 'event_endtime', 'event_peaktime',
+                'frm_daterun', 'flare_times']
+
+# columns that are always stored as categorical
+CATEGORICAL_COLUMNS = ['ar_mcintoshcls', 'ar_mtwilsoncls', 'frm_name',
+                       'fl_goescls', 'area_unit']
+
+
+def cache_dir_for(filename):
+    """
+    The cache directory for a csv file, e.g. ./.cache/all_ar_2010-2020.csv/
+    """
+    dirname, basename = os.path.split(os.path.abspath(filename))
+    return os.path.join(dirname, '.cache', basename)
+
+
+def _source_stamp(filename, read_kwargs):
+    stat = os.stat(filename)
+    return dict(version=CACHE_VERSION, size=stat.st_size, mtime_ns=stat.st_mtime_ns,
+                read_kwargs=repr(sorted(read_kwargs.items())))
+
+
+def _narrow(values):
+    """
+    Convert a numeric column to the smallest dtype that holds it without loss.
+    """
+    if values.dtype.kind == 'f' and np.isfinite(values).all() and (values == np.round(values)).all():
+        values = values.astype(np.int64)
+    if values.dtype.kind in 'iu':
+        return pd.to_numeric(values, downcast='integer')
+    return values
+
+
+def _encode(data):
+    """
+    Turn each column of the DataFrame into a numpy array to be saved, returns
+    a dict of arrays and the description of the columns for the manifest.
+    """
+    arrays, columns = {}, []
+    for n, name in enumerate(data.columns):
+        col = data[name]
+        key = 'col{:03d}'.format(n)
+        if name in TIME_COLUMNS:
+            arrays[key] = pd.to_datetime(col).values.astype('datetime64[ns]')
+            columns.append(dict(name=name, kind='array'))
+        elif col.dtype.kind in 'biuf':
+            arrays[key] = _narrow(col.values)
+            columns.append(dict(name=name, kind='array'))
+        else:
+            cat = pd.Categorical(col)
+            # strings that are mostly unique (e.g. SOL_standard) are kept as
+            # fixed width strings, unless there is missing data.
+            if (name not in CATEGORICAL_COLUMNS and len(cat.categories) > len(col)//2
+                    and not col.isna().any()):
+                arrays[key] = np.asarray(col, dtype=str)
+                columns.append(dict(name=name, kind='array'))
+            else:
+                arrays[key] = _narrow(cat.codes.astype(np.int64))
+                columns.append(dict(name=name, kind='categorical',
+                                    categories=[str(c) for c in cat.categories]))
+    return arrays, columns
+
+
+def build_cache(filename, **read_kwargs):
+    """
+    Parse the csv file and write the columnar cache for it.
+
+    Parameters
+    ----------
+    filename : ~str
+        the csv file.
+    read_kwargs :
+        passed on to `pd.read_csv`.
+    """
+    data = pd.read_csv(filename, **read_kwargs)
+    arrays, columns = _encode(data)
+
+    cache_dir = cache_dir_for(filename)
+    parent, basename = os.path.split(cache_dir)
+    os.makedirs(parent, exist_ok=True)
+    tmp_dir = tempfile.mkdtemp(prefix=basename + '.part-', dir=parent)
+    try:
+        for key, values in arrays.items():
+            np.save(os.path.join(tmp_dir, key + '.npy'), values)
+
+        manifest = dict(_source_stamp(filename, read_kwargs), nrows=len(data),
+                        columns=[dict(c, file='col{:03d}.npy'.format(n)) for n, c in enumerate(columns)])
+        with open(os.path.join(tmp_dir, 'manifest.json'), 'w') as f:
+            json.dump(manifest, f)
+
+        with open(cache_dir + '.lock', 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            # someone else got there first, use theirs
+            if _read_manifest(filename, read_kwargs) is not None:
+                return
+            # an old cache is moved out of the way before it's removed, so
+            # the new one goes in with one rename
+            if os.path.exists(cache_dir):
+                old_dir = tempfile.mkdtemp(prefix=basename + '.old-', dir=parent)
+                os.replace(cache_dir, os.path.join(old_dir, 'cache'))
+                shutil.rmtree(old_dir, ignore_errors=True)
+            os.replace(tmp_dir, cache_dir)
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def _read_manifest(filename, read_kwargs):
+    path = os.path.join(cache_dir_for(filename), 'manifest.json')
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        manifest = json.load(f)
+    stamp = _source_stamp(filename, read_kwargs)
+    if any(manifest.get(k) != v for k, v in stamp.items()):
+        return None
+    return manifest
+
+
+def load_csv(filename, mmap=True, **read_kwargs):
+    """
+    Load a csv file through the columnar cache, building (or rebuilding) the
+    cache first if it doesn't exist or the csv has changed.
+
+    Parameters
+    ----------
+    filename : ~str
+        the csv file, e.g. all_ar_2010-2020.csv.
+    mmap : ~bool
+        memory map the cached columns rather than reading them into memory.
+    read_kwargs :
+        passed on to `pd.read_csv` when the cache is built.
+
+    Returns
+    -------
+    pandas.DataFrame
+        with the time columns as datetime64 and categorical string columns.
+    """
+    manifest = _read_manifest(filename, read_kwargs)
+    if manifest is None:
+        build_cache(filename, **read_kwargs)
+        manifest = _read_manifest(filename, read_kwargs)
+
+    cache_dir = cache_dir_for(filename)
+    columns = {}
+    for col in manifest['columns']:
+        values = np.load(os.path.join(cache_dir, col['file']), mmap_mode='r' if mmap else None)
+        if col['kind'] == 'categorical':
+            values = pd.Categorical.from_codes(values, col['categories'])
+        columns[col['name']] = values
+
+    return pd.DataFrame(columns, copy=False)
@@ -0,0 +1,237 @@
+import numpy as np
+import pandas as pd
+from multiprocessing import Pool
+
+# Flare frequency distributions (number of flares as a function of GOES peak
+# flux) and their power-law indices, for the solar cycles or any other time
+# windows. The flares are sorted by time once, then the histograms and the
+# power-law fits of all the windows come from cumulative sums and
+# searchsorted, so a sliding window over the whole catalogue is as quick as
+# one histogram.
+
+# the solar cycles as cut in solar_flare_and_snn.ipynb, [start, end)
+SOLAR_CYCLES = {'sc22': ('1989-09-01', '1996-08-01'),
+                'sc23': ('1996-08-01', '2008-12-01'),
+                'sc24': ('2008-12-01', '2019-12-02')}
+
+# the flare list is complete above C1.0
+XMIN = 1e-6
+
+# resamples per bootstrap task, each task has its own seed so the result
+# doesn't depend on the number of processes
+BOOTSTRAP_CHUNK = 250
+
+
+def get_logbins(flares, bins=55):
+    """
+    Log spaced bin edges between the smallest and largest `goes_class` of the flares.
+    """
+    n, linear_bins = np.histogram(flares['goes_class'], bins=bins)
+    logbins = np.logspace(np.log10(linear_bins[0]), np.log10(linear_bins[-1]), len(linear_bins))
+    return logbins
+
+
+def _ns(times):
+    return pd.to_datetime(pd.Series(times)).values.astype('datetime64[ns]').astype(np.int64)
+
+
+def _sorted_flares(flares, flux_column, time_column):
+    # the times (ns) and fluxes sorted by time
+    t = _ns(flares[time_column])
+    order = np.argsort(t, kind='stable')
+    return t[order], flares[flux_column].values.astype(float)[order]
+
+
+def _window_rows(t, windows):
+    # the [lo, hi) rows of the time sorted flares in each [start, end) window
+    starts = _ns([w[0] for w in windows])
+    ends = _ns([w[1] for w in windows])
+    return np.searchsorted(t, starts, 'left'), np.searchsorted(t, ends, 'left')
+
+
+def frequency_distributions(flares, windows, bins, flux_column='goes_class',
+                            time_column='event_peaktime'):
+    """
+    Histograms of the flare peak flux in each time window.
+
+    Parameters
+    ----------
+    flares : ~pandas.DataFrame
+        the flares, e.g. since_1986_c1_solarcycle_flares.csv.
+    windows : list of (start, end)
+        the [start, end) time windows, anything pd.Timestamp understands.
+        They can overlap and don't need to be in order.
+    bins : ~numpy.ndarray
+        the bin edges, e.g. from `get_logbins`. Like np.histogram the last
+        bin includes its right edge.
+
+    Returns
+    -------
+    numpy.ndarray
+        (len(windows), len(bins) - 1) counts.
+    """
+    t, x = _sorted_flares(flares, flux_column, time_column)
+    lo, hi = _window_rows(t, windows)
+    n_bins = len(bins) - 1
+
+    b = np.searchsorted(bins, x, 'right') - 1
+    b[x == bins[-1]] = n_bins - 1
+    good = (b >= 0) & (b < n_bins)
+
+    # the flares sorted by bin and then by time, so the flares of bin k in rows
+    # [lo, hi) are the keys in [k*n + lo, k*n + hi)
+    n = len(t)
+    keys = np.sort(b[good]*n + np.flatnonzero(good))
+    k = np.arange(n_bins)*n
+    return np.searchsorted(keys, k + hi[:, None]) - np.searchsorted(keys, k + lo[:, None])
+
+
+def cycle_distributions(flares, bins=40, cycles=SOLAR_CYCLES, **kwargs):
+    """
+    The flare frequency distribution of each solar cycle, with the log bins of
+    solar cycle 23 as in solar_flare_and_snn.ipynb.
+
+    Returns
+    -------
+    pandas.DataFrame
+        the counts, with a column for each cycle and indexed by the left bin edge.
+    numpy.ndarray
+        the bin edges.
+    """
+    t = pd.to_datetime(flares[kwargs.get('time_column', 'event_peaktime')])
+    start, end = cycles.get('sc23', next(iter(cycles.values())))
+    logbins = get_logbins(flares[(t >= start) & (t < end)], bins=bins)
+    counts = frequency_distributions(flares, list(cycles.values()), logbins, **kwargs)
+    return pd.DataFrame(counts.T, index=logbins[:-1], columns=list(cycles)), logbins
+
+
+def fit_power_law(flux, xmin=XMIN):
+    """
+    The maximum likelihood index of a power law dN/dx ~ x^-alpha above xmin.
+
+    alpha = 1 + n / sum(ln(x/xmin)), with standard error (alpha - 1)/sqrt(n)
+    (Clauset, Shalizi & Newman 2009, eq. 3.1).
+
+    Returns
+    -------
+    alpha, sigma, n
+    """
+    flux = np.asarray(flux, dtype=float)
+    logs = np.log(flux[flux >= xmin]/xmin)
+    n = len(logs)
+    if n == 0:
+        return np.nan, np.nan, 0
+    alpha = 1 + n/logs.sum()
+    return alpha, (alpha - 1)/np.sqrt(n), n
+
+
+def fit_windows(flares, windows, xmin=XMIN, flux_column='goes_class', time_column='event_peaktime'):
+    """
+    `fit_power_law` for the flares in each time window, all at once from cumulative sums.
+
+    Returns
+    -------
+    pandas.DataFrame
+        start, end, n, alpha and sigma for each window.
+    """
+    t, x = _sorted_flares(flares, flux_column, time_column)
+    lo, hi = _window_rows(t, windows)
+
+    above = x >= xmin
+    n_cum = np.r_[0, np.cumsum(above)]
+    log_cum = np.r_[0, np.cumsum(np.where(above, np.log(np.where(above, x, xmin)/xmin), 0))]
+    n = n_cum[hi] - n_cum[lo]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        alpha = np.where(n > 0, 1 + n/(log_cum[hi] - log_cum[lo]), np.nan)
+        sigma = (alpha - 1)/np.sqrt(n)
+
+    return pd.DataFrame({'start': pd.to_datetime([w[0] for w in windows]),
+                         'end': pd.to_datetime([w[1] for w in windows]),
+                         'n': n, 'alpha': alpha, 'sigma': sigma})
+
+
+def fit_cycles(flares, cycles=SOLAR_CYCLES, xmin=XMIN, **kwargs):
+    """
+    `fit_windows` for the solar cycles, indexed by cycle name.
+    """
+    fits = fit_windows(flares, list(cycles.values()), xmin=xmin, **kwargs)
+    fits.index = list(cycles)
+    return fits
+
+
+def sliding_power_law(flares, width='730D', step='30D', xmin=XMIN, **kwargs):
+    """
+    The power-law index in a window of `width` moved along in steps of `step`,
+    to see how it changes over the solar cycle.
+
+    Returns
+    -------
+    pandas.DataFrame
+        as `fit_windows`, indexed by the centre of each window.
+    """
+    t = pd.to_datetime(flares[kwargs.get('time_column', 'event_peaktime')])
+    width, step = pd.Timedelta(width), pd.Timedelta(step)
+    starts = pd.date_range(t.min().floor('D'), t.max() - width + step, freq=step)
+    fits = fit_windows(flares, list(zip(starts, starts + width)), xmin=xmin, **kwargs)
+    fits.index = starts + width/2
+    return fits
+
+
+def _bootstrap_chunk(args):
+    # alpha for n_boot resamples of the ln(x/xmin), in batches of about 4 million draws
+    logs, n_boot, seed = args
+    rng = np.random.default_rng(seed)
+    n = len(logs)
+    if n == 0:
+        return np.full(n_boot, np.nan)
+    batch = max(1, 4000000//n)
+    alphas = np.empty(n_boot)
+    for k in range(0, n_boot, batch):
+        m = min(batch, n_boot - k)
+        alphas[k:k + m] = 1 + n/logs[rng.integers(0, n, (m, n))].sum(axis=1)
+    return alphas
+
+
+def bootstrap_power_law(flux, xmin=XMIN, n_boot=1000, ci=0.95, processes=None, seed=0):
+    """
+    Bootstrap confidence interval of the power-law index of `fit_power_law`,
+    with the resamples split over a pool of processes.
+
+    Parameters
+    ----------
+    flux : array
+        the peak fluxes.
+    n_boot : ~int
+        the number of resamples.
+    ci : ~float
+        the confidence level of the interval.
+    processes : ~int, optional
+        number of worker processes, defaults to the number of cpus. With 1 no pool is used.
+    seed : ~int
+        seed of the random numbers, the same seed gives the same result for
+        any number of processes.
+
+    Returns
+    -------
+    dict
+        alpha, sigma (the analytic error), n, ci_low, ci_high and the bootstrap
+        alphas. With no flux above xmin or no resamples the interval is NaN
+        (and alpha too without flux, like `fit_power_law`).
+    """
+    flux = np.asarray(flux, dtype=float)
+    alpha, sigma, n = fit_power_law(flux, xmin=xmin)
+    if n == 0 or n_boot < 1:
+        return dict(alpha=alpha, sigma=sigma, n=n, ci_low=np.nan, ci_high=np.nan, alphas=np.empty(0))
+    logs = np.log(flux[flux >= xmin]/xmin)
+
+    sizes = [min(BOOTSTRAP_CHUNK, n_boot - k) for k in range(0, n_boot, BOOTSTRAP_CHUNK)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    tasks = [(logs, size, s) for size, s in zip(sizes, seeds)]
+    if processes == 1:
+        alphas = np.concatenate([_bootstrap_chunk(task) for task in tasks])
+    else:
+        with Pool(processes) as pool:
+            alphas = np.concatenate(pool.map(_bootstrap_chunk, tasks))
+
+    ci_low, ci_high = np.quantile(alphas, [(1 - ci)/2, (1 + ci)/2])
+    return dict(alpha=alpha, sigma=sigma, n=n, ci_low=ci_low, ci_high=ci_high, alphas=alphas)
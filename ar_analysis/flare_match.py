@@ -0,0 +1,240 @@
+import numpy as np
+import pandas as pd
+from ar_tracks import unwrap_noaa
+
+# Matching of flares (e.g. since_1986_c1_solarcycle_flares.csv) to the daily
+# active region records (all_ar_*.csv). Flares with a NOAA number are matched
+# to the record of that region on the day of the flare peak by a searchsorted
+# of (number, day) keys, so it's one pass however many flares there are.
+# Flares without a number (0 or missing) can be matched to the nearest region
+# on the disk that day if the flare table has positions. The 4 digit numbers
+# used after the NOAA numbers wrapped around in 2002 are made 5 digit (see
+# `ar_tracks.unwrap_noaa`) in both tables.
+
+GOES_CLASSES = np.array(['A', 'B', 'C', 'M', 'X'])
+
+# peak flux (W/m^2) of a class 1.0 flare of each letter
+GOES_FLUX = {'A': 1e-8, 'B': 1e-7, 'C': 1e-6, 'M': 1e-5, 'X': 1e-4}
+
+# the active region columns added to the matched flares (with a '_ar' suffix)
+AR_JOIN_COLUMNS = ['ar_noaanum', 'hpc_x', 'hpc_y', 'hgs_x', 'hgs_y', 'ar_mcintoshcls',
+                   'ar_mtwilsoncls', 'ar_numspots', 'area_atdiskcenter']
+
+# bits of the (number, day) key used for the day, days since 1970 fit easily
+_DAY_BITS = 20
+
+
+def _days(times):
+    # days since 1970-01-01 of a column of times (strings or datetimes)
+    return pd.to_datetime(pd.Series(times)).values.astype('datetime64[D]').astype(np.int64)
+
+
+def goes_class_letter(flux):
+    """
+    The GOES class letter (A, B, C, M or X) of peak fluxes in W/m^2, '' for missing fluxes.
+    """
+    flux = np.asarray(flux, dtype=float)
+    good = np.isfinite(flux) & (flux > 0)
+    exponent = np.floor(np.log10(np.where(good, flux, 1e-8))).astype(int)
+    return np.where(good, GOES_CLASSES[np.clip(exponent + 8, 0, 4)], '')
+
+
+def goes_class_name(flux):
+    """
+    The GOES class (e.g. 'M2.3') of peak fluxes in W/m^2, '' for missing fluxes.
+    Fluxes of X10 and above stay X class (e.g. 'X13.3').
+    """
+    flux = np.asarray(flux, dtype=float)
+    letters = goes_class_letter(flux)
+    scale = np.array([GOES_FLUX.get(l, np.nan) for l in letters])
+    # rounded down to one decimal, as in the GOES lists
+    number = np.floor(np.round(flux/scale, 6)*10)/10
+    return np.array(['' if l == '' else '{:s}{:.1f}'.format(l, n) for l, n in zip(letters, number)], dtype=object)
+
+
+def goes_flux(goes_classes):
+    """
+    The peak flux in W/m^2 of GOES classes like 'M2.3', 0 where the class can't be read.
+    """
+    goes_classes = pd.Series(goes_classes, dtype=object).fillna('').astype(str).str.strip()
+    scale = goes_classes.str[:1].map(GOES_FLUX)
+    number = pd.to_numeric(goes_classes.str[1:], errors='coerce')
+    return (scale*number).fillna(0).values
+
+
+def _match_numbers(f_noaa, f_day, ar_noaa, ar_day, max_days):
+    # the active region record (index into ar_*) of the same number nearest in
+    # day to each flare, -1 if there's none within max_days
+    keys = (ar_noaa << _DAY_BITS) + ar_day
+    order = np.argsort(keys, kind='stable')
+    keys = keys[order]
+    # if a region has two records on a day the first one is used
+    first = np.r_[True, keys[1:] != keys[:-1]]
+    order, keys = order[first], keys[first]
+
+    best = np.full(len(f_noaa), -1, dtype=np.int64)
+    offset = np.zeros(len(f_noaa), dtype=np.int64)
+    if len(keys) == 0:
+        return best, offset
+
+    pos = np.searchsorted(keys, (f_noaa << _DAY_BITS) + f_day)
+    # the record on or after the flare day and the one before it
+    after, before = order[np.minimum(pos, len(keys) - 1)], order[np.maximum(pos - 1, 0)]
+    big = np.iinfo(np.int64).max
+    d_after = np.where((ar_noaa[after] == f_noaa) & (pos < len(keys)), ar_day[after] - f_day, big)
+    d_before = np.where((ar_noaa[before] == f_noaa) & (pos > 0), f_day - ar_day[before], big)
+
+    use_before = d_before <= d_after
+    nearest = np.where(use_before, d_before, d_after)
+    ok = nearest <= max_days
+    best[ok] = np.where(use_before, before, after)[ok]
+    offset[ok] = np.where(use_before, -d_before, d_after)[ok]
+    return best, offset
+
+
+def _match_positions(fx, fy, f_day, ar_x, ar_y, ar_day, max_distance):
+    # the active region record nearest on the disk on the same day, -1 if
+    # there's none within max_distance. Flares are done a day at a time so
+    # the distance arrays are only (flares on day) x (regions on day).
+    ar_order = np.argsort(ar_day, kind='stable')
+    ar_day_sorted = ar_day[ar_order]
+
+    f_order = np.argsort(f_day, kind='stable')
+    days, starts = np.unique(f_day[f_order], return_index=True)
+    ends = np.r_[starts[1:], len(f_order)]
+    lo = np.searchsorted(ar_day_sorted, days, 'left')
+    hi = np.searchsorted(ar_day_sorted, days, 'right')
+
+    best = np.full(len(fx), -1, dtype=np.int64)
+    distance = np.full(len(fx), np.nan)
+    for s, e, l, h in zip(starts, ends, lo, hi):
+        if h == l:
+            continue
+        flares = f_order[s:e]
+        regions = ar_order[l:h]
+        d = np.hypot(fx[flares, None] - ar_x[None, regions], fy[flares, None] - ar_y[None, regions])
+        nearest = np.argmin(d, axis=1)
+        best[flares] = regions[nearest]
+        distance[flares] = d[np.arange(len(flares)), nearest]
+
+    too_far = distance > max_distance
+    best[too_far] = -1
+    distance[too_far] = np.nan
+    return best, distance
+
+
+def match_flares(flares, ar_data, max_days=1, max_distance=200., time_column='event_peaktime',
+                 position_columns=('hpc_x', 'hpc_y'), ar_columns=AR_JOIN_COLUMNS):
+    """
+    Match each flare to an active region record.
+
+    Flares with a NOAA number are matched to the record of the same number on
+    the day of `time_column`, or on the nearest day up to `max_days` away (for
+    flares the day before a region is first recorded or just after it rotates
+    off). 4 digit numbers after 2002 are taken as the 5 digit ones (see
+    `ar_tracks.unwrap_noaa`). Flares with the number 0 or missing are matched to the nearest
+    region that day within `max_distance` arcsec if the flare table has
+    `position_columns`, otherwise they're left unmatched.
+
+    Parameters
+    ----------
+    flares : ~pandas.DataFrame
+        the flares, needs `ar_noaanum` and `time_column`.
+    ar_data : ~pandas.DataFrame
+        the daily active region records, needs `ar_noaanum`, `event_starttime`
+        and `hpc_x`, `hpc_y` for the position matching.
+    max_days : ~int
+        the most days between the flare and the record of its region.
+    max_distance : ~float
+        the most arcsec between an unnumbered flare and the region.
+    ar_columns : list of ~str
+        the active region columns to add to the flares, with the suffix '_ar'.
+
+    Returns
+    -------
+    pandas.DataFrame
+        a copy of the flares with the columns
+        `ar_row` : the row number (not label) in ar_data of the match, -1 if unmatched.
+        `match` : 'number', 'position' or 'none'.
+        `match_days` : the day of the record minus the day of the flare, for number matches.
+        `match_distance` : arcsec to the region, for position matches.
+        and the `ar_columns` of the record (NaN when unmatched).
+    """
+    f_noaa = unwrap_noaa(flares['ar_noaanum'], flares[time_column])
+    f_day = _days(flares[time_column])
+    ar_noaa = unwrap_noaa(ar_data['ar_noaanum'], ar_data['event_starttime'])
+    ar_day = _days(ar_data['event_starttime'])
+
+    numbered = f_noaa > 0
+    best = np.full(len(flares), -1, dtype=np.int64)
+    match_days = np.full(len(flares), np.nan)
+    match_distance = np.full(len(flares), np.nan)
+
+    rows, offset = _match_numbers(f_noaa[numbered], f_day[numbered], ar_noaa, ar_day, max_days)
+    best[numbered] = rows
+    match_days[np.flatnonzero(numbered)[rows >= 0]] = offset[rows >= 0]
+
+    if all(c in flares.columns for c in position_columns):
+        fx, fy = (flares[c].values.astype(float) for c in position_columns)
+        todo = np.flatnonzero(~numbered & np.isfinite(fx) & np.isfinite(fy))
+        rows, distance = _match_positions(fx[todo], fy[todo], f_day[todo],
+                                          ar_data['hpc_x'].values.astype(float),
+                                          ar_data['hpc_y'].values.astype(float),
+                                          ar_day, max_distance)
+        best[todo] = rows
+        match_distance[todo] = distance
+
+    matched = flares.copy()
+    matched['ar_row'] = best
+    matched['match'] = np.where(best < 0, 'none', np.where(numbered, 'number', 'position'))
+    matched['match_days'] = match_days
+    matched['match_distance'] = match_distance
+
+    for col in ar_columns:
+        # reindexing by row number gives NaN for the -1s
+        matched[col + '_ar'] = ar_data[col].reset_index(drop=True).reindex(best).values
+    return matched
+
+
+def flare_productivity(matched, ar_data):
+    """
+    The flare productivity of each active region from the `match_flares` result.
+
+    The flare index is the sum of the peak fluxes in units of C1.0 (so X1 is
+    100, M1 is 10, C1 is 1 and B1 is 0.1) divided by the number of days the
+    region was recorded.
+
+    Parameters
+    ----------
+    matched : ~pandas.DataFrame
+        the output of `match_flares`, e.g. only the flares of one solar cycle.
+    ar_data : ~pandas.DataFrame
+        the active region records that were matched to.
+
+    Returns
+    -------
+    pandas.DataFrame
+        indexed by NOAA number, for every region in ar_data: n_days, first_day,
+        last_day, n_flares, the number of flares of each GOES class (A to X),
+        max_flux and flare_index.
+    """
+    ar_noaa = unwrap_noaa(ar_data['ar_noaanum'], ar_data['event_starttime'])
+    days = pd.Series(_days(ar_data['event_starttime']).astype('datetime64[D]'), index=ar_noaa)
+    regions = days.groupby(level=0).agg(['nunique', 'min', 'max'])
+    regions.columns = ['n_days', 'first_day', 'last_day']
+    regions.index.name = 'ar_noaanum'
+
+    found = matched['ar_row'].values >= 0
+    noaa = ar_noaa[matched['ar_row'].values[found]]
+    flux = matched['goes_class'].values[found].astype(float)
+
+    table = pd.DataFrame({'ar_noaanum': noaa, 'cls': goes_class_letter(flux), 'flux': flux})
+    counts = pd.crosstab(table['ar_noaanum'], table['cls']).reindex(columns=GOES_CLASSES, fill_value=0)
+    flux_by_region = table.groupby('ar_noaanum')['flux'].agg(['size', 'max', 'sum'])
+
+    regions['n_flares'] = flux_by_region['size'].reindex(regions.index, fill_value=0)
+    for c in GOES_CLASSES:
+        regions[c] = counts[c].reindex(regions.index, fill_value=0)
+    regions['max_flux'] = flux_by_region['max'].reindex(regions.index)
+    regions['flare_index'] = flux_by_region['sum'].reindex(regions.index, fill_value=0)/1e-6/regions['n_days']
+    return regions
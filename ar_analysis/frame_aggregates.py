@@ -0,0 +1,301 @@
+import numpy as np
+from matplotlib import dates
+from matplotlib import colormaps
+from matplotlib.colors import Normalize, to_rgb
+
+# Aggregates of all the active regions before each day for the movie frames,
+# worked out once for the whole movie. Before, each frame histogrammed and
+# scattered all of the past data again, so a frame got slower the further
+# into the movie it was and rendering the movie was quadratic in the number
+# of days:
+#
+# LatitudeHistograms : the histogram next to the disk for every day, which
+#     is exactly what ax.hist(all_past['hpc_y'], bins=100) gives.
+# ButterflyRaster : the butterfly diagram as an image lined up with the
+#     pixels of the axes, each active region adds the disc and edge of its
+#     scatter marker. Where markers overlap it can't follow the order they
+#     were drawn in, so it is close to the scatter plot rather than the same.
+
+HIST_BINS = 100
+
+# the butterfly axes of the movie frames, [0.12, 0.66, 0.62, 0.33] of the
+# 7x8 inch figure at dpi 200
+BUTTERFLY_PIXELS = (868, 528)
+BUTTERFLY_LATS = (-45, 45)
+
+
+def _histogram_bins(x, first_edge, last_edge, n_bins):
+    # the bin of each x and the bin edges as np.histogram(x, bins=n_bins) works
+    # them out when x runs from first_edge to last_edge (uniform bins)
+    if first_edge == last_edge:
+        first_edge, last_edge = first_edge - 0.5, last_edge + 0.5
+    edges = np.linspace(first_edge, last_edge, n_bins + 1)
+    index = ((x - first_edge)/(last_edge - first_edge)*n_bins).astype(np.intp)
+    index[index == n_bins] -= 1
+    index[x < edges[index]] -= 1
+    index[(x >= edges[index + 1]) & (index != n_bins - 1)] += 1
+    return index, edges
+
+
+class LatitudeHistograms:
+    """
+    The histogram of `column` for all the active regions before each day, i.e.
+    np.histogram(ar_days.all_past(i)[column], bins=bins) for every day i.
+
+    The bins of np.histogram run from the min to the max of the data, which
+    only change when a new extreme comes in, so the days are done in runs
+    with the same bins from a cumulative sum of the counts of each day.
+
+    Parameters
+    ----------
+    ar_days : ar_store.ARDayStore
+        the day-indexed active region data.
+    column : ~str
+        the column to histogram.
+    bins : ~int
+        number of bins.
+
+    Attributes
+    ----------
+    counts : numpy.ndarray
+        (n_days, bins) counts.
+    edges : numpy.ndarray
+        (n_days, bins + 1) bin edges.
+    """
+
+    def __init__(self, ar_days, column='hpc_y', bins=HIST_BINS):
+        y = np.asarray(ar_days.data[column], dtype=float)
+        n_days = len(ar_days.days)
+        n_past = ar_days.bounds[:n_days]
+
+        self.counts = np.zeros((n_days, bins), dtype=np.int64)
+        # np.histogram of no data has the range (0, 1)
+        self.edges = np.tile(np.linspace(0, 1, bins + 1), (n_days, 1))
+
+        has_past = n_past > 0
+        if not has_past.any():
+            return
+        lo = np.minimum.accumulate(y)[np.maximum(n_past - 1, 0)]
+        hi = np.maximum.accumulate(y)[np.maximum(n_past - 1, 0)]
+        new_range = has_past & ~(np.r_[False, has_past[:-1]] & (lo == np.r_[lo[:1], lo[:-1]])
+                                 & (hi == np.r_[hi[:1], hi[:-1]]))
+        starts = np.flatnonzero(new_range)
+        ends = np.r_[starts[1:], n_days]
+
+        for a, b in zip(starts, ends):
+            # days [a, b) have the same bins, count the rows before day b - 1 by day
+            rows = n_past[b - 1]
+            index, edges = _histogram_bins(y[:rows], lo[a], hi[a], bins)
+            per_day = np.bincount(ar_days.day_index[:rows]*bins + index,
+                                  minlength=(b - 1)*bins).reshape(-1, bins)
+            self.counts[a:b] = np.cumsum(per_day, axis=0)[a - 1:b - 1]
+            self.edges[a:b] = edges
+
+    @classmethod
+    def from_arrays(cls, counts, edges):
+        """
+        The histograms from saved `counts` and `edges` arrays.
+        """
+        hists = cls.__new__(cls)
+        hists.counts, hists.edges = np.asarray(counts), np.asarray(edges)
+        return hists
+
+    def __len__(self):
+        return len(self.counts)
+
+    def histogram(self, i):
+        """
+        The counts and bin edges for day i.
+        """
+        return self.counts[i], self.edges[i]
+
+    def draw(self, ax, i, **kwargs):
+        """
+        Draw the histogram for day i as ax.hist(..., orientation='horizontal', **kwargs) does.
+
+        Returns
+        -------
+        matplotlib.container.BarContainer
+        """
+        counts, edges = self.histogram(i)
+        width = np.diff(edges)
+        return ax.barh(edges[:-1] + 0.5*width, counts.astype(float), width, align='center',
+                       left=np.zeros(len(counts)), **kwargs)
+
+    def update_bars(self, bars, i):
+        """
+        Move the bars made by `draw` to the histogram for day i.
+        """
+        counts, edges = self.histogram(i)
+        width = np.diff(edges)
+        # the same sums as barh with align='center'
+        bottoms = (edges[:-1] + 0.5*width) - width/2
+        for rect, bottom, count, height in zip(bars, bottoms, counts, width):
+            rect.set_bounds(0, bottom, float(count), height)
+
+
+class ButterflyRaster:
+    """
+    The butterfly diagram (latitude against time) of all the active regions
+    before each day as an RGBA image, in place of the scatter plot
+
+    ax.scatter(all_past['tt'], all_past['hgc_y'], c=all_past['times'], s=np.sqrt(all_past['area_arcsec']),
+               alpha=0.3, cmap=cmap)
+
+    Each active region adds the disc of its marker to a count and a sum of
+    `times` in each pixel, and its edge to a count of edges, for the whole
+    movie at once. For day i only the pixels near day i need redoing (the
+    markers of later active regions reach back over them), so a frame takes
+    the same time all through the movie. Where markers overlap the colour is
+    the colour of the mean time mixed with the edge colour by the number of
+    edges, and the opacity is that of the overlapping markers,
+    1 - (1 - alpha)**(discs + edges).
+
+    Parameters
+    ----------
+    ar_days : ar_store.ARDayStore
+        the day-indexed active region data, needs `hgc_y`, `times` and `area_arcsec`.
+    tlims : ~tuple
+        the (start, end) datetimes of the axes.
+    ylims : ~tuple
+        the latitude limits of the axes.
+    pixels : ~tuple
+        the (width, height) of the axes in pixels.
+    dpi : ~int
+        the dpi of the figure, for the marker sizes.
+    alpha : ~float
+        the alpha of the markers.
+    linewidth : ~float
+        the width of the marker edges in points.
+    edgecolor : color
+        the colour of the marker edges.
+    layers : ~tuple, optional
+        the disc count, time sum and edge count images of all the active
+        regions if they've already been painted (e.g. saved from another
+        process with the same parameters).
+    """
+
+    def __init__(self, ar_days, tlims, ylims=BUTTERFLY_LATS, pixels=BUTTERFLY_PIXELS, dpi=200,
+                 alpha=0.3, linewidth=0.4, edgecolor='k', layers=None):
+        self.ar_days = ar_days
+        self.dpi = dpi
+        self.alpha = alpha
+        self.edgecolor = np.array(to_rgb(edgecolor))
+        self.extent = (dates.date2num(tlims[0]), dates.date2num(tlims[1]), ylims[0], ylims[1])
+        self.shape = (pixels[1], pixels[0])
+        data = ar_days.data
+
+        # marker centres in pixels (from the bottom left) and radii in pixels,
+        # the scatter size s is the marker area in points^2
+        x0, x1, y0, y1 = self.extent
+        self.x = (dates.date2num(np.asarray(ar_days.days)[ar_days.day_index]) - x0)/(x1 - x0)*pixels[0]
+        self.y = (np.asarray(data['hgc_y'], dtype=float) - y0)/(y1 - y0)*pixels[1]
+        self.radius = 0.5*np.sqrt(np.sqrt(np.asarray(data['area_arcsec'], dtype=float)))*dpi/72.
+        self.edge_width = linewidth*dpi/72.
+        self.times = np.asarray(data['times'], dtype=float)
+        # how far a marker reaches, with half the edge outside the disc
+        self.max_radius = (np.nanmax(self.radius) if len(self.radius) > 0 else 0.) + self.edge_width/2
+
+        if layers is None:
+            layers = self._paint(np.arange(len(self.x)))
+        elif any(np.shape(layer) != self.shape for layer in layers):
+            raise ValueError('the layers should be {:d}x{:d} images'.format(*self.shape))
+        self.count, self.time_sum, self.edges = (np.asarray(layer) for layer in layers)
+
+    def _paint(self, rows, first_column=0):
+        # the number of discs, their summed times and the number of edges in
+        # each pixel for these rows, in the pixel columns >= first_column
+        height, width = self.shape
+        n_cols = max(width - first_column, 0)
+        count = np.zeros(height*n_cols)
+        time_sum = np.zeros(height*n_cols)
+        edges = np.zeros(height*n_cols)
+        if n_cols == 0 or len(rows) == 0:
+            return count.reshape(height, n_cols), time_sum.reshape(height, n_cols), edges.reshape(height, n_cols)
+
+        # the markers are stamped in groups of the same size (to the nearest pixel)
+        radius = self.radius[rows]
+        good = np.isfinite(radius) & np.isfinite(self.y[rows])
+        rows, radius = rows[good], radius[good]
+        half_edge = self.edge_width/2
+        size = np.ceil(radius + half_edge).astype(int)
+        for r in np.unique(size):
+            these = rows[size == r]
+            dx, dy = np.meshgrid(np.arange(-r, r + 1), np.arange(-r, r + 1))
+            dx, dy = dx.ravel(), dy.ravel()
+            # in chunks so the (points x stamp) arrays stay small
+            chunk = max(1, 2**22//len(dx))
+            for k in range(0, len(these), chunk):
+                p = these[k:k + chunk]
+                # pixel (i, j) has its centre at (j + 0.5, i + 0.5)
+                col = np.floor(self.x[p])[:, None] + dx
+                row = np.floor(self.y[p])[:, None] + dy
+                distance = np.hypot(col + 0.5 - self.x[p, None], row + 0.5 - self.y[p, None])
+                on_axes = (col >= first_column) & (col < width) & (row >= 0) & (row < height)
+                cell = (row*n_cols + col - first_column).astype(np.intp)
+
+                disc = on_axes & (distance <= self.radius[p, None])
+                count += np.bincount(cell[disc], minlength=height*n_cols)
+                time_sum += np.bincount(cell[disc], minlength=height*n_cols,
+                                        weights=np.broadcast_to(self.times[p, None], disc.shape)[disc])
+                edge = on_axes & (np.abs(distance - self.radius[p, None]) <= half_edge)
+                edges += np.bincount(cell[edge], minlength=height*n_cols)
+        return count.reshape(height, n_cols), time_sum.reshape(height, n_cols), edges.reshape(height, n_cols)
+
+    def layers(self, i):
+        """
+        The disc count, time sum and edge count images for the active regions before day i.
+        """
+        bounds = self.ar_days.bounds
+        n = bounds[i]
+        if n == 0:
+            return np.zeros(self.shape), np.zeros(self.shape), np.zeros(self.shape)
+        # pixel columns left of this are only covered by active regions before day i
+        first = int(max(0, np.floor(self.x[n] - self.max_radius - 1))) if n < len(self.x) else self.shape[1]
+        first = min(first, self.shape[1])
+        # the active regions before day i that reach the columns from `first` on
+        start = np.searchsorted(self.x[:n], first - self.max_radius - 1)
+
+        layers = []
+        for full, recent in zip([self.count, self.time_sum, self.edges],
+                                self._paint(np.arange(start, n), first_column=first)):
+            layers.append(np.concatenate([full[:, :first], recent], axis=1))
+        return layers
+
+    def rgba(self, i, cmap='Reds'):
+        """
+        The image of the butterfly diagram for day i, coloured like the scatter
+        plot (the colours run over the times of the active regions before day i).
+
+        Returns
+        -------
+        numpy.ndarray
+            (height, width, 4) float image, the first row at the bottom.
+        """
+        count, time_sum, edges = self.layers(i)
+        n = self.ar_days.bounds[i]
+        image = np.zeros(self.shape + (4,))
+        if n == 0:
+            return image
+        times = self.times[:n]
+        norm = Normalize(np.nanmin(times), np.nanmax(times))
+        covered = count > 0
+        image[covered] = colormaps[cmap](norm(time_sum[covered]/count[covered]))
+
+        layers = count + edges
+        with np.errstate(invalid='ignore'):
+            edge_fraction = np.where(layers > 0, edges/layers, 0)[..., None]
+        image[..., :3] = image[..., :3]*(1 - edge_fraction) + self.edgecolor*edge_fraction
+        image[..., 3] = 1 - (1 - self.alpha)**layers
+        return image
+
+    def draw(self, ax, i, cmap='Reds', **kwargs):
+        """
+        Draw the butterfly diagram for day i on ax as an image.
+
+        Returns
+        -------
+        matplotlib.image.AxesImage
+        """
+        return ax.imshow(self.rgba(i, cmap=cmap), extent=self.extent, origin='lower', aspect='auto',
+                         interpolation='nearest', **kwargs)
@@ -0,0 +1,445 @@
+import os
+import re
+import argparse
+import multiprocessing
+import numpy as np
+import pandas as pd
+from flare_match import goes_class_name, goes_flux
+
+# A flare list like since_1986_c1_solarcycle_flares.csv made from a
+# directory of GOES XRS netCDF files rather than from the HEK:
+#
+#   python goes_xrs.py ./goes16_flsum/ --output flares_g16.csv
+#   python goes_xrs.py ./goes15_avg1m/ --catalogue since_1986_c1_solarcycle_flares.csv
+#
+# Two kinds of file are read:
+#   - the daily flare summaries (e.g. sci_xrsf-l2-flsum_g16_d20170910_v2-0-1.nc),
+#     which have a record for the start, peak and end of each flare
+#     (status) with the flare_counter they belong to.
+#   - the XRS-B light curves (e.g. the 1-min averages sci_xrsf-l2-avg1m_*,
+#     1-s data is averaged to 1 minute), where the flares are found with
+#     the NOAA SWPC definition (see `detect_flares`).
+#
+# The files are decoded on a process pool, a batch of files at a time, and
+# only the variables that are needed are read, CHUNK_ROWS at a time, straight
+# into the minute sums of the light curve. The 1-min light curves are then run
+# through the flare detection in time order, carrying over the end of each
+# day into the next if a flare is still going on, and the flare summaries are
+# turned into flares file by file, carrying over the records of the flares
+# that haven't ended. Only the flares found are kept, so the memory used
+# doesn't grow with the number of files. GOES-R files are
+# netCDF4 (HDF5), read with h5netcdf like in goes_flare_list_tests.ipynb;
+# older netCDF3 files are read with scipy.
+
+# the columns of since_1986_c1_solarcycle_flares.csv
+FLARE_LIST_COLUMNS = ['event_starttime', 'event_peaktime', 'event_endtime', 'fl_goescls',
+                      'ar_noaanum', 'goes_class', 'flare_times']
+
+# rows of a variable read at once
+CHUNK_ROWS = 2**16
+
+# the NOAA SWPC flare definition: the start is the first of 4 minutes of
+# rising flux with the last at least START_RATIO times the first, the end is
+# when the flux is back down half way between the peak and the start.
+RISE_MINUTES = 4
+START_RATIO = 1.4
+
+# a rise that hasn't come back down after this long isn't taken as a flare
+# (it's bad data), so at most this much of a light curve is carried over
+MAX_FLARE_MINUTES = 12*60
+
+# flux of a C1.0 flare, the smallest in the flare list
+C1_FLUX = 1e-6
+
+_HDF5_SIGNATURE = b'\x89HDF\r\n\x1a\n'
+
+
+###################
+# reading the files
+
+class _NetCDF:
+    # a netCDF file open for reading, HDF5 ones with h5netcdf and classic ones with scipy
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            signature = f.read(8)
+        if signature == _HDF5_SIGNATURE:
+            # only needed for the netCDF4 files
+            import h5netcdf
+            self._file = h5netcdf.File(path, 'r')
+        elif signature[:3] == b'CDF':
+            from scipy.io import netcdf_file
+            # memory mapped, so only the parts that are read are loaded
+            self._file = netcdf_file(path, 'r', mmap=True)
+        else:
+            raise ValueError('{:s} is not a netCDF file'.format(path))
+        self.variables = self._file.variables
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        # scipy won't unmap the file while its variables are still around
+        self.variables = None
+        self._file.variables.clear()
+        self._file.close()
+
+    def attribute(self, name, attr, default=None):
+        value = getattr(self.variables[name], 'attrs', None)
+        value = value.get(attr, default) if value is not None else getattr(self.variables[name], attr, default)
+        return value.decode() if isinstance(value, bytes) else value
+
+    def chunks(self, names, chunk_rows=CHUNK_ROWS):
+        """
+        Variables along the same dimension (e.g. time, flux and flag) read
+        together CHUNK_ROWS rows at a time, a dict of name: values for each
+        chunk. Strings (and netCDF3 char arrays) are str, fill values NaN.
+        """
+        variables = [self.variables[name] for name in names]
+        fills = [self.attribute(name, '_FillValue') for name in names]
+        n = variables[0].shape[0] if len(variables[0].shape) else 1
+        for start in range(0, n, chunk_rows):
+            chunk = {}
+            for name, var, fill in zip(names, variables, fills):
+                values = np.array(var[start:start + chunk_rows])
+                if values.dtype.kind == 'S' and values.ndim == 2:
+                    values = values.view('S{:d}'.format(values.shape[1]))[:, 0]
+                if values.dtype.kind in 'SO':
+                    values = np.array([v.decode() if isinstance(v, bytes) else str(v) for v in values], dtype=object)
+                else:
+                    # netCDF3 is big endian, which pandas can't take
+                    values = values.astype(values.dtype.newbyteorder('='), copy=False)
+                    if values.dtype.kind == 'f' and fill is not None:
+                        values = np.where(values == fill, np.nan, values)
+                chunk[name] = values
+            yield chunk
+
+
+_UNITS = {'days': 86400e9, 'hours': 3600e9, 'minutes': 60e9, 'seconds': 1e9,
+          'milliseconds': 1e6, 'microseconds': 1e3}
+
+
+def decode_times(values, units):
+    """
+    Times from numbers and CF units like 'seconds since 2000-01-01 12:00:00 UTC'.
+
+    Returns
+    -------
+    numpy.ndarray
+        datetime64[ns]
+    """
+    match = re.match(r'\s*(\w+)\s+since\s+(.+?)\s*(UTC|Z)?\s*$', units or '')
+    if match is None or match.group(1) not in _UNITS:
+        raise ValueError('can\'t read the time units {!r}'.format(units))
+    epoch = pd.Timestamp(match.group(2)).to_datetime64().astype('datetime64[ns]')
+    values = np.asarray(values, dtype=float)
+    times = epoch + np.round(values*_UNITS[match.group(1)]).astype(np.int64).astype('timedelta64[ns]')
+    return np.where(np.isfinite(values), times, np.datetime64('NaT'))
+
+
+def xrs_files(directory, satellite=None, pattern=r'\.nc$'):
+    """
+    The netCDF files in a directory in time order (by the dYYYYMMDD in the
+    name, then the name) for one satellite.
+
+    Parameters
+    ----------
+    satellite : ~int, optional
+        e.g. 16 for the files named ..._g16_..., needed if there are files of more than one.
+    """
+    files = sorted(os.path.join(directory, f) for f in os.listdir(directory) if re.search(pattern, f))
+    sats = {f: re.search(r'_g(\d+)_', os.path.basename(f)) for f in files}
+    sats = {f: int(m.group(1)) if m else None for f, m in sats.items()}
+    found = set(sats.values()) - {None}
+    if satellite is not None:
+        files = [f for f in files if sats[f] == satellite]
+    elif len(found) > 1:
+        raise ValueError('files of more than one satellite ({}), pick one'.format(sorted(found)))
+
+    def day(f):
+        m = re.search(r'_d(\d{8})', os.path.basename(f))
+        return (m.group(1) if m else '', os.path.basename(f))
+    return sorted(files, key=day)
+
+
+def _summary_records(nc, chunk_rows):
+    # the records of a flare summary, read a chunk at a time (there are a
+    # few per flare, so they're small)
+    names = ['time', 'status', 'flare_counter'] + [n for n in ('flare_class', 'xrsb_flux') if n in nc.variables]
+    units = nc.attribute('time', 'units')
+    records = []
+    for chunk in nc.chunks(names, chunk_rows=chunk_rows):
+        records.append(pd.DataFrame({'time': decode_times(chunk['time'], units), 'status': chunk['status'],
+                                     'counter': chunk['flare_counter'],
+                                     'flare_class': chunk.get('flare_class', ''),
+                                     'flux': chunk.get('xrsb_flux', np.nan)}))
+    return pd.concat(records, ignore_index=True) if records else pd.DataFrame(
+        columns=['time', 'status', 'counter', 'flare_class', 'flux'])
+
+
+def _minute_flux(nc, flux_variable, flag_variable, chunk_rows):
+    # the 1-min mean flux of a light curve (1-s or any other cadence), the
+    # sums and counts of each minute added up a chunk at a time
+    names = ['time', flux_variable] + ([flag_variable] if flag_variable in nc.variables else [])
+    units = nc.attribute('time', 'units')
+    minutes, sums, counts = np.array([], dtype=np.int64), np.array([]), np.array([])
+    for chunk in nc.chunks(names, chunk_rows=chunk_rows):
+        times = decode_times(chunk['time'], units)
+        flux = chunk[flux_variable].astype(float)
+        if flag_variable in chunk:
+            flux[chunk[flag_variable] != 0] = np.nan
+        good = ~np.isnat(times)
+        flux = flux[good]
+        ok = np.isfinite(flux) & (flux > 0)
+        # the minutes with only bad samples are kept (as NaN), so the gaps show
+        minutes, index = np.unique(np.r_[minutes, times[good].astype('datetime64[m]').astype(np.int64)],
+                                   return_inverse=True)
+        index_old, index_new = index[:len(sums)], index[len(sums):]
+        sums = np.bincount(index_old, sums, len(minutes)) + np.bincount(index_new, np.where(ok, flux, 0.),
+                                                                          len(minutes))
+        counts = np.bincount(index_old, counts, len(minutes)) + np.bincount(index_new, ok, len(minutes))
+    if len(minutes) == 0:
+        return np.array([], dtype='datetime64[ns]'), np.array([])
+    # every minute between the first and the last
+    flux = np.full(minutes[-1] - minutes[0] + 1, np.nan)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        flux[minutes - minutes[0]] = np.where(counts > 0, sums/counts, np.nan)
+    times = (minutes[0] + np.arange(len(flux))).astype('datetime64[m]')
+    return times.astype('datetime64[ns]'), flux
+
+
+def _decode_file(args):
+    # in the pool: read what's needed from one file, a chunk at a time. Flare
+    # summaries give their records, light curves the 1-min XRS-B flux.
+    path, flux_variable, flag_variable, chunk_rows = args
+    with _NetCDF(path) as nc:
+        if 'status' in nc.variables and 'flare_counter' in nc.variables:
+            return 'summary', _summary_records(nc, chunk_rows)
+        return 'lightcurve', _minute_flux(nc, flux_variable, flag_variable, chunk_rows)
+
+
+###################
+# the flares
+
+def summary_flares(records):
+    """
+    The flares of the flare summary records: the start, peak and end times
+    of each flare_counter and the class at the peak. Flares without all
+    three (e.g. at the end of the last file) are left out.
+    """
+    records = records.sort_values('time', kind='stable')
+    columns = {}
+    for status, name in [('EVENT_START', 'start'), ('EVENT_PEAK', 'peak'), ('EVENT_END', 'end')]:
+        rows = records[records['status'].str.strip().str.upper() == status]
+        columns[name] = rows.drop_duplicates('counter').set_index('counter')
+    flares = pd.DataFrame({'start': columns['start']['time'], 'end': columns['end']['time']})
+    peak = columns['peak']
+    flares = flares.join(peak[['time', 'flare_class', 'flux']].rename(columns={'time': 'peak'}), how='right')
+    # the class from the flux where the summary doesn't have it
+    missing = flares['flare_class'].fillna('').astype(str).str.strip() == ''
+    flares.loc[missing, 'flare_class'] = goes_class_name(flares.loc[missing, 'flux'].values)
+    flares = flares.dropna(subset=['start', 'peak', 'end'])
+    return pd.DataFrame({'start': flares['start'].values, 'peak': flares['peak'].values,
+                         'end': flares['end'].values, 'fl_goescls': flares['flare_class'].values})
+
+
+def open_summary_records(records, max_minutes=MAX_FLARE_MINUTES):
+    """
+    The flare summary records of the flares that haven't ended yet, to be
+    put in front of the records of the next file. A flare without an end
+    for more than `max_minutes` before the last record is dropped.
+    """
+    status = records['status'].str.strip().str.upper()
+    ended = records.loc[status == 'EVENT_END', 'counter']
+    records = records[~records['counter'].isin(ended)]
+    if len(records) == 0:
+        return records
+    last_seen = records.groupby('counter')['time'].transform('max')
+    return records[last_seen >= records['time'].max() - np.timedelta64(max_minutes, 'm')]
+
+
+def detect_flares(times, flux, rise_minutes=RISE_MINUTES, start_ratio=START_RATIO,
+                  max_minutes=MAX_FLARE_MINUTES):
+    """
+    Find the flares in an XRS-B 1-min light curve with the NOAA SWPC
+    definition: a flare starts at the first of `rise_minutes` minutes of
+    rising flux where the last is at least `start_ratio` times the first,
+    peaks at the highest flux before the end, and ends when the flux has
+    come back down half way between the peak and the start. Rises that
+    don't end within `max_minutes` are skipped.
+
+    Returns
+    -------
+    flares : pandas.DataFrame
+        start, peak, end and peak_flux of each flare that has ended.
+    resume : ~int
+        the index to carry on from with the next data: the start of a flare
+        that hasn't ended yet, or near the end of the data.
+    """
+    flux = np.asarray(flux, dtype=float)
+    n = len(flux)
+    k = rise_minutes - 1
+    if n <= k:
+        return pd.DataFrame(columns=['start', 'peak', 'end', 'peak_flux']), 0
+
+    # the minutes that start a rise (NaNs compare False so they break a rise)
+    rising = flux[1:] > flux[:-1]
+    run = np.ones(n - k, dtype=bool)
+    for j in range(k):
+        run &= rising[j:n - k + j]
+    candidates = np.flatnonzero(run & (flux[k:] >= start_ratio*flux[:n - k]))
+
+    starts, peaks, ends = [], [], []
+    position = 0
+    for s in candidates:
+        if s < position:
+            continue
+        # the running peak after the start, the end is the first minute at or
+        # below half way between it and the start flux
+        after = flux[s:s + max_minutes + 1]
+        peak_flux = np.fmax.accumulate(after)
+        ended = np.flatnonzero(after <= (peak_flux + flux[s])/2)
+        ended = ended[ended > k]
+        if len(ended) == 0:
+            if len(after) > max_minutes:
+                continue
+            # still going on at the end of the data
+            return _flare_table(times, flux, starts, peaks, ends), s
+        e = s + ended[0]
+        starts.append(s)
+        peaks.append(s + np.nanargmax(flux[s:e]))
+        ends.append(e)
+        position = e
+
+    # a rise could still start in the last few minutes
+    return _flare_table(times, flux, starts, peaks, ends), max(position, n - k)
+
+
+def _flare_table(times, flux, starts, peaks, ends):
+    return pd.DataFrame({'start': times[starts], 'peak': times[peaks], 'end': times[ends],
+                         'peak_flux': flux[peaks]})
+
+
+def _lightcurve_flares(lightcurves):
+    # run the detection over the light curves in time order, carrying the
+    # data from the start of any flare still going on into the next one
+    flares = []
+    times, flux = np.array([], dtype='datetime64[ns]'), np.array([])
+    for t, f in lightcurves:
+        if len(times) and len(t) and t[0] - times[-1] > np.timedelta64(1, 'm'):
+            # a gap, so the carried over minutes are filled with NaN
+            gap = np.arange(times[-1] + np.timedelta64(1, 'm'), t[0], np.timedelta64(1, 'm'))
+            t, f = np.r_[gap, t], np.r_[np.full(len(gap), np.nan), f]
+        times, flux = np.r_[times, t], np.r_[flux, f]
+        found, resume = detect_flares(times, flux)
+        flares.append(found)
+        times, flux = times[resume:], flux[resume:]
+    flares = [f for f in flares if len(f)]
+    if not flares:
+        return pd.DataFrame(columns=['start', 'peak', 'end', 'fl_goescls'])
+    flares = pd.concat(flares, ignore_index=True)
+    flares['fl_goescls'] = goes_class_name(flares['peak_flux'].values)
+    return flares[['start', 'peak', 'end', 'fl_goescls']]
+
+
+def flare_list(flares, min_flux=C1_FLUX):
+    """
+    Turn a table of start, peak, end and fl_goescls into the columns of
+    since_1986_c1_solarcycle_flares.csv, keeping the flares of at least `min_flux`.
+    """
+    def iso(t, sep='T'):
+        return pd.to_datetime(pd.Series(t)).dt.strftime('%Y-%m-%d' + sep + '%H:%M:%S').values
+
+    table = pd.DataFrame({'event_starttime': iso(flares['start']), 'event_peaktime': iso(flares['peak']),
+                          'event_endtime': iso(flares['end']), 'fl_goescls': flares['fl_goescls'].values,
+                          # there's no active region in the XRS files
+                          'ar_noaanum': 0,
+                          'goes_class': goes_flux(flares['fl_goescls'].values),
+                          'flare_times': iso(flares['peak'], sep=' ')})
+    table = table[table['goes_class'] >= min_flux*(1 - 1e-9)]
+    table = table.sort_values('event_starttime', kind='stable').drop_duplicates('event_starttime')
+    return table[FLARE_LIST_COLUMNS].reset_index(drop=True)
+
+
+def read_flare_list(files, processes=None, flux_variable='xrsb_flux', flag_variable='xrsb_flag',
+                    min_flux=C1_FLUX, batch=None, chunk_rows=CHUNK_ROWS, mp_context=None):
+    """
+    Make a flare list from GOES XRS netCDF files.
+
+    Parameters
+    ----------
+    files : ~str or list of ~str
+        a directory (see `xrs_files`) or the files in time order. Flare
+        summary and light curve files can be mixed.
+    processes : ~int, optional
+        the number of processes decoding the files, by default the number of CPUs.
+        With 1 no pool is used.
+    flux_variable, flag_variable : ~str
+        the XRS-B flux and its quality flag (non zero is bad) in the light curve files.
+    min_flux : ~float
+        the smallest peak flux kept (C1.0 by default, as in the flare list csv).
+    batch : ~int, optional
+        the files decoded at a time, by default 4 per process.
+    chunk_rows : ~int
+        the rows of a file read at a time.
+
+    Returns
+    -------
+    pandas.DataFrame
+        with the columns of since_1986_c1_solarcycle_flares.csv.
+    """
+    if isinstance(files, str):
+        files = xrs_files(files)
+    processes = processes or os.cpu_count() or 1
+    batch = batch or 4*processes
+    args = [(f, flux_variable, flag_variable, chunk_rows) for f in files]
+
+    # the flares found so far, and the summary records of the flares still going on
+    tables, open_records = [], None
+
+    def lightcurves(decoded):
+        # the light curves of each batch, passed on to the flare detection as
+        # they come, and the flare summaries turned into flares file by file
+        nonlocal open_records
+        for kind, data in decoded:
+            if kind == 'summary':
+                records = data if open_records is None else pd.concat([open_records, data], ignore_index=True)
+                tables.append(summary_flares(records))
+                open_records = open_summary_records(records)
+            else:
+                yield data
+
+    def decode(pool):
+        for start in range(0, len(args), batch):
+            chunk = args[start:start + batch]
+            yield from (pool.map(_decode_file, chunk) if pool else map(_decode_file, chunk))
+
+    if processes > 1 and len(args) > 1:
+        with multiprocessing.get_context(mp_context).Pool(processes) as pool:
+            tables.append(_lightcurve_flares(lightcurves(decode(pool))))
+    else:
+        tables.append(_lightcurve_flares(lightcurves(decode(None))))
+
+    tables = [t for t in tables if len(t)]
+    if not tables:
+        return pd.DataFrame(columns=FLARE_LIST_COLUMNS)
+    return flare_list(pd.concat(tables, ignore_index=True), min_flux=min_flux)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Make a flare list from GOES XRS netCDF files.')
+    parser.add_argument('directory')
+    parser.add_argument('--satellite', type=int, default=None, help='e.g. 16, if the directory has more than one')
+    parser.add_argument('--processes', type=int, default=None)
+    parser.add_argument('--output', default=None, help='csv file for the flare list')
+    parser.add_argument('--catalogue', default=None,
+                        help='add the flares to this flare catalogue (see catalogue.py)')
+    args = parser.parse_args()
+
+    flares = read_flare_list(xrs_files(args.directory, satellite=args.satellite), processes=args.processes)
+    print('{:d} flares'.format(len(flares)))
+    if args.output:
+        flares.to_csv(args.output, index=False)
+    if args.catalogue:
+        from catalogue import Catalogue
+        print(Catalogue(args.catalogue, kind='flare').add(flares))
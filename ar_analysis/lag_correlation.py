@@ -0,0 +1,313 @@
+import numpy as np
+import pandas as pd
+from multiprocessing import Pool
+from spectral import fill_gaps, _cached, SPECTRAL_CACHE_DIR, MAX_BATCH_SIZE
+from flare_match import goes_class_letter
+
+# Lag correlation of the flare rate with the sunspot number, e.g. the daily
+# or monthly number of C, M and X flares in since_1986_c1_solarcycle_flares.csv
+# against the SILSO daily or monthly sunspot number:
+#
+#   rates = flare_rates(flares, freq='M')
+#   result = lag_correlation(rates['M'], ssn['ssn'], n_surrogates=5000)
+#
+# The Pearson correlation at every lag comes from a handful of FFTs rather
+# than a loop over the lags: the sums over the pairs of samples at each lag
+# (of x, y, x^2, y^2, xy and the number of pairs) are each a cross
+# correlation, so missing values (NaN) are just left out of the pairs.
+#
+# The significance comes from phase randomised surrogates of the flare rate
+# (the same power spectrum, so the same autocorrelation, but random phases):
+# the fraction of surrogates with a correlation as large as the one found,
+# at each lag and for the largest over all the lags. The surrogates are
+# split into tasks of SURROGATE_CHUNK on a pool of processes.
+
+# surrogates per task, each task has its own seed so the result doesn't
+# depend on the number of processes
+SURROGATE_CHUNK = 250
+
+# the correlation is only looked at where at least this fraction of the
+# samples are in pairs (by default)
+MIN_OVERLAP = 0.5
+
+
+def flare_rates(flares, freq='D', classes=('C', 'M', 'X'), time_column='event_peaktime',
+                flux_column='goes_class', start=None, end=None):
+    """
+    The number of flares of each GOES class, and of all of them, per day or per month.
+
+    Parameters
+    ----------
+    flares : ~pandas.DataFrame
+        e.g. since_1986_c1_solarcycle_flares.csv.
+    freq : ~str
+        'D' for daily or 'M' for monthly rates.
+    start, end : ~str, optional
+        the first and last day (or month), by default those of the flares.
+
+    Returns
+    -------
+    pandas.DataFrame
+        indexed by `times` like `silso.read_silso` (the day, or the first of
+        the month), with a column for each class and 'all'.
+    """
+    unit = 'D' if freq == 'D' else 'M'
+    bins = pd.to_datetime(flares[time_column]).values.astype('datetime64[{:s}]'.format(unit))
+    good = ~np.isnat(bins)
+    start = np.datetime64(pd.Timestamp(start), unit) if start is not None else bins[good].min()
+    end = np.datetime64(pd.Timestamp(end), unit) if end is not None else bins[good].max()
+    n = max(int((end - start).astype(np.int64)) + 1, 0)
+
+    k = np.where(good, (bins - start).astype(np.int64), -1)
+    inside = good & (k >= 0) & (k < n)
+    letters = goes_class_letter(flares[flux_column].values)
+    rates = {c: np.bincount(k[inside & (letters == c)], minlength=n) for c in classes}
+    rates['all'] = np.bincount(k[inside], minlength=n)
+    index = pd.DatetimeIndex((start + np.arange(n)).astype('datetime64[ns]'), name='times')
+    return pd.DataFrame(rates, index=index)
+
+
+def _aligned(x, y):
+    # the two series on their common times (or as they are, for arrays)
+    if isinstance(x, pd.Series) and isinstance(y, pd.Series):
+        both = pd.concat([x.rename('x'), y.rename('y')], axis=1, join='inner').sort_index()
+        return both['x'].values.astype(float), both['y'].values.astype(float), both.index
+    x, y = np.asarray(x, dtype=float), np.asarray(y, dtype=float)
+    if len(x) != len(y):
+        raise ValueError('x and y have different lengths ({:d} and {:d})'.format(len(x), len(y)))
+    return x, y, None
+
+
+def _centred(values):
+    # the values less their mean with 0 for the missing ones, and where they're there
+    there = np.isfinite(values)
+    centred = np.where(there, values - (values[there].mean() if there.any() else 0.), 0.)
+    return centred, there.astype(float)
+
+
+def _lag_sums(a_fft, b_fft_conj, n_fft, lags):
+    # sum over t of a[t + k]*b[t] at each lag k
+    return np.fft.irfft(a_fft*b_fft_conj, n_fft)[..., lags % n_fft]
+
+
+def _window_sums(values, lags):
+    # sum of values[t + k] over the t with both t and t + k in the series, at
+    # each lag k (the same as _lag_sums with a b that has no gaps)
+    n = values.shape[-1]
+    sums = np.concatenate([np.zeros(values.shape[:-1] + (1,)), np.cumsum(values, axis=-1)], axis=-1)
+    return sums[..., np.minimum(n, n + lags)] - sums[..., np.maximum(lags, 0)]
+
+
+def _pearson(n, sx, sy, sxx, syy, sxy):
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return (n*sxy - sx*sy)/np.sqrt((n*sxx - sx**2)*(n*syy - sy**2))
+
+
+def _surrogate_chunk(args):
+    # the largest |r| over the lags of each of n_surrogates surrogates, and at
+    # each lag the number with |r| at least the one found and the sum of r^2
+    fixed, n_surrogates, seed = args
+    amplitude, x_there, n, n_fft, lags, y_fft = fixed['amplitude'], fixed['x_there'], fixed['n'], \
+        fixed['n_fft'], fixed['lags'], fixed['y_fft']
+    valid, r_found = fixed['valid'], np.abs(fixed['r'])
+    rng = np.random.default_rng(seed)
+
+    peaks = np.empty(n_surrogates)
+    exceed = np.zeros(len(lags), dtype=np.int64)
+    sum_squares = np.zeros(len(lags))
+    batch = max(1, MAX_BATCH_SIZE//n_fft)
+    for k in range(0, n_surrogates, batch):
+        m = min(batch, n_surrogates - k)
+        phases = rng.uniform(0, 2*np.pi, (m, len(amplitude)))
+        # the zero (and Nyquist) frequency keep their phase so the surrogate is real
+        phases[:, 0] = 0
+        if n % 2 == 0:
+            phases[:, -1] = 0
+        xs = np.fft.irfft(amplitude*np.exp(1j*phases), n)*x_there
+        xs_fft = np.fft.rfft(xs, n_fft)
+        if fixed['y_complete']:
+            # the sums of x and x^2 are over a window at each lag, from cumulative sums
+            sx, sxx = _window_sums(xs, lags), _window_sums(xs**2, lags)
+        else:
+            sx = _lag_sums(xs_fft, y_fft['there'], n_fft, lags)
+            sxx = _lag_sums(np.fft.rfft(xs**2, n_fft), y_fft['there'], n_fft, lags)
+        r = _pearson(fixed['n_pairs'], sx, fixed['sy'], sxx, fixed['syy'], _lag_sums(xs_fft, y_fft['y'], n_fft, lags))
+        r = np.abs(np.where(valid, r, 0.))
+        peaks[k:k + m] = r.max(axis=1)
+        exceed += (r >= r_found).sum(axis=0)
+        sum_squares += (r**2).sum(axis=0)
+    return peaks, exceed, sum_squares
+
+
+def lag_correlation(x, y, max_lag=None, min_pairs=None, n_surrogates=1000, level=0.95, seed=0,
+                    processes=None, cache_dir=SPECTRAL_CACHE_DIR):
+    """
+    The correlation of x (e.g. a flare rate) with y (e.g. the sunspot
+    number) at every lag, r(k) = corr(x[t + k], y[t]), so a positive lag is
+    x coming after y. With phase randomised surrogates of x for the
+    significance.
+
+    Parameters
+    ----------
+    x, y : ~pandas.Series or array
+        evenly sampled, missing values as NaN. Series are put on their
+        common times, arrays have to be the same length.
+    max_lag : ~int, optional
+        the largest lag (in samples), by default all of them.
+    min_pairs : ~int, optional
+        lags with fewer pairs than this are left out of the peak and the
+        significance (r is still given), by default MIN_OVERLAP of the samples.
+    n_surrogates : ~int
+        the number of surrogates, 0 for none.
+    level : ~float
+        the significance level of `threshold`.
+    seed : ~int
+        seed of the surrogates, the same seed gives the same result for any
+        number of processes.
+    processes : ~int, optional
+        number of worker processes, defaults to the number of cpus. With 1 no pool is used.
+
+    Returns
+    -------
+    dict
+        'lags' (samples), 'r' and 'n_pairs' at each lag, the 'peak_lag' and
+        'peak_r' (largest |r|) of the lags with enough pairs and, from the
+        surrogates, 'p' (the fraction with |r| at least as large at each
+        lag), 'sigma' (their rms r at each lag), 'p_peak' (the fraction
+        with a larger peak |r| at any lag) and 'threshold' (the peak |r|
+        that `level` of them are below).
+    """
+    x, y, _ = _aligned(x, y)
+    n = len(x)
+    max_lag = n - 1 if max_lag is None else min(int(max_lag), n - 1)
+    min_pairs = int(np.ceil(MIN_OVERLAP*n)) if min_pairs is None else min_pairs
+
+    def compute():
+        lags = np.arange(-max_lag, max_lag + 1)
+        # long enough that the lags don't wrap around
+        n_fft = 2**int(np.ceil(np.log2(n + max_lag + 1)))
+        x0, x_there = _centred(x)
+        y0, y_there = _centred(y)
+        y_fft = {'there': np.conj(np.fft.rfft(y_there, n_fft)), 'y': np.conj(np.fft.rfft(y0, n_fft))}
+        x_fft, x2_fft = np.fft.rfft(x0, n_fft), np.fft.rfft(x0**2, n_fft)
+        x_there_fft = np.fft.rfft(x_there, n_fft)
+
+        n_pairs = np.round(_lag_sums(x_there_fft, y_fft['there'], n_fft, lags))
+        sy = _lag_sums(x_there_fft, y_fft['y'], n_fft, lags)
+        syy = _lag_sums(x_there_fft, np.conj(np.fft.rfft(y0**2, n_fft)), n_fft, lags)
+        r = _pearson(n_pairs, _lag_sums(x_fft, y_fft['there'], n_fft, lags), sy,
+                     _lag_sums(x2_fft, y_fft['there'], n_fft, lags), syy,
+                     _lag_sums(x_fft, y_fft['y'], n_fft, lags))
+        valid = (n_pairs >= max(min_pairs, 3)) & np.isfinite(r)
+        peak = np.argmax(np.where(valid, np.abs(r), -1.)) if valid.any() else None
+        result = dict(lags=lags, r=r, n_pairs=n_pairs.astype(np.int64),
+                      peak_lag=lags[peak] if peak is not None else np.nan,
+                      peak_r=r[peak] if peak is not None else np.nan)
+        if n_surrogates <= 0 or peak is None:
+            return result
+
+        # the surrogates have the amplitude spectrum of x with its gaps filled
+        filled, _ = fill_gaps(x)
+        fixed = dict(amplitude=np.abs(np.fft.rfft(filled - filled.mean())), x_there=x_there, n=n,
+                     n_fft=n_fft, lags=lags, y_fft=y_fft, y_complete=bool(y_there.all()),
+                     valid=valid, r=np.where(valid, r, 0.), n_pairs=n_pairs, sy=sy, syy=syy)
+        sizes = [min(SURROGATE_CHUNK, n_surrogates - k) for k in range(0, n_surrogates, SURROGATE_CHUNK)]
+        seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+        tasks = [(fixed, size, s) for size, s in zip(sizes, seeds)]
+        if processes == 1:
+            chunks = [_surrogate_chunk(task) for task in tasks]
+        else:
+            with Pool(processes) as pool:
+                chunks = pool.map(_surrogate_chunk, tasks)
+
+        peaks = np.concatenate([c[0] for c in chunks])
+        exceed = np.sum([c[1] for c in chunks], axis=0)
+        sum_squares = np.sum([c[2] for c in chunks], axis=0)
+        result.update(p=np.where(valid, (exceed + 1)/(n_surrogates + 1), np.nan),
+                      sigma=np.where(valid, np.sqrt(sum_squares/n_surrogates), np.nan),
+                      p_peak=((peaks >= abs(result['peak_r'])).sum() + 1)/(n_surrogates + 1),
+                      threshold=np.quantile(peaks, level), n_surrogates=n_surrogates)
+        return result
+
+    params = dict(max_lag=max_lag, min_pairs=min_pairs, n_surrogates=n_surrogates, level=level, seed=seed)
+    return _cached('lag_correlation', compute, [x, y], params, cache_dir)
+
+
+def flare_ssn_lags(flares, ssn, classes=('C', 'M', 'X', 'all'), start=None, end=None, **kwargs):
+    """
+    The `lag_correlation` of the rate of each class of flare with the
+    sunspot number, over the times both cover (or `start` to `end`).
+
+    Parameters
+    ----------
+    flares : ~pandas.DataFrame
+        e.g. since_1986_c1_solarcycle_flares.csv.
+    ssn : ~pandas.DataFrame
+        the SILSO daily or monthly file from `silso.read_silso`, the flare
+        rates are per day or per month to go with it.
+    **kwargs
+        passed on to `lag_correlation` and `flare_rates` (time_column, flux_column).
+
+    Returns
+    -------
+    dict
+        the result of each class.
+    """
+    rate_kwargs = {k: kwargs.pop(k) for k in ('time_column', 'flux_column') if k in kwargs}
+    freq = 'D' if 'day' in ssn.columns else 'M'
+    rates = flare_rates(flares, freq=freq, classes=[c for c in classes if c != 'all'], **rate_kwargs)
+    start = max(rates.index[0], ssn.index[0]) if start is None else pd.Timestamp(start)
+    end = min(rates.index[-1], ssn.index[-1]) if end is None else pd.Timestamp(end)
+    rates, ssn = rates.loc[start:end], ssn['ssn'].loc[start:end]
+    return {c: lag_correlation(rates[c], ssn, **kwargs) for c in classes}
+
+
+def cycle_lags(flares, ssn, cycles, numbers=None, **kwargs):
+    """
+    `flare_ssn_lags` within each solar cycle.
+
+    Parameters
+    ----------
+    cycles : ~pandas.DataFrame
+        the cycles from `solar_cycles.solar_cycles`.
+    numbers : list of ~int, optional
+        the cycles to do, by default all the ones with flares.
+
+    Returns
+    -------
+    dict
+        {cycle number: {class: result}}.
+    """
+    times = pd.to_datetime(flares[kwargs.get('time_column', 'event_peaktime')])
+    if numbers is None:
+        numbers = [n for n, row in cycles.iterrows()
+                   if (pd.isna(row.end) or row.end > times.min()) and row.start <= times.max()]
+    results = {}
+    for number in numbers:
+        row = cycles.loc[number]
+        # [start, end) of the cycle, within the data
+        start = max(row.start, times.min().floor('D'), ssn.index[0])
+        end = min(times.max(), ssn.index[-1]) if pd.isna(row.end) else row.end - pd.Timedelta('1ns')
+        end = min(end, times.max(), ssn.index[-1])
+        results[number] = flare_ssn_lags(flares, ssn, start=start, end=end, **kwargs)
+    return results
+
+
+def lag_table(results):
+    """
+    The peak lag, correlation and significance of a dict of results (from
+    `flare_ssn_lags`, or `cycle_lags` for one row per cycle and class) as a table.
+    """
+    rows = {}
+    for key, result in results.items():
+        if 'lags' not in result:
+            for cls, r in result.items():
+                rows[(key, cls)] = r
+        else:
+            rows[key] = result
+    columns = ['peak_lag', 'peak_r', 'p_peak', 'threshold', 'n_surrogates']
+    table = pd.DataFrame([{c: float(np.asarray(r[c])) if c in r else np.nan for c in columns}
+                          for r in rows.values()], index=list(rows.keys()), columns=columns)
+    if isinstance(table.index, pd.MultiIndex):
+        table.index.names = ['cycle', 'class']
+    return table
@@ -0,0 +1,120 @@
+from functools import lru_cache
+import numpy as np
+import pandas as pd
+import sunpy.map
+from sunpy.coordinates import frames
+from astropy.coordinates import SkyCoord
+from astropy.wcs import WCS
+from astropy import units as u
+from projection import hgs_to_pixel
+
+# Headers, WCS and heliographic grid lines for the map plots. Nothing here
+# needs the data of the map, so no data arrays are allocated (the map uses a
+# broadcast zero array). Everything is cached on (day, scale, shape). The
+# grid lines are projected with numpy from the header (see projection.py)
+# rather than with the astropy coordinate transforms.
+
+# longitudes/latitudes of the grid lines and the latitudes that are labelled
+GRID_VALUES = (-60, -45, -30, -15, 0, 15, 30, 45, 60)
+LABEL_LATS = (-45, -30, -15, 0, 15, 30, 45)
+
+
+def _day(obstime):
+    # the observer hardly moves in a day, so everything is keyed on the day
+    return pd.Timestamp(obstime).strftime('%Y-%m-%d')
+
+
+def _zeros(shape):
+    # a read-only array of zeros that doesn't take any memory
+    return np.broadcast_to(np.float64(0), shape)
+
+
+@lru_cache(maxsize=256)
+def _header(day, scale, shape):
+    coord = SkyCoord(0*u.arcsec, 0*u.arcsec,
+                     frame=frames.Helioprojective(observer='Earth', obstime=day))
+    return sunpy.map.make_fitswcs_header(_zeros(shape), coord, scale=[scale, scale]*u.arcsec/u.pix)
+
+
+@lru_cache(maxsize=256)
+def _blank_map(day, scale, shape):
+    return sunpy.map.Map(_zeros(shape), _header(day, scale, shape))
+
+
+def map_header(obstime, scale=2, shape=(1500, 1500)):
+    """
+    Get the FITS-WCS header of an Earth-view helioprojective map centred on the Sun.
+
+    Parameters
+    ----------
+    obstime : ~str or ~datetime.datetime
+        the time of the map, rounded down to the day.
+    scale : ~float
+        the plate scale in arcsec per pixel.
+    shape : ~tuple
+        the shape of the map.
+
+    Returns
+    -------
+    sunpy.util.MetaDict
+        a copy of the cached header.
+    """
+    return _header(_day(obstime), float(scale), tuple(shape)).copy()
+
+
+def map_wcs(obstime, scale=2, shape=(1500, 1500)):
+    """
+    The astropy WCS for `map_header` (same parameters).
+    """
+    return WCS(map_header(obstime, scale=scale, shape=shape))
+
+
+def blank_map(obstime, scale=2, shape=(1500, 1500)):
+    """
+    A sunpy.map.Map with the `map_header` WCS to plot things on (same parameters).
+    The data is a broadcast array of zeros so it doesn't take up any memory.
+    The map is cached, so don't change it.
+    """
+    return _blank_map(_day(obstime), float(scale), tuple(shape))
+
+
+@lru_cache(maxsize=64)
+def _graticule(day, scale, shape, num_points):
+    header = _header(day, scale, shape)
+    values = np.array(GRID_VALUES, dtype=float)
+    n = len(values)
+
+    # lines of constant longitude (called lats in the plots) and of
+    # constant latitude (lons), all projected at once
+    lines = {'lats': (np.repeat(values, num_points), np.tile(np.linspace(-90, 90, num_points), n)),
+             'lons': (np.tile(np.linspace(-80, 80, num_points), n), np.repeat(values, num_points)),
+             'labels': (np.full(len(LABEL_LATS), 90.), np.array(LABEL_LATS, dtype=float))}
+    grid = {}
+    for name, (lon, lat) in lines.items():
+        x, y, _ = hgs_to_pixel(lon, lat, header)
+        grid[name] = np.stack([x, y], axis=-1)
+    grid['lats'] = grid['lats'].reshape(n, num_points, 2)
+    grid['lons'] = grid['lons'].reshape(n, num_points, 2)
+    return grid
+
+
+def graticule(obstime, scale=2, shape=(1200, 1200), num_points=100):
+    """
+    Heliographic (Stonyhurst) grid lines projected into the pixels of the
+    `map_header` map, to plot with ax.plot on the WCSAxes.
+
+    Parameters
+    ----------
+    obstime, scale, shape :
+        see `map_header`.
+    num_points : ~int
+        number of points along each grid line.
+
+    Returns
+    -------
+    dict
+        'lats': (9, num_points, 2) pixel x, y of the lines of constant longitude
+        in GRID_VALUES, 'lons': the same for constant latitude and 'labels':
+        (7, 2) pixels of the LABEL_LATS latitudes at the 90 degree longitude limb.
+    """
+    return _graticule(_day(obstime), float(scale), tuple(shape), num_points)
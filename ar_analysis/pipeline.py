@@ -0,0 +1,563 @@
+import os
+import re
+import ast
+import json
+import time
+import shutil
+import hashlib
+import argparse
+import functools
+import importlib
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+import numpy as np
+import pandas as pd
+import profiling
+
+# The whole workflow from the HEK to the movies as one command:
+#
+#   fetch -> merge -> cache -> aggregate -> render -> encode
+#
+#   python pipeline.py --fetch 1996-09-01 2010-01-01 --fetch 2010-01-01 2020-08-21
+#   python pipeline.py --input all_ar_2010-2020.csv --movie datapoints --frames 0 100
+#   python pipeline.py --input all_ar_2010-2020.csv --set butterfly.cmap=viridis --dry-run
+#
+# Each stage saves its outputs in <workdir>/<stage>/<key>/, where the key is
+# a hash of its parameters, the source of the modules it runs and the
+# content hashes of the outputs of the stages it depends on. A stage whose
+# key has already been done is skipped, so after changing only the colormap
+# of a movie only its frames and its video are made again, and after
+# refetching data that turns out to be the same nothing after the fetch is
+# redone. Stages whose inputs are ready run at the same time (on threads,
+# the fetches wait on the HEK and the renders share out the worker processes).
+
+PIPELINE_DIR = './pipeline/'
+
+# the windows of ar_data.py
+FETCH_RANGES = [('1986-09-01', '1996-09-01'),
+                ('1996-09-01', '2010-01-01'),
+                ('2010-01-01', '2020-08-21')]
+
+# the movies, `since` has to be what the dataset() of the module uses
+MOVIES = {'datapoints': dict(module='plotting_ar', function='plot_as_datapoints', since=None,
+                             filename='test_{:04d}.png', outfile='test_mov2.mp4', kwargs={}),
+          'butterfly': dict(module='active_region_movie', function='plot_ar_butterfly', since='2008-01-01',
+                            filename='test_2_{:04d}.png', outfile='test_mov23.mp4',
+                            kwargs=dict(cmap='binary_r'))}
+
+_HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def _hash_npz(h, name):
+    # np.savez puts the time in the zip entries, so it's the arrays that are hashed
+    with np.load(name) as f:
+        for key in sorted(f.files):
+            values = np.ascontiguousarray(f[key])
+            h.update(repr((key, values.dtype.str, values.shape)).encode())
+            h.update(values.tobytes())
+
+
+def hash_files(paths):
+    """
+    sha1 of the contents of files (and of all the files in directories), in
+    the order given. For .npz files it's the arrays in them.
+    """
+    h = hashlib.sha1()
+    for path in paths:
+        if os.path.isdir(path):
+            files = sorted(os.path.join(d, f) for d, _, names in os.walk(path) for f in names)
+        else:
+            files = [path]
+        for name in files:
+            h.update(os.path.relpath(name, path if os.path.isdir(path) else os.path.dirname(path)).encode())
+            if name.endswith('.npz'):
+                _hash_npz(h, name)
+                continue
+            with open(name, 'rb') as f:
+                for block in iter(functools.partial(f.read, 2**20), b''):
+                    h.update(block)
+    return h.hexdigest()
+
+
+def _local_imports(module):
+    # the modules of this directory a module imports, anywhere in it (the
+    # plot functions import some of theirs when they're called)
+    with open(os.path.join(_HERE, module + '.py')) as f:
+        tree = ast.parse(f.read())
+    names = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            names.update(alias.name.split('.')[0] for alias in node.names)
+        elif isinstance(node, ast.ImportFrom) and node.level == 0 and node.module:
+            names.add(node.module.split('.')[0])
+    return {n for n in names if os.path.exists(os.path.join(_HERE, n + '.py'))}
+
+
+def code_modules(modules):
+    """
+    The modules and the modules of this directory they import, directly or
+    not, sorted. The imports of pipeline itself aren't followed, as it
+    imports the modules of all the stages.
+    """
+    found, todo = set(), list(modules)
+    while todo:
+        module = todo.pop()
+        if module in found:
+            continue
+        found.add(module)
+        if module != 'pipeline':
+            todo.extend(_local_imports(module) - found)
+    return sorted(found)
+
+
+def _source_hash(modules):
+    # the code of a stage and everything it imports, so editing e.g.
+    # plotting_ar.py or stream_render.py renders the frames again
+    return hash_files([os.path.join(_HERE, m + '.py') for m in code_modules(modules)]) if modules else ''
+
+
+class Stage:
+    """
+    A step of the pipeline.
+
+    Parameters
+    ----------
+    name : ~str
+        unique name, e.g. 'render:butterfly'.
+    run : function
+        called as run(outdir, inputs, **params) where inputs is a dict of the
+        outputs of `deps` by name. It writes its outputs in outdir and returns
+        the list of the output paths.
+    params : ~dict
+        the parameters, they go into the key so they have to have a stable repr.
+    deps : list of ~str
+        the names of the stages this one needs.
+    code : list of ~str
+        the modules the stage runs, their source and that of the modules
+        they import (see `code_modules`) goes into the key.
+    pool : ~bool
+        the stage runs a pool of processes, run is also given its share of
+        the pipeline's processes as `processes` (not part of the key).
+    """
+
+    def __init__(self, name, run, params=None, deps=(), code=(), pool=False):
+        self.name = name
+        self.run = run
+        self.params = params or {}
+        self.deps = list(deps)
+        self.code = list(code)
+        self.pool = pool
+
+    def key(self, input_hashes):
+        h = hashlib.sha1()
+        h.update(repr((self.name, sorted(self.params.items()), sorted(input_hashes.items()),
+                       _source_hash(self.code))).encode())
+        return h.hexdigest()[:16]
+
+    def outdir(self, workdir, key):
+        return os.path.join(workdir, self.name.replace(':', '_'), key)
+
+
+def _manifest_path(outdir):
+    return os.path.join(outdir, 'stage.json')
+
+
+def _read_manifest(outdir):
+    # the record of a finished stage, None if it hasn't finished or an output has gone
+    path = _manifest_path(outdir)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        manifest = json.load(f)
+    if not all(os.path.exists(p) for p in manifest['outputs']):
+        return None
+    return manifest
+
+
+def run_stage(stage, inputs, workdir=PIPELINE_DIR, force=False, dry_run=False, processes=None):
+    """
+    Run a stage, or get its outputs from a previous run.
+
+    Parameters
+    ----------
+    inputs : ~dict
+        the results of the stages it depends on.
+    processes : ~int, optional
+        the processes a `pool` stage can use.
+
+    Returns
+    -------
+    dict
+        name, key, outputs, hash (of the output contents), cached and seconds.
+    """
+    key = stage.key({name: inputs[name]['hash'] for name in stage.deps})
+    outdir = stage.outdir(workdir, key)
+    manifest = None if force else _read_manifest(outdir)
+    if manifest is not None or dry_run:
+        return dict(name=stage.name, key=key, outdir=outdir, cached=manifest is not None, seconds=0.,
+                    outputs=manifest['outputs'] if manifest else [],
+                    hash=manifest['hash'] if manifest else key)
+
+    os.makedirs(outdir, exist_ok=True)
+    t0 = time.time()
+    extra = dict(processes=processes) if stage.pool else {}
+    with profiling.stage('pipeline.' + stage.name):
+        outputs = stage.run(outdir, {name: inputs[name] for name in stage.deps}, **dict(stage.params, **extra))
+    manifest = dict(name=stage.name, key=key, params=repr(sorted(stage.params.items())),
+                    deps={name: inputs[name]['hash'] for name in stage.deps},
+                    outputs=outputs, hash=hash_files(outputs), seconds=time.time() - t0)
+    # written last (and atomically), so an interrupted stage is run again
+    with open(_manifest_path(outdir) + '.part', 'w') as f:
+        json.dump(manifest, f, indent=1)
+    os.replace(_manifest_path(outdir) + '.part', _manifest_path(outdir))
+    return dict(manifest, outdir=outdir, cached=False)
+
+
+def run_pipeline(stages, workdir=PIPELINE_DIR, jobs=2, processes=None, force=(), dry_run=False, verbose=True):
+    """
+    Run the stages, each as soon as the ones it depends on are done, up to
+    `jobs` at a time.
+
+    Parameters
+    ----------
+    stages : list of `Stage`
+    processes : ~int, optional
+        the worker processes of all the `pool` stages (e.g. the renders)
+        together, split evenly between the ones that can run at the same
+        time so they don't each take every cpu. Defaults to the number of cpus.
+    force : list of ~str
+        run these stages (names, or the part before the ':' for all of a
+        kind, e.g. 'render') even if they've been done.
+    dry_run : ~bool
+        only work out what would be run. The stages after one that would be
+        run are shown as to be run too, though they may turn out the same.
+
+    Returns
+    -------
+    dict
+        the result of `run_stage` for each stage by name.
+    """
+    by_name = {s.name: s for s in stages}
+    for s in stages:
+        missing = [d for d in s.deps if d not in by_name]
+        if missing:
+            raise ValueError('stage {:s} needs {:s}, which is not in the pipeline'.format(s.name, missing[0]))
+
+    def forced(s):
+        return s.name in force or s.name.split(':')[0] in force
+
+    at_once = min(jobs, sum(s.pool for s in stages)) or 1
+    share = max(1, (processes or os.cpu_count() or 1)//at_once)
+
+    results, running = {}, {}
+    todo = list(stages)
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        while todo or running:
+            for s in [s for s in todo if all(d in results for d in s.deps)]:
+                todo.remove(s)
+                # in a dry run a stage after one that would run can't be checked
+                stale = dry_run and any(not results[d]['cached'] for d in s.deps)
+                if stale:
+                    results[s.name] = dict(name=s.name, key='?', cached=False, outputs=[], hash=None,
+                                           seconds=0.)
+                    continue
+                running[pool.submit(run_stage, s, results, workdir=workdir, force=forced(s),
+                                    dry_run=dry_run, processes=share)] = s
+            if not running:
+                continue
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                s = running.pop(future)
+                results[s.name] = future.result()
+                if verbose:
+                    r = results[s.name]
+                    status = 'cached' if r['cached'] else ('to run' if dry_run else 'ran in {:.1f} s'.format(
+                        r['seconds']))
+                    print('{:<22s} {:<16s} {:s}'.format(s.name, r['key'], status))
+    return results
+
+
+########-----------------------------------------------##########
+#   The stages
+########-----------------------------------------------##########
+
+
+def fetch_stage(outdir, inputs, tstart, tend, freq='MS', hek_cache='./hek_cache/'):
+    # imported here, sunpy is only needed to fetch
+    from ar_data import fetch_ar_data
+    outfile = os.path.join(outdir, 'ar_{:s}_{:s}.csv'.format(tstart, tend))
+    fetch_ar_data(tstart, tend, freq=freq, cache_dir=hek_cache).to_csv(outfile, index=False)
+    return [outfile]
+
+
+def input_stage(outdir, inputs, filename, content):
+    # a csv that's already there, `content` (its hash) is in the params so
+    # the stage is redone when the file changes
+    return [os.path.abspath(filename)]
+
+
+def _csv_records(path):
+    # the header and the rows of a csv as the bytes they are in the file, a
+    # row with a quoted line break in it being one record (blank lines are
+    # left out, as pandas does)
+    with open(path, 'rb') as f:
+        lines = f.read().splitlines(keepends=True)
+    records, current = [], b''
+    for line in lines:
+        current += line
+        if current.count(b'"') % 2 == 0:
+            if current.strip():
+                records.append(current if current.endswith(b'\n') else current + b'\n')
+            current = b''
+    if current:
+        records.append(current + b'\n')
+    return (records[0], records[1:]) if records else (None, [])
+
+
+def merge_stage(outdir, inputs, outfile='concat.csv'):
+    """
+    Concatenate the active region csvs of the fetch/input stages into one
+    file like concat_1996-2020.csv, in time order. The rows are copied as
+    they are in the files (with the header of the first), each file keeps
+    its own row order, and the events that are already in an earlier file
+    (the ones starting on the edge of two fetched ranges) are dropped. An
+    event is the same one as for `catalogue.Catalogue` (see
+    `catalogue.event_keys`). Unlike the catalogue, repeats within a file
+    are kept, as they are in the files the movies were made from.
+    """
+    from catalogue import CSV_TEXT, event_key_columns, event_keys
+    paths = [path for name in sorted(inputs) for path in inputs[name]['outputs']]
+    starts = {path: pd.read_csv(path, usecols=['event_starttime'])['event_starttime'].min() for path in paths}
+    paths = sorted((p for p in paths if isinstance(starts[p], str)), key=starts.get)
+
+    header, seen = None, set()
+    outfile = os.path.join(outdir, outfile)
+    with open(outfile, 'wb') as out:
+        for path in paths:
+            file_header, rows = _csv_records(path)
+            if header is None:
+                header = file_header
+                out.write(header)
+            elif file_header != header:
+                raise ValueError('{:s} has different columns from {:s}'.format(path, paths[0]))
+            table = pd.read_csv(path, **CSV_TEXT)
+            if len(table) != len(rows):
+                raise ValueError('can\'t line up the rows of {:s} with its records'.format(path))
+            keys = event_keys(table, event_key_columns('ar', table.columns))
+            new = ~pd.Series(keys).isin(seen).values
+            out.writelines(row for row, is_new in zip(rows, new) if is_new)
+            seen.update(keys)
+    return [outfile]
+
+
+def cache_stage(outdir, inputs):
+    # the columnar cache of data_cache goes next to the merged csv, where load_csv
+    # looks for it. Its manifest has the mtime of the csv, so the outputs (what
+    # the later stages' keys depend on) are the column files and a copy of the
+    # manifest without the file stamp, which are the same for the same csv.
+    from data_cache import build_cache, cache_dir_for
+    merged = inputs['merge']['outputs'][0]
+    build_cache(merged)
+    cache_dir = cache_dir_for(merged)
+    with open(os.path.join(cache_dir, 'manifest.json')) as f:
+        manifest = json.load(f)
+    columns_file = os.path.join(outdir, 'columns.json')
+    with open(columns_file, 'w') as f:
+        json.dump({k: v for k, v in manifest.items() if k not in ('size', 'mtime_ns')}, f, indent=1)
+    return [os.path.join(cache_dir, c['file']) for c in manifest['columns']] + [columns_file]
+
+
+def _merged_csv(inputs):
+    return inputs['merge']['outputs'][0]
+
+
+def aggregate_stage(outdir, inputs, since=None):
+    """
+    The per-day histograms and the butterfly raster of a movie (see
+    `ar_dataset.ARDataset.save_aggregates`) and the daily counts.
+    """
+    from ar_dataset import ARDataset
+    data = ARDataset(_merged_csv(inputs), since=since)
+    outfile = os.path.join(outdir, 'aggregates.npz')
+    data.save_aggregates(outfile)
+    counts = pd.DataFrame({'regions': data.counts.regions, 'spots': data.counts.spots,
+                           'wolf': data.counts.wolf})
+    counts_file = os.path.join(outdir, 'daily_counts.csv')
+    counts.to_csv(counts_file)
+    return [outfile, counts_file]
+
+
+def _use_pipeline_data(data_file, aggregates, module):
+    # in the render workers: point the plotting module at the merged csv and
+    # use the aggregates worked out in the aggregate stage
+    module.data_file = data_file
+    module.dataset().load_aggregates(aggregates)
+
+
+def render_stage(outdir, inputs, movie, frames=None, processes=None, kwargs=()):
+    """
+    Render the frames of a movie into outdir, see `render_frames.render_frames`.
+    Frames already in outdir (from an interrupted run) aren't rendered again.
+    """
+    from render_frames import render_frames, frame_path
+    from ar_dataset import get_dataset
+    config = MOVIES[movie]
+    module = importlib.import_module(config['module'])
+    data_file = _merged_csv(inputs)
+    aggregates = inputs['aggregate:' + movie]['outputs'][0]
+    if frames is None:
+        frames = range(len(get_dataset(data_file, since=config['since']).time_over))
+    else:
+        frames = range(*frames)
+
+    render_frames(getattr(module, config['function']), frames, savedir=outdir + '/',
+                  filename=config['filename'], processes=processes, mp_context='spawn',
+                  worker_init=functools.partial(_use_pipeline_data, os.path.abspath(data_file),
+                                                os.path.abspath(aggregates)),
+                  **dict(kwargs))
+    return [frame_path(outdir, config['filename'], i) for i in frames]
+
+
+def encode_stage(outdir, inputs, movie, fps=10):
+    from render_frames import encode_movie
+    config = MOVIES[movie]
+    rendered = inputs['render:' + movie]
+    frames = [int(re.search(r'(\d+)\.png$', path).group(1)) for path in rendered['outputs']]
+    if frames != list(range(frames[0], frames[0] + len(frames))):
+        raise ValueError('the frames of {:s} are not consecutive, not making the movie'.format(movie))
+    outfile = os.path.join(outdir, config['outfile'])
+    encode_movie(range(frames[0], frames[0] + len(frames)), outfile, savedir=rendered['outdir'],
+                 filename=config['filename'], fps=fps)
+    if not os.path.exists(outfile):
+        raise RuntimeError('ffmpeg did not make {:s}'.format(outfile))
+    return [outfile]
+
+
+def build_stages(fetch=(), inputs=(), movies=tuple(MOVIES), frames=None, fps=10,
+                 settings=None, hek_cache='./hek_cache/'):
+    """
+    The stages for fetching (or reading) the data and making the movies.
+
+    Parameters
+    ----------
+    fetch : list of (tstart, tend)
+        time ranges to get from the HEK.
+    inputs : list of ~str
+        active region csv files to use as well as (or instead of) fetching.
+    movies : list of ~str
+        which of MOVIES to make.
+    frames : ~tuple, optional
+        (start, stop[, step]) of the frames to render, by default all of them.
+    settings : ~dict, optional
+        extra keyword arguments of the plot function of each movie, e.g.
+        {'butterfly': {'cmap': 'viridis'}}.
+
+    Returns
+    -------
+    list of `Stage`
+    """
+    settings = settings or {}
+    stages = []
+    for tstart, tend in fetch:
+        stages.append(Stage('fetch:{:s}_{:s}'.format(tstart, tend), fetch_stage, code=['ar_data'],
+                            params=dict(tstart=tstart, tend=tend, hek_cache=hek_cache)))
+    for filename in inputs:
+        stages.append(Stage('input:' + os.path.basename(filename), input_stage,
+                            params=dict(filename=filename, content=hash_files([filename]))))
+    if not stages:
+        raise ValueError('nothing to fetch or read')
+    # the merge is done here, it's quick and what comes after it only
+    # changes if the merged csv does
+    stages.append(Stage('merge', merge_stage, deps=[s.name for s in stages], code=['pipeline', 'catalogue']))
+    stages.append(Stage('cache', cache_stage, deps=['merge'], code=['data_cache']))
+
+    for movie in movies:
+        config = MOVIES[movie]
+        kwargs = dict(config['kwargs'], **settings.get(movie, {}))
+        # after the cache stage, as the dataset is read through the cache
+        stages.append(Stage('aggregate:' + movie, aggregate_stage, deps=['merge', 'cache'],
+                            params=dict(since=config['since']),
+                            code=['ar_dataset']))
+        stages.append(Stage('render:' + movie, render_stage, deps=['merge', 'cache', 'aggregate:' + movie],
+                            params=dict(movie=movie, frames=tuple(frames) if frames else None,
+                                        kwargs=tuple(sorted(kwargs.items()))),
+                            code=[config['module'], 'render_frames', 'ar_dataset'], pool=True))
+        stages.append(Stage('encode:' + movie, encode_stage, deps=['render:' + movie],
+                            params=dict(movie=movie, fps=fps), code=['render_frames']))
+    return stages
+
+
+def _parse_setting(text):
+    # 'butterfly.cmap=viridis' -> ('butterfly', 'cmap', 'viridis')
+    target, value = text.split('=', 1)
+    movie, name = target.split('.', 1)
+    if movie not in MOVIES:
+        raise argparse.ArgumentTypeError('unknown movie {:s}'.format(movie))
+    try:
+        value = ast.literal_eval(value)
+    except (ValueError, SyntaxError):
+        pass
+    return movie, name, value
+
+
+def clean(workdir, results):
+    """
+    Delete the stage outputs in workdir that aren't part of `results`.
+    """
+    keep = {os.path.abspath(r['outdir']) for r in results.values() if 'outdir' in r}
+    for stage_dir in sorted(os.listdir(workdir)):
+        for key in sorted(os.listdir(os.path.join(workdir, stage_dir))):
+            path = os.path.abspath(os.path.join(workdir, stage_dir, key))
+            if path not in keep:
+                shutil.rmtree(path)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Fetch the active region data and make the movies, '
+                                                 'only redoing the stages whose inputs have changed.')
+    parser.add_argument('--fetch', nargs=2, action='append', default=[], metavar=('TSTART', 'TEND'),
+                        help='a time range to get from the HEK (can be given more than once)')
+    parser.add_argument('--fetch-all', action='store_true', help='fetch the ranges of ar_data.py')
+    parser.add_argument('--input', action='append', default=[], help='an active region csv to use')
+    parser.add_argument('--movie', action='append', choices=list(MOVIES), help='the movies to make (default all)')
+    parser.add_argument('--frames', nargs='+', type=int, help='start stop [step] of the frames')
+    parser.add_argument('--set', action='append', default=[], type=_parse_setting, metavar='MOVIE.NAME=VALUE',
+                        help='a keyword argument of the plot function, e.g. butterfly.cmap=viridis')
+    parser.add_argument('--processes', type=int, default=None,
+                        help='processes rendering the movies, shared between the ones rendered at once')
+    parser.add_argument('--fps', type=int, default=10)
+    parser.add_argument('-j', '--jobs', type=int, default=2, help='stages run at once')
+    parser.add_argument('--workdir', default=PIPELINE_DIR)
+    parser.add_argument('--hek-cache', default='./hek_cache/')
+    parser.add_argument('--force', action='append', default=[],
+                        help='redo a stage even if it has been done, e.g. fetch or render:butterfly')
+    parser.add_argument('--until', choices=['merge', 'cache', 'aggregate', 'render', 'encode'],
+                        help='stop after this stage')
+    parser.add_argument('--dry-run', action='store_true', help='only show what would be run')
+    parser.add_argument('--clean', action='store_true', help='delete the outputs of older runs')
+    args = parser.parse_args(argv)
+
+    settings = {}
+    for movie, name, value in args.set:
+        settings.setdefault(movie, {})[name] = value
+    fetch = [tuple(r) for r in args.fetch] + (FETCH_RANGES if args.fetch_all else [])
+    stages = build_stages(fetch=fetch, inputs=args.input, movies=args.movie or list(MOVIES),
+                          frames=args.frames, fps=args.fps,
+                          settings=settings, hek_cache=args.hek_cache)
+    if args.until is not None:
+        order = ['fetch', 'input', 'merge', 'cache', 'aggregate', 'render', 'encode']
+        last = order.index(args.until)
+        stages = [s for s in stages if order.index(s.name.split(':')[0]) <= last]
+
+    import matplotlib
+    matplotlib.use('Agg')
+    results = run_pipeline(stages, workdir=args.workdir, jobs=args.jobs, processes=args.processes,
+                           force=args.force, dry_run=args.dry_run)
+    for name, r in results.items():
+        if name.startswith('encode:') and r['outputs']:
+            print(r['outputs'][0])
+    if args.clean and not args.dry_run:
+        clean(args.workdir, results)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,98 +1,94 @@
-import numpy as np
-import pandas as pd
-import matplotlib.pyplot as plt 
-from matplotlib import dates
-from matplotlib.colors import LogNorm
-from sunpy.time import parse_time
-from sunpy.coordinates import frames
-import sunpy.map
-from astropy.coordinates import SkyCoord
-from astropy import units as u
-import datetime
-import pylab
-# get all the data and adjust datetime etcs
-all_data = pd.read_csv('concat_1996-2020.csv')
-tt = pd.to_datetime(all_data['event_starttime'])
-times = [(t - tt[0]).total_seconds() for t in tt]
-all_data['times'] = times
-all_data['tt'] = tt
-all_data['area_arcsec'] = all_data['area_atdiskcenter']/(725**2)
-# get all unique days over the solar cycle
-tstart = parse_time(all_data['event_starttime'].min()).datetime
-tfinal = parse_time(all_data['event_endtime'].max()).datetime
-time_over = [tstart.strftime('%Y-%m-%dT%H:%M:%S')]
-t0 = tstart
-while t0 < tfinal:
-    t0 = t0 + datetime.timedelta(days=1)
-    time_over.append(t0.strftime('%Y-%m-%dT%H:%M:%S'))
-all_data_test = all_data.set_index('tt')
-
-# get number of spots etc as function of day
-spots = []
-no_ar = []
-for i in range(len(time_over)):
-    data_for_day = all_data[all_data['event_starttime'].isin([time_over[i]])]
-    no_spots = data_for_day['ar_numspots'].sum()
-    spots.append(no_spots)
-    no_ar.append(len(data_for_day))
-spots_ar = pd.Series(spots, index=parse_time(time_over).datetime)
-ar_no = pd.Series(no_ar, index=parse_time(time_over).datetime)
-ssn_tots = 10*ar_no+spots_ar
-
-# get SSN data
-def read_ssn():
-    ssn = pd.read_csv("../SN_m_tot_V2.0.csv", names=['year', 'month', 'decimal_date', \
-                                                  'ssn', 'ssn_dev', 'number_obs', 'indicator'], 
-             delimiter=';')
-    years = ssn['year'].values; months = ssn['month']
-    tt = [datetime.datetime(ssn['year'][i], ssn['month'][i], 1) for i in range(len(ssn))]
-
-
-    ssn['times'] = tt
-
-    return ssn.set_index('times')
-ssn = read_ssn()
-
-####------------------------------------------------------#####
-sc23 = all_data_test.truncate('1996-09-01', '2009-01-01')
-sc24 = all_data_test.truncate('2009-01-01', '2020-08-21')
-
-
-
-# create an empty sunpy.map.Map
-data_arr = np.zeros((1200, 1200))
-coord = SkyCoord(0*u.arcsec, 0*u.arcsec, frame=frames.Helioprojective(observer='Earth', obstime=time_over[i]))
-header = sunpy.map.make_fitswcs_header(data_arr, coord, scale=[2, 2]*u.arcsec/u.pix)
-mapy = sunpy.map.Map(data_arr, header)
+from functools import lru_cache
+from ar_dataset import get_dataset
+from silso import read_silso
+from profiling import profiled, checkpoint
 
+# None of the data is read in on import, it's all worked out the first
+# time it's used (see ar_dataset.ARDataset) and then kept. matplotlib,
+# sunpy and astropy are only imported when plotting.
+data_file = 'concat_1996-2020.csv'
 
-num_points = 100
-lat_value = [-60, -45, -30, -15, 0, 15, 30, 45, 60]*u.deg
-lon_value = [-60, -45, -30, -15, 0, 15, 30, 45, 60]*u.deg
-lats = []
-lons = []
 
-for l in range(len(lat_value)):
-    lat0 = SkyCoord(np.ones(num_points) * lat_value[l],
-                np.linspace(-90, 90, num_points) * u.deg,
-                frame=frames.HeliographicStonyhurst)
-    lon0 = SkyCoord(np.linspace(-80, 80, num_points) * u.deg,
-                np.ones(num_points) * lon_value[l], frame=frames.HeliographicStonyhurst)
-    lat00 = lat0.transform_to(mapy.coordinate_frame)
-    lon00 = lon0.transform_to(mapy.coordinate_frame)
-    lats.append(lat00)
-    lons.append(lon00)
-coords_test = []
-lat_value_plot = [-45, -30, -15, 0, 15, 30, 45]
-for l in lat_value_plot:
-    coords = SkyCoord(90*u.deg, l*u.deg, frame=frames.HeliographicStonyhurst).transform_to(mapy.coordinate_frame)
-    coords_test.append(mapy.world_to_pixel(coords))
-    
-
-
-def ploty(cmap='viridis', filename='ssn_viridis'):
+def dataset():
+    """
+    The active region data for the plots (an `ar_dataset.ARDataset`).
+    """
+    return get_dataset(data_file)
 
 
+@lru_cache(maxsize=None)
+def read_ssn():
+    # get SSN data
+    return read_silso("../SN_m_tot_V2.0.csv")
+
+
+@lru_cache(maxsize=None)
+def cycle_data(cycles=(23, 24)):
+    """
+    The active region data for each of the solar cycles, indexed by time.
+    The cycles are found from the sunspot number (see `solar_cycles`) and
+    the data is split up by cycle once in the dataset.
+    """
+    by_cycle = dataset().cycles
+    return tuple(by_cycle.cycle(n).set_index('tt') for n in cycles)
+
+
+@lru_cache(maxsize=None)
+def disk_grid():
+    """
+    An empty sunpy.map.Map and the heliographic grid lines (in pixels) for the disk plots.
+    """
+    from map_grid import blank_map, graticule
+    time_over = dataset().time_over
+    mapy = blank_map(time_over[-1], scale=2, shape=(1200, 1200))
+    grid = graticule(time_over[-1], scale=2, shape=(1200, 1200))
+    return mapy, grid
+
+
+# the old module level variables, now only worked out when they're asked for
+_lazy_globals = dict(all_data=lambda: dataset().all_data,
+                     time_over=lambda: dataset().time_over,
+                     tstart=lambda: dataset().tstart,
+                     tfinal=lambda: dataset().tfinal,
+                     all_data_test=lambda: dataset().all_data.set_index('tt'),
+                     ar_counts=lambda: dataset().counts,
+                     spots_ar=lambda: dataset().counts.spots,
+                     ar_no=lambda: dataset().counts.regions,
+                     ssn_tots=lambda: dataset().counts.wolf,
+                     ssn=read_ssn,
+                     sc23=lambda: cycle_data()[0],
+                     sc24=lambda: cycle_data()[1],
+                     mapy=lambda: disk_grid()[0],
+                     lats=lambda: disk_grid()[1]['lats'],
+                     lons=lambda: disk_grid()[1]['lons'],
+                     coords_test=lambda: disk_grid()[1]['labels'])
+
+
+def __getattr__(name):
+    if name in _lazy_globals:
+        return _lazy_globals[name]()
+    raise AttributeError('module {!r} has no attribute {!r}'.format(__name__, name))
+
+
+@profiled()
+def ploty(cmap='viridis', filename='ssn_viridis', cycles=(23, 24)):
+	import matplotlib.pyplot as plt
+	import pylab
+	from matplotlib import dates
+	from map_grid import LABEL_LATS
+	from projection import hpc_to_pixel
+
+	data = dataset()
+	# the two cycles on the disks, named sc23 and sc24 after the defaults
+	sc23, sc24 = cycle_data(tuple(cycles))
+	mapy, grid = disk_grid()
+	lats, lons, coords_test = grid['lats'], grid['lons'], grid['labels']
+	lat_value_plot = list(LABEL_LATS)
+	ar_counts, tstart, tfinal = data.counts, data.tstart, data.tfinal
+	# the points in pixels of the map, so the axes don't transform them
+	x23, y23 = hpc_to_pixel(sc23['hpc_x'].values, sc23['hpc_y'].values, mapy.meta)
+	x24, y24 = hpc_to_pixel(sc24['hpc_x'].values, sc24['hpc_y'].values, mapy.meta)
+	checkpoint('data')
 	    
 	fig = plt.figure(figsize=(8, 10))
 	# two maps side by side
@@ -110,51 +106,47 @@ def ploty(cmap='viridis', filename='ssn_viridis'):
 	sizey23 = 5*sc23['ar_numspots']
 	sizey24 = 5*sc24['ar_numspots']
 
-	##### FIRST SOLAR CYCLE 23 ########
+	##### FIRST SOLAR CYCLE (23) ########
 	# circle1 = plt.Circle((0, 0), 960, color='k', fill=False)
 	mapy.plot(axes=ax1a, alpha=0.0)
 	mapy.draw_limb(color='w', lw=0.8)
 	#mapy.draw_grid(color='k', lw=0.5)
-	ax1a.scatter((sc23['hpc_x'].values*u.arcsec).to(u.deg),
-				 (sc23['hpc_y'].values*u.arcsec).to(u.deg),
+	ax1a.scatter(x23, y23,
 				  s=sizey23, edgecolor='k', lw=0.1,
-	              c=sc23['times'], alpha=0.5,
-	              transform=ax1a.get_transform('world'), cmap=cmap)
+	              c=sc23['times'], alpha=0.5, cmap=cmap)
 
 	ax1a.set_xlabel('X (arcsec)')
 	ax1a.set_ylabel('Y (arcsec)')
 	ax1a.tick_params(axis='both',direction='in')
-	ax1a.set_title('Solar Cycle 23').set_position([.5, 1.0])
+	ax1a.set_title('Solar Cycle {:d}'.format(cycles[0])).set_position([.5, 1.0])
 	ax1a.set_axis_off()
 	for l in range(len(lats)):
-	    ax1a.plot_coord(lats[l], color='w', lw=0.2)
-	    ax1a.plot_coord(lons[l], color='w', lw=0.2)
+	    ax1a.plot(lats[l][:, 0], lats[l][:, 1], color='w', lw=0.2)
+	    ax1a.plot(lons[l][:, 0], lons[l][:, 1], color='w', lw=0.2)
 
 
-	##### FIRST SOLAR CYCLE 24 ########
+	##### SECOND SOLAR CYCLE (24) ########
 	# circle1 = plt.Circle((0, 0), 960, color='k', fill=False)
 
-	mapy.plot(axes=ax1b, alpha=0.0, title='Solar Cycle 24')
+	mapy.plot(axes=ax1b, alpha=0.0, title='Solar Cycle {:d}'.format(cycles[1]))
 	mapy.draw_limb(color='w', lw=0.8)
 	#mapy.draw_grid(color='w', lw=0.5)
-	ax1b.scatter((sc24['hpc_x'].values*u.arcsec).to(u.deg), 
-				 (sc24['hpc_y'].values*u.arcsec).to(u.deg), 
+	ax1b.scatter(x24, y24,
 				 s=sizey24, edgecolor='k', lw=0.1,
-	             c=sc24['times'], alpha=0.5,
-	            transform=ax1b.get_transform('world'), cmap=cmap)
+	             c=sc24['times'], alpha=0.5, cmap=cmap)
 	ax1b.set_xlabel('X (arcsec)')
 	ax1b.set_ylabel(' ')
 	ax1b.tick_params(which='both',direction='in')
 	ax1b.tick_params(axis='y', labelleft=False)
-	ax1b.set_title('Solar Cycle 24').set_position([.5, 1.0])
+	ax1b.set_title('Solar Cycle {:d}'.format(cycles[1])).set_position([.5, 1.0])
 	ax1b.set_axis_off()
 	for l in range(len(lats)):
-	    ax1b.plot_coord(lats[l], color='w', lw=0.2)
-	    ax1b.plot_coord(lons[l], color='w', lw=0.2)
+	    ax1b.plot(lats[l][:, 0], lats[l][:, 1], color='w', lw=0.2)
+	    ax1b.plot(lons[l][:, 0], lons[l][:, 1], color='w', lw=0.2)
 
 	for c in range(len(coords_test)):
-	    ax1a.text(coords_test[c].x.value+40, coords_test[c].y.value, str(lat_value_plot[c])+'$^\circ$')
-	    ax1b.text(coords_test[c].x.value+40, coords_test[c].y.value, str(lat_value_plot[c])+'$^\circ$')
+	    ax1a.text(coords_test[c][0]+40, coords_test[c][1], str(lat_value_plot[c])+'$^\circ$')
+	    ax1b.text(coords_test[c][0]+40, coords_test[c][1], str(lat_value_plot[c])+'$^\circ$')
 	    
 	    ##### BUTTERFLY DIAGRAM FOR BOTH ########
 	ax2.scatter(sc23.index, sc23['hgc_y'], 
@@ -177,7 +169,7 @@ def ploty(cmap='viridis', filename='ssn_viridis'):
 	ax2.xaxis.set_major_formatter(dates.DateFormatter('%Y'))  
 	
 	##### SUNSPOT NUMBER AS A FUNCTION OF TIME ########
-	ax3.plot(ssn_tots.resample('30D').mean(), color='w')
+	ax3.plot(ar_counts.smoothed('30D'), color='w')
 	ax3.set_ylabel('Sunspot number')
 	ax3.set_xlabel('Time')
 	plt.tight_layout()
@@ -188,25 +180,9 @@ def ploty(cmap='viridis', filename='ssn_viridis'):
 	ax1a.set_facecolor('k')
 	ax2.set_facecolor('k')
 	ax3.set_facecolor('k')
+	checkpoint('draw')
 
 
 	plt.savefig('full_plot_{:s}.png'.format(filename), dpi=200)
 	plt.close()
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
+	checkpoint('savefig')
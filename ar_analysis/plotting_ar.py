@@ -1,45 +1,33 @@
 import numpy as np
-import pandas as pd
-import matplotlib.pyplot as plt 
-from sunpy.time import parse_time
-import sunpy.map
-from sunpy.coordinates import frames
-from astropy.coordinates import SkyCoord
-from astropy import units as u
-import datetime
-import subprocess
-import pylab
-
-
-# read in the data as a pandas DataFrame
-all_data = pd.read_csv('all_ar_2010-2020.csv')
-# get the time as datetime objects
-tt = pd.to_datetime(all_data['event_starttime'])
-# get the time in seconds from initial time (for plotting)
-times = [(t - tt[0]).total_seconds() for t in tt]
-# make these columns of DataFrame
-all_data['times'] = times
-all_data['tt'] = tt
-
-# we want to make a list of all the dates from 2010-2020 for
-# plotting, this will allow us to pull out the active regions 
-# for each day (or not if none on a certain day) for plotting.
-tstart = parse_time(all_data['event_starttime'].min()).datetime
-tfinal = parse_time(all_data['event_endtime'].max()).datetime
-time_over = [tstart.strftime('%Y-%m-%dT%H:%M:%S')]
-t0 = tstart
-while t0 < tfinal:
-    t0 = t0 + datetime.timedelta(days=1)
-    time_over.append(t0.strftime('%Y-%m-%dT%H:%M:%S'))
-
-# this is a rough conversion for area of active region at disk
-# center in km to area in arcsec (as observed from Earth). If you 
-# want to be more precise you would calculate for each day, but
-# its grand for this purpose.
-all_data['area_arcsec'] = all_data['area_atdiskcenter']/(725**2)
-
-
-def plot_as_datapoints(i, savedir='./plots/'):
+from ar_dataset import get_dataset
+from render_frames import render_movie, save_png
+from profiling import profiled, checkpoint
+
+
+# The data (all_data, time_over etc.) is only read in when it's first
+# needed, see ar_dataset.ARDataset. The days in time_over are used to
+# pull out the active regions for each day (or not if none on a certain
+# day) for plotting. matplotlib, sunpy and astropy are only imported
+# in the functions that use them so that importing this is quick.
+data_file = 'all_ar_2010-2020.csv'
+
+
+def dataset():
+    """
+    The active region data for the plots (an `ar_dataset.ARDataset`).
+    """
+    return get_dataset(data_file)
+
+
+def __getattr__(name):
+    # so that plotting_ar.all_data etc. still work, loading the data when first used
+    if name in ('all_data', 'ar_days', 'time_over'):
+        return getattr(dataset(), name)
+    raise AttributeError('module {!r} has no attribute {!r}'.format(__name__, name))
+
+
+@profiled(frame=True)
+def plot_as_datapoints(i, savedir='./plots/', butterfly='raster'):
     """
     This function plots the Sun with the daily active regions, the butterfly diagram, 
     and histogram for the data up to the date time_over[i].
@@ -51,28 +39,30 @@ def plot_as_datapoints(i, savedir='./plots/'):
     ----------
     i : ~int
         the index of the `time_over` list for which to plot. 
+    butterfly : ~str
+        'raster' draws the butterfly diagram from the precomputed image (see
+        `frame_aggregates.ButterflyRaster`), 'scatter' scatters all the past data.
 
     """
+    import matplotlib.pyplot as plt
+    import pylab
 
+    data = dataset()
+    all_data, ar_days = data.all_data, data.ar_days
 
     # find the active region data for the day from the dataframe
-    data_for_day = all_data[all_data['event_starttime'].isin([time_over[i]])]
+    data_for_day = ar_days.day(i)
 
     # get the daya for the past 10 days previous to timestep i. This is to plot the previous
     # active regions with a colormap to highlight the active region evolution.
-    if i < 10:
-        data_for_days = all_data[all_data['event_starttime'].isin(time_over[0:i])]
-    else:
-        data_for_days = all_data[all_data['event_starttime'].isin(time_over[i-10:i])]
+    data_for_days = ar_days.previous(i, 10)
 
     # get the data for the past 100 days from i for faint active region plot
-    if i < 100:
-        data_for_past = all_data[all_data['event_starttime'].isin(time_over[0:i])]
-    else:
-        data_for_past = all_data[all_data['event_starttime'].isin(time_over[i-100:i])]
+    data_for_past = ar_days.previous(i, 100)
    
     # all previous data up to date (i) for butterfly diagram.
-    data_all_past = all_data[all_data['event_starttime'].isin(time_over[0:i])]
+    data_all_past = ar_days.all_past(i)
+    checkpoint('select')
 
     #########################################
     # where plot happens
@@ -116,38 +106,56 @@ def plot_as_datapoints(i, savedir='./plots/'):
     ax1.tick_params(which='both', direction='in')
 
 
-    # plotting histogram to right of Sun
-    na, bins, patches = ax2.hist(data_all_past['hpc_y'], bins=100, orientation='horizontal', color='darkred')
+    # plotting histogram to right of Sun, the histograms of the past
+    # data for every day are worked out once in the dataset
+    data.lat_histograms.draw(ax2, i, color='darkred')
     ax2.set_ylim(-1101, 1101)
     ax2.tick_params(labelleft=False, which='both', direction='in')
     ax2.set_xlabel('No. active regions')
     ax2.set_xlim(0, 300)
 
     # plotting butterfly diagram
-    ax3.scatter(data_all_past['tt'], data_all_past['hgc_y'], c=data_all_past['times'], alpha=0.3, 
-              s=np.sqrt(data_all_past['area_arcsec']), 
-              edgecolor='k', lw=0.4, cmap='Reds')
-    ax3.axvline(time_over[i], color='k', ls='dashed')
+    ax3.xaxis_date()
+    if butterfly == 'raster':
+        data.butterfly_raster.draw(ax3, i, cmap='Reds')
+    else:
+        ax3.scatter(data_all_past['tt'], data_all_past['hgc_y'], c=data_all_past['times'], alpha=0.3, 
+                  s=np.sqrt(data_all_past['area_arcsec']), 
+                  edgecolor='k', lw=0.4, cmap='Reds')
+    ax3.axvline(ar_days.days[i], color='k', ls='dashed')
     ax3.set_xlabel('Time (UT)')
     ax3.set_ylabel('Latitude (deg)')
     ax3.tick_params(which='both', direction='in')
     ax3.set_xlim(all_data['tt'].min(), all_data['tt'].max())
     ax3.set_ylim(-45, 45)
+    checkpoint('draw')
     
 
     # save the plot
-    plt.savefig(savedir + 'test_{:04d}.png'.format(i), dpi=200)
+    save_png(savedir + 'test_{:04d}.png'.format(i), dpi=200)
     plt.close()
+    checkpoint('savefig')
+
 
+def make_movie_final(subset=None, processes=None, mode='png'):
+    """
+    Render all the `plot_as_datapoints` frames over a pool of processes and
+    make the movie. Frames that are already rendered are skipped, and `subset`
+    (e.g. range(0, 1000)) can be used to only render part of the movie.
 
-def make_movie_final():
-    for i in range(len(time_over)):
-        print(i)
-        test_for(i)
+    With mode='stream' the figure is instead built once and the frames are
+    piped straight into ffmpeg without writing any pngs.
+    """
+    data = dataset()
+    if mode == 'stream':
+        from stream_render import ARFrameRenderer, DATAPOINTS_STYLE
+        renderer = ARFrameRenderer.from_dataset(data, look=DATAPOINTS_STYLE)
+        renderer.stream_movie(range(len(data.time_over)), 'test_mov2.mp4')
+        return
 
-    subprocess.call(['ffmpeg','-r', '10' ,'-f', 'image2', '-s', 
-                '1920x1080', '-i', './plots/test_%04d.png', 
-                '-vcodec', 'libx264', '-crf', '25',  '-pix_fmt', 'yuv420p', 'test_mov2.mp4'])
+    render_movie(plot_as_datapoints, range(len(data.time_over)), 'test_mov2.mp4',
+                 savedir='./plots/', filename='test_{:04d}.png', data_file=data_file,
+                 subset=subset, processes=processes)
 
 
 ########-----------------------------------------------##########
@@ -156,23 +164,26 @@ def make_movie_final():
 ########-----------------------------------------------##########
 
 
+@profiled(frame=True)
 def plot_as_sunpy_map(i, savedir='./plots/'):
-
-    all_prev_data = all_data[all_data['event_starttime'].isin(time_over[0:i])]
-    
-    if i < 10:
-        data_for_past = all_data[all_data['event_starttime'].isin(time_over[0:i])]
-    else:
-        data_for_past = all_data[all_data['event_starttime'].isin(time_over[i-10:i])]
-        
-        
-    data_for_day = all_data[all_data['event_starttime'].isin([time_over[i]])]
+    import matplotlib.pyplot as plt
+    from map_grid import blank_map
+    from projection import hpc_to_pixel
+
+    ar_days = dataset().ar_days
+    all_prev_data = ar_days.all_past(i)
+    data_for_past = ar_days.previous(i, 10)
+    data_for_day = ar_days.day(i)
+    checkpoint('select')
     
-    # create an empty sunpy.map.Map
-    data_arr = np.zeros((1500, 1500))
-    coord = SkyCoord(0*u.arcsec, 0*u.arcsec, frame=frames.Helioprojective(observer='Earth', obstime=time_over[i]))
-    header = sunpy.map.make_fitswcs_header(data_arr, coord, scale=[2, 2]*u.arcsec/u.pix)
-    mapy = sunpy.map.Map(data_arr, header)
+    # get an empty sunpy.map.Map (cached for each day, without any data array)
+    mapy = blank_map(ar_days.days[i], scale=2, shape=(1500, 1500))
+    checkpoint('map')
+
+    # the points are plotted in pixels, projected with numpy rather than by
+    # the WCS transform of the axes
+    def pixels(data):
+        return hpc_to_pixel(data['hpc_x'].values, data['hpc_y'].values, mapy.meta)
 
 
     # make the plot
@@ -181,47 +192,41 @@ def plot_as_sunpy_map(i, savedir='./plots/'):
     mapy.plot(alpha=0)
     mapy.draw_limb(color='k')
 
-    ax.scatter((all_prev_data['hpc_x'].values*u.arcsec).to(u.deg),
-                (all_prev_data['hpc_y'].values*u.arcsec).to(u.deg), 
+    ax.scatter(*pixels(all_prev_data),
                  cmap='viridis',
                  c=all_prev_data['times'], alpha=0.1,
-                 s=np.sqrt(all_prev_data['area_arcsec']), 
-                 transform=ax.get_transform('world')) 
+                 s=np.sqrt(all_prev_data['area_arcsec']))
 
     # plot the AR for the day
     if len(data_for_day)>0:
-        ax.scatter((data_for_day['hpc_x'].values*u.arcsec).to(u.deg),
-                   (data_for_day['hpc_y'].values*u.arcsec).to(u.deg), 
+        ax.scatter(*pixels(data_for_day),
                     c='k', marker='o',
-                    s=np.sqrt(data_for_day['area_arcsec']),
-                    transform=ax.get_transform('world'))
+                    s=np.sqrt(data_for_day['area_arcsec']))
 
     # plot the AR for the past days
     if len(data_for_past)>0:
-        ax.scatter((data_for_past['hpc_x'].values*u.arcsec).to(u.deg),
-                  (data_for_past['hpc_y'].values*u.arcsec).to(u.deg), 
-                  transform=ax.get_transform('world'), 
+        ax.scatter(*pixels(data_for_past),
                   c=data_for_past['times'], 
                   s=np.sqrt(data_for_past['area_arcsec']),
                   cmap='viridis_r')
+    checkpoint('draw')
 
     # xlims etc
-    lims_arcsec = ((-1101, 1100) * u.arcsec, (-1100, 1100) * u.arcsec)
-    lims_pix = mapy.world_to_pixel(SkyCoord(*lims_arcsec, frame=mapy.coordinate_frame))
-    ax.set_xlim(lims_pix[0].value)
-    ax.set_ylim(lims_pix[1].value)
+    lims_x, lims_y = hpc_to_pixel([-1101, 1100], [-1100, 1100], mapy.meta)
+    checkpoint('skycoord')
+    ax.set_xlim(lims_x)
+    ax.set_ylim(lims_y)
     ax.set_title(mapy.date.strftime('%Y-%m-%d'))
-    plt.savefig(savedir + 'mapplots_{:04d}.png'.format(i), dpi=200)
+    save_png(savedir + 'mapplots_{:04d}.png'.format(i), dpi=200)
     plt.close()
+    checkpoint('savefig')
 
 
-def make_movie_maps():
-
-  for i in range(len(time_over)):
-    ploty(i)
-    print(i)
-
-  subprocess.call(['ffmpeg','-r', '10' ,'-f', 'image2', '-s', 
-                '1920x1080', '-i', './plots/mapplots_%04d.png', 
-                '-vcodec', 'libx264', '-crf', '25',  '-pix_fmt', 'yuv420p', 'test_mov_map.mp4'])
+def make_movie_maps(subset=None, processes=None):
+    """
+    Same as `make_movie_final` but for the `plot_as_sunpy_map` frames.
+    """
+    render_movie(plot_as_sunpy_map, range(len(dataset().time_over)), 'test_mov_map.mp4',
+                 savedir='./plots/', filename='mapplots_{:04d}.png', data_file=data_file,
+                 subset=subset, processes=processes)
 
@@ -0,0 +1,250 @@
+import numpy as np
+import pandas as pd
+
+# An index of active region (or flare) records by time and position on the
+# Sun, for "everything in this latitude band and longitude range between
+# these dates" without a boolean mask over the whole table each time.
+#
+# The records are put in cells of TIME_BIN x LAT_BIN and sorted by cell and
+# then longitude, with the sort key cell*stride + longitude. The records of
+# one cell within a longitude range are then one searchsorted each end, and a
+# box is the (time bins x latitude bins) ranges it covers, with the times and
+# latitudes at the edges checked exactly. Many boxes are done together with
+# no python loop over the boxes.
+#
+# Flares only have positions once they're matched to a region (see
+# flare_match.match_flares, e.g. lat_column='hgs_y_ar').
+
+TIME_BIN = '7D'
+LAT_BIN = 5.
+
+# the most cells looked up at once in the batched queries
+MAX_BATCH_CELLS = 2**22
+
+
+def _expand(lo, hi):
+    # all the integers in the ranges [lo, hi) one after another, and which range each is from
+    lengths = np.maximum(hi - lo, 0)
+    which = np.repeat(np.arange(len(lo)), lengths)
+    starts = np.cumsum(lengths) - lengths
+    return lo[which] + np.arange(lengths.sum()) - starts[which], which
+
+
+def _times(values):
+    # times as int64 ns (NaT is the smallest int64)
+    times = pd.to_datetime(pd.Series(np.atleast_1d(np.asarray(values)))).values
+    return times.astype('datetime64[ns]').astype(np.int64)
+
+
+def angular_distance(lat1, lon1, lat2, lon2):
+    """
+    The great circle distance in degrees between points given in degrees.
+    """
+    lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1)/2)**2 + np.cos(lat1)*np.cos(lat2)*np.sin((lon2 - lon1)/2)**2
+    return np.degrees(2*np.arcsin(np.sqrt(np.clip(a, 0, 1))))
+
+
+class PositionIndex:
+    """
+    The records of a table indexed by time, latitude and longitude, for box
+    and radius queries.
+
+    Parameters
+    ----------
+    table : ~pandas.DataFrame
+        e.g. the active region records.
+    time_column : ~str
+    lat_column : ~str
+        e.g. 'hgs_y' or 'hgc_y' (or 'hpc_y' with `spherical=False`).
+    lon_column : ~str
+        e.g. 'hgs_x', 'hgc_x' or 'hpc_x'.
+    time_bin : ~str
+        the length of the time cells, anything `pd.Timedelta` understands.
+    lat_bin : ~float
+        the size of the latitude cells.
+    lon_period : ~float, optional
+        the longitude wraps around with this period, 360 for Carrington
+        longitudes (by default if `lon_column` is 'hgc_x'). Boxes with
+        lon_min > lon_max then go through 0.
+    spherical : ~bool
+        the radius queries use great circle distances in degrees, otherwise
+        straight line distances (for the helioprojective arcsec).
+
+    Attributes
+    ----------
+    data : ~pandas.DataFrame
+        the records with a time and position, sorted by cell. The queries
+        return rows of this table.
+    """
+
+    def __init__(self, table, time_column='event_starttime', lat_column='hgs_y', lon_column='hgs_x',
+                 time_bin=TIME_BIN, lat_bin=LAT_BIN, lon_period='auto', spherical=True):
+        if lon_period == 'auto':
+            lon_period = 360. if lon_column == 'hgc_x' else None
+        self.lon_period = lon_period
+        self.spherical = spherical
+        self.time_bin = pd.Timedelta(time_bin).value
+        self.lat_bin = float(lat_bin)
+
+        times = _times(table[time_column])
+        lats = np.asarray(table[lat_column], dtype=float)
+        lons = np.asarray(table[lon_column], dtype=float)
+        if lon_period is not None:
+            lons = np.mod(lons, lon_period)
+        good = np.flatnonzero(np.isfinite(lats) & np.isfinite(lons) & (times != np.iinfo(np.int64).min))
+        times, lats, lons = times[good], lats[good], lons[good]
+
+        self.t0 = times.min() if len(good) else 0
+        self.lat0 = lats.min() if len(good) else 0.
+        self.lon0 = lons.min() if len(good) else 0.
+        self.n_time = int((times.max() - self.t0)//self.time_bin) + 1 if len(good) else 1
+        self.n_lat = int((lats.max() - self.lat0)//self.lat_bin) + 1 if len(good) else 1
+        # each cell's longitudes fit in [0, stride) after subtracting lon0
+        self.stride = np.ceil(lons.max() - self.lon0) + 1 if len(good) else 1.
+
+        cells = (((times - self.t0)//self.time_bin)*self.n_lat
+                 + ((lats - self.lat0)//self.lat_bin).astype(np.int64))
+        keys = cells*self.stride + (lons - self.lon0)
+        order = np.argsort(keys, kind='stable')
+        self.keys = keys[order]
+        self.rows = good[order]
+        self.times, self.lats, self.lons = times[order], lats[order], lons[order]
+        self.data = table.iloc[self.rows]
+
+    def __len__(self):
+        return len(self.keys)
+
+    def _lon_ranges(self, lon_min, lon_max):
+        # the longitude ranges of the boxes, boxes through 0 (with a period) are split in two
+        box = np.arange(len(lon_min))
+        if self.lon_period is None:
+            return box, lon_min, lon_max
+        period = self.lon_period
+        full = lon_max - lon_min >= period
+        lo = np.where(full, 0., np.mod(np.where(full, 0., lon_min), period))
+        hi = np.where(full, period, np.mod(np.where(full, 0., lon_max), period))
+        wraps = ~full & (lo > hi)
+        return (np.r_[box, box[wraps]], np.r_[np.where(wraps, 0., lo), lo[wraps]],
+                np.r_[hi, np.full(wraps.sum(), period)])
+
+    def _candidates(self, box, tstart, tend, lat_min, lat_max, lon_min, lon_max):
+        # the (box, row) pairs in the cells that the boxes cover, within their longitude range
+        t_lo = np.clip((tstart - self.t0)//self.time_bin, 0, self.n_time)
+        t_hi = np.clip((tend - self.t0)//self.time_bin + 1, 0, self.n_time)
+        l_lo = np.clip(np.floor((lat_min - self.lat0)/self.lat_bin), 0, self.n_lat).astype(np.int64)
+        l_hi = np.clip(np.floor((lat_max - self.lat0)/self.lat_bin) + 1, 0, self.n_lat).astype(np.int64)
+        n_lat = np.maximum(l_hi - l_lo, 0)
+        n_cells = np.maximum(t_hi - t_lo, 0)*n_lat
+        # the longitudes as offsets from the start of a cell (empty if lon_max < lon_min)
+        lon_lo = np.clip(lon_min - self.lon0, 0, self.stride)
+        lon_hi = np.clip(lon_max - self.lon0, -0.5, self.stride - 0.5)
+
+        # boxes are done in batches of about MAX_BATCH_CELLS cells
+        ends = np.cumsum(n_cells)
+        boxes, rows = [np.array([], dtype=np.int64)], [np.array([], dtype=np.int64)]
+        start = 0
+        while start < len(box):
+            stop = np.searchsorted(ends, ends[start] - n_cells[start] + MAX_BATCH_CELLS, 'right')
+            stop = max(start + 1, int(stop))
+            cell, which = _expand(np.zeros(stop - start, dtype=np.int64), n_cells[start:stop])
+            which += start
+            cells = (t_lo[which] + cell//n_lat[which])*self.n_lat + l_lo[which] + cell % n_lat[which]
+            lo = np.searchsorted(self.keys, cells*self.stride + lon_lo[which], 'left')
+            hi = np.searchsorted(self.keys, cells*self.stride + lon_hi[which], 'right')
+            r, w = _expand(lo, hi)
+            boxes.append(box[which[w]])
+            rows.append(r)
+            start = stop
+        return np.concatenate(boxes), np.concatenate(rows)
+
+    def _grouped(self, box, rows, n):
+        # the rows of each of the n boxes in time order, as offsets into one array
+        order = np.lexsort((rows, self.times[rows], box))
+        return np.searchsorted(box[order], np.arange(n + 1)), rows[order]
+
+    def query_boxes(self, tstart, tend, lat_min, lat_max, lon_min, lon_max):
+        """
+        The records in each of a batch of boxes. The arguments can be arrays
+        (one value per box) or single values for all the boxes, the ranges
+        include both ends.
+
+        Parameters
+        ----------
+        tstart, tend : array-like
+            the times, anything `pd.to_datetime` understands.
+        lat_min, lat_max, lon_min, lon_max : array-like
+            the latitude and longitude ranges (in the units of the columns).
+
+        Returns
+        -------
+        offsets : numpy.ndarray
+            the records of box i are `rows[offsets[i]:offsets[i + 1]]`.
+        rows : numpy.ndarray
+            rows of `data`, in time order within each box.
+        """
+        tstart, tend = _times(tstart), _times(tend)
+        tstart, tend, lat_min, lat_max, lon_min, lon_max = np.broadcast_arrays(
+            tstart, tend, *[np.atleast_1d(np.asarray(a, dtype=float)) for a in (lat_min, lat_max, lon_min, lon_max)])
+        box, lon_lo, lon_hi = self._lon_ranges(lon_min, lon_max)
+        b, r = self._candidates(box, tstart[box], tend[box], lat_min[box], lat_max[box], lon_lo, lon_hi)
+
+        # the cells at the edges of the boxes are only partly in them
+        keep = ((self.times[r] >= tstart[b]) & (self.times[r] <= tend[b])
+                & (self.lats[r] >= lat_min[b]) & (self.lats[r] <= lat_max[b]))
+        return self._grouped(b[keep], r[keep], len(tstart))
+
+    def query_radius(self, times, lats, lons, radius, dt='1D'):
+        """
+        The records within `radius` of each of a batch of points, and within
+        `dt` either side of its time.
+
+        Parameters
+        ----------
+        times, lats, lons : array-like
+            the points, arrays or single values as in `query_boxes`.
+        radius : ~float or array
+            in degrees of great circle (or the units of the columns if not `spherical`).
+        dt : ~str or ~pandas.Timedelta
+
+        Returns
+        -------
+        offsets, rows : numpy.ndarray
+            as `query_boxes`.
+        """
+        times = _times(times)
+        times, lats, lons, radius = np.broadcast_arrays(
+            times, *[np.atleast_1d(np.asarray(a, dtype=float)) for a in (lats, lons, radius)])
+        dt = pd.Timedelta(dt).value
+        if self.spherical:
+            # the longitude half width of the circle, all longitudes if it goes over a pole
+            ratio = np.sin(np.radians(np.minimum(radius, 90)))/np.cos(np.radians(np.minimum(np.abs(lats), 90)))
+            half = np.where((np.abs(lats) + radius < 90) & (ratio < 1),
+                            np.degrees(np.arcsin(np.clip(ratio, 0, 1))), 360.)
+        else:
+            half = radius
+        box, lon_lo, lon_hi = self._lon_ranges(lons - half, lons + half)
+        b, r = self._candidates(box, times[box] - dt, times[box] + dt, lats[box] - radius[box],
+                                lats[box] + radius[box], lon_lo, lon_hi)
+
+        if self.spherical:
+            distance = angular_distance(lats[b], lons[b], self.lats[r], self.lons[r])
+        else:
+            distance = np.hypot(self.lats[r] - lats[b], self.lons[r] - lons[b])
+        keep = (np.abs(self.times[r] - times[b]) <= dt) & (distance <= radius[b])
+        return self._grouped(b[keep], r[keep], len(times))
+
+    def box(self, tstart, tend, lat=(-90, 90), lon=(-np.inf, np.inf)):
+        """
+        The records between two times in a latitude and longitude range, e.g.
+        `index.box('2014-01-01', '2014-12-31', lat=(10, 20), lon=(-30, 30))`.
+        """
+        offsets, rows = self.query_boxes(tstart, tend, lat[0], lat[1], lon[0], lon[1])
+        return self.data.iloc[rows]
+
+    def near(self, time, lat, lon, radius, dt='1D'):
+        """
+        The records within `radius` and `dt` of a time and position.
+        """
+        offsets, rows = self.query_radius(time, lat, lon, radius, dt=dt)
+        return self.data.iloc[rows]
@@ -0,0 +1,483 @@
+import os
+import sys
+import json
+import time
+import cProfile
+import argparse
+import functools
+import importlib
+import contextlib
+import tracemalloc
+import pandas as pd
+
+# Opt-in timing of the stages of the data prep and the frame rendering (the
+# pandas selections, the matplotlib drawing, savefig, the SkyCoord
+# transforms, ffmpeg ...). Nothing is recorded unless profiling is switched
+# on with `enable` or the AR_PROFILE environment variable, e.g.
+#
+#   AR_PROFILE=profile.jsonl python -c "import plotting_ar; plotting_ar.make_movie_final(range(0, 100))"
+#   python profiling.py report profile.jsonl
+#
+# Each stage is written as a line of json with its wall time and memory. The
+# plotting functions mark their stages in two ways:
+#
+#   with stage('name'):       a block
+#   checkpoint('name')        the time since the start of the enclosing stage
+#                             or the last checkpoint or stage in it, so the
+#                             stages of a long function can be split without
+#                             re-indenting it
+#
+# and @profiled(frame=True) makes a whole plot_func(i, ...) call a 'frame'
+# stage. When profiling is off these are a check of a global, so they can
+# stay in the code. The settings are also put in the environment, so the
+# pool workers of render_frames profile too (each process appends whole
+# lines to the same file).
+
+PROFILE_ENV = 'AR_PROFILE'
+MEMORY_ENV = 'AR_PROFILE_MEMORY'
+CPROFILE_ENV = 'AR_PROFILE_CPROFILE'
+RUN_ENV = 'AR_PROFILE_RUN'
+
+_profiler = None
+_null = contextlib.nullcontext()
+
+
+def _maxrss_mb():
+    # the peak resident memory of the process so far
+    try:
+        import resource
+    except ImportError:
+        return float('nan')
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on linux, bytes on mac
+    return maxrss/2**20 if sys.platform == 'darwin' else maxrss/2**10
+
+
+def _json_default(obj):
+    # numpy scalars etc.
+    return obj.item() if hasattr(obj, 'item') else str(obj)
+
+
+class Profiler:
+    """
+    Records the wall time and memory of each stage and writes them to a json
+    lines file. Use `enable` rather than making one of these directly.
+
+    Parameters
+    ----------
+    outfile : ~str
+        the json lines file, appended to.
+    memory : ~str or None
+        'rss' records the peak resident memory of the process (cheap, but it
+        only goes up, so a stage shows memory when it sets a new peak),
+        'tracemalloc' the peak memory allocated during each stage (numpy
+        arrays included, but it slows python code down a lot) and None no memory.
+    cprofile_frames : ~int or iterable of ~int, optional
+        run cProfile on every n-th frame (an int, counting the frames each
+        process renders, starting with its first, whatever their indices) or
+        on these frame indices. The stats are saved to `cprofile_dir` as frame_<i>_<pid>.prof.
+    cprofile_dir : ~str, optional
+        defaults to the outfile name with '_cprofile' in place of the extension.
+    run : ~str, optional
+        a name for this run, to tell the runs apart in the same file.
+    """
+
+    def __init__(self, outfile, memory='rss', cprofile_frames=None, cprofile_dir=None, run=None):
+        if memory not in ('rss', 'tracemalloc', None):
+            raise ValueError("memory should be 'rss', 'tracemalloc' or None")
+        self.outfile = outfile
+        self.memory = memory
+        if isinstance(cprofile_frames, int) or cprofile_frames is None:
+            self.cprofile_frames = cprofile_frames
+        else:
+            self.cprofile_frames = set(int(i) for i in cprofile_frames)
+        self.cprofile_dir = cprofile_dir or os.path.splitext(outfile)[0] + '_cprofile'
+        self.run = run or '{:s}-{:d}'.format(time.strftime('%Y%m%d-%H%M%S'), os.getpid())
+        self.frame = None
+        # the number of frames started so far, for every n-th frame
+        self.frames_started = 0
+
+        self._stack = []
+        self._records = []
+        self._last = time.perf_counter()
+        self._last_memory = self._memory_now()
+        if memory == 'tracemalloc' and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def _memory_now(self):
+        if self.memory == 'rss':
+            return _maxrss_mb()
+        if self.memory == 'tracemalloc' and tracemalloc.is_tracing():
+            return tracemalloc.get_traced_memory()[0]/2**20
+        return None
+
+    def _peak_so_far(self):
+        # the traced peak since the last reset is passed up to all the open
+        # stages before it's reset, so they keep their own peaks
+        peak = tracemalloc.get_traced_memory()[1]/2**20
+        for entry in self._stack:
+            entry['peak'] = max(entry['peak'], peak)
+        return peak
+
+    def _memory_fields(self, start, peak=0.):
+        if self.memory == 'rss':
+            now = _maxrss_mb()
+            return dict(maxrss_mb=now, maxrss_growth_mb=now - start)
+        if self.memory == 'tracemalloc' and tracemalloc.is_tracing():
+            peak = max(peak, self._peak_so_far())
+            tracemalloc.reset_peak()
+            return dict(peak_mb=peak - start)
+        return {}
+
+    def _record(self, name, wall, memory, **info):
+        record = dict(run=self.run, pid=os.getpid(), frame=self.frame, stage=name,
+                      parent=self._stack[-1]['name'] if self._stack else None,
+                      start=time.time() - wall, wall=wall)
+        record.update(memory)
+        record.update(info)
+        self._records.append(record)
+        if not self._stack:
+            self.flush()
+
+    def _mark(self):
+        # start a new split for `checkpoint`
+        now, memory = time.perf_counter(), self._memory_now()
+        if self._stack:
+            self._stack[-1]['last'], self._stack[-1]['last_memory'] = now, memory
+        else:
+            self._last, self._last_memory = now, memory
+
+    def checkpoint(self, name, **info):
+        """
+        Record the stage `name` as the time since the start of the enclosing
+        stage or the end of the last checkpoint or stage in it.
+        """
+        top = self._stack[-1] if self._stack else None
+        last = top['last'] if top else self._last
+        start_memory = top['last_memory'] if top else self._last_memory
+        wall = time.perf_counter() - last
+        self._record(name, wall, self._memory_fields(start_memory), **info)
+        self._mark()
+
+    @contextlib.contextmanager
+    def stage(self, name, **info):
+        """
+        Record the block as the stage `name`.
+        """
+        if self.memory == 'tracemalloc' and tracemalloc.is_tracing():
+            self._peak_so_far()
+            tracemalloc.reset_peak()
+        memory = self._memory_now()
+        t0 = time.perf_counter()
+        entry = dict(name=name, last=t0, last_memory=memory, peak=0.)
+        self._stack.append(entry)
+        try:
+            yield
+        finally:
+            wall = time.perf_counter() - t0
+            fields = self._memory_fields(memory, peak=entry['peak'])
+            self._stack.pop()
+            self._record(name, wall, fields, **info)
+            self._mark()
+
+    def _profile_frame(self, i, ordinal):
+        # i is the frame index and ordinal the number of frames before it
+        if self.cprofile_frames is None:
+            return False
+        if isinstance(self.cprofile_frames, int):
+            return ordinal % self.cprofile_frames == 0
+        return i in self.cprofile_frames
+
+    @contextlib.contextmanager
+    def frame_stage(self, i):
+        """
+        Record the block as the 'frame' stage of frame i, with cProfile if
+        it's one of the sampled frames.
+        """
+        previous, self.frame = self.frame, int(i)
+        profile = None
+        # a frame inside a frame (a plot function calling another) isn't counted again
+        if previous is None:
+            ordinal, self.frames_started = self.frames_started, self.frames_started + 1
+            if self._profile_frame(self.frame, ordinal):
+                profile = cProfile.Profile()
+        try:
+            with self.stage('frame', cprofile=profile is not None):
+                if profile is None:
+                    yield
+                else:
+                    profile.enable()
+                    try:
+                        yield
+                    finally:
+                        profile.disable()
+                        os.makedirs(self.cprofile_dir, exist_ok=True)
+                        profile.dump_stats(os.path.join(self.cprofile_dir, 'frame_{:05d}_{:d}.prof'.format(
+                            self.frame, os.getpid())))
+        finally:
+            self.frame = previous
+
+    def flush(self):
+        """
+        Append the records to the file, all the lines in one write.
+        """
+        if not self._records:
+            return
+        lines = ''.join(json.dumps(r, default=_json_default) + '\n' for r in self._records)
+        self._records = []
+        with open(self.outfile, 'a') as f:
+            f.write(lines)
+
+
+def enable(outfile='profile.jsonl', memory='rss', cprofile_frames=None, cprofile_dir=None, run=None):
+    """
+    Switch profiling on in this process and in the processes it starts.
+
+    The parameters are those of `Profiler`.
+
+    Returns
+    -------
+    Profiler
+    """
+    global _profiler
+    if _profiler is not None:
+        _profiler.flush()
+    _profiler = Profiler(outfile, memory=memory, cprofile_frames=cprofile_frames,
+                         cprofile_dir=cprofile_dir, run=run)
+
+    os.environ[PROFILE_ENV] = outfile
+    os.environ[MEMORY_ENV] = memory or 'none'
+    os.environ[RUN_ENV] = _profiler.run
+    if cprofile_frames is None:
+        os.environ.pop(CPROFILE_ENV, None)
+    elif isinstance(cprofile_frames, int):
+        os.environ[CPROFILE_ENV] = 'every:{:d}'.format(cprofile_frames)
+    else:
+        os.environ[CPROFILE_ENV] = 'frames:' + ','.join(str(int(i)) for i in cprofile_frames)
+    return _profiler
+
+
+def disable():
+    """
+    Switch profiling off (and write out anything not yet written).
+    """
+    global _profiler
+    if _profiler is not None:
+        _profiler.flush()
+    _profiler = None
+    for name in (PROFILE_ENV, MEMORY_ENV, CPROFILE_ENV, RUN_ENV):
+        os.environ.pop(name, None)
+
+
+def enabled():
+    return _profiler is not None
+
+
+def _enable_from_environment():
+    outfile = os.environ.get(PROFILE_ENV)
+    if not outfile:
+        return
+    memory = os.environ.get(MEMORY_ENV, 'rss')
+    # 'every:n' or 'frames:i,j,...' (see enable), so one frame isn't taken for every n-th
+    cprofile_frames = os.environ.get(CPROFILE_ENV)
+    if cprofile_frames is not None:
+        mode, _, values = cprofile_frames.partition(':')
+        if mode == 'every':
+            cprofile_frames = int(values)
+        else:
+            cprofile_frames = [int(i) for i in values.split(',') if i]
+    enable(outfile, memory=None if memory == 'none' else memory, cprofile_frames=cprofile_frames,
+           run=os.environ.get(RUN_ENV))
+
+
+def stage(name, **info):
+    """
+    Context manager recording the block as the stage `name` (does nothing if profiling is off).
+    """
+    if _profiler is None:
+        return _null
+    return _profiler.stage(name, **info)
+
+
+def frame(i):
+    """
+    Context manager recording the block as frame i (does nothing if profiling is off).
+    """
+    if _profiler is None:
+        return _null
+    return _profiler.frame_stage(i)
+
+
+def checkpoint(name, **info):
+    """
+    Record the time since the start of the enclosing stage or the end of the
+    last checkpoint or stage in it as the stage `name` (does nothing if
+    profiling is off).
+    """
+    if _profiler is not None:
+        _profiler.checkpoint(name, **info)
+
+
+def profiled(name=None, frame=False):
+    """
+    Decorator recording each call of a function as a stage, by default named
+    after the function. With frame=True the first argument is the frame index
+    and the call is recorded as that frame (see `Profiler.frame_stage`).
+    """
+    def decorator(func):
+        stage_name = name or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if _profiler is None:
+                return func(*args, **kwargs)
+            context = _profiler.frame_stage(args[0]) if frame else _profiler.stage(stage_name)
+            with context:
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def load_records(path):
+    """
+    Read the records of a profile file into a DataFrame.
+    """
+    with open(path) as f:
+        return pd.DataFrame([json.loads(line) for line in f if line.strip()])
+
+
+def _drop_profiled(records):
+    # the frames run under cProfile are a lot slower, so they're left out of the timings
+    if 'cprofile' not in records.columns:
+        return records
+    profiled_frames = records.loc[records['cprofile'].fillna(False).astype(bool), ['run', 'frame']]
+    if len(profiled_frames) == 0:
+        return records
+    keys = pd.MultiIndex.from_frame(records[['run', 'frame']])
+    return records[~keys.isin(pd.MultiIndex.from_frame(profiled_frames))]
+
+
+def stage_summary(records, include_profiled=False):
+    """
+    The wall time of each stage: number of calls, total, mean, p50, p95 and
+    max, and the most memory any call of it took.
+
+    Parameters
+    ----------
+    records : ~pandas.DataFrame
+        from `load_records`.
+    include_profiled : ~bool
+        include the frames that were run under cProfile.
+
+    Returns
+    -------
+    pandas.DataFrame
+        indexed by stage, sorted by total time.
+    """
+    if not include_profiled:
+        records = _drop_profiled(records)
+    wall = records.groupby('stage')['wall']
+    summary = pd.DataFrame({'n': wall.size(), 'total_s': wall.sum(), 'mean_s': wall.mean(),
+                            'p50_s': wall.median(), 'p95_s': wall.quantile(0.95), 'max_s': wall.max()})
+    for col in ('peak_mb', 'maxrss_growth_mb', 'maxrss_mb'):
+        if col in records.columns:
+            summary[col] = records.groupby('stage')[col].max()
+    return summary.sort_values('total_s', ascending=False)
+
+
+def slowest_frames(records, n=10, include_profiled=False):
+    """
+    The n slowest frames with the time of each of their stages.
+
+    Returns
+    -------
+    pandas.DataFrame
+        indexed by (run, frame), the 'frame' column is the whole frame.
+    """
+    if not include_profiled:
+        records = _drop_profiled(records)
+    in_frames = records[records['frame'].notna()]
+    if len(in_frames) == 0:
+        return pd.DataFrame()
+    table = in_frames.pivot_table(index=['run', 'frame'], columns='stage', values='wall', aggfunc='sum')
+    if 'frame' not in table.columns:
+        return table.head(0)
+    table = table.nlargest(n, 'frame')
+    return table[['frame'] + [c for c in table.columns if c != 'frame']]
+
+
+def report(path, top=10, include_profiled=False):
+    """
+    Print the stage summary and the slowest frames of a profile file.
+    """
+    records = load_records(path)
+    with pd.option_context('display.width', 200, 'display.max_columns', 20,
+                           'display.float_format', '{:.4g}'.format):
+        print('stages ({:d} records, {:d} runs)'.format(len(records), records['run'].nunique()))
+        print(stage_summary(records, include_profiled=include_profiled))
+        frames = slowest_frames(records, n=top, include_profiled=include_profiled)
+        if len(frames) > 0:
+            print()
+            print('slowest {:d} frames (s)'.format(len(frames)))
+            print(frames)
+
+
+def profile_frames(plot_func, frames, outfile='profile.jsonl', memory='rss', cprofile_frames=None,
+                   **plot_kwargs):
+    """
+    Render some frames one after the other in this process with profiling
+    on, e.g. profile_frames(plotting_ar.plot_as_datapoints, range(0, 3885, 100), cprofile_frames=5).
+    """
+    enable(outfile, memory=memory, cprofile_frames=cprofile_frames)
+    try:
+        for i in frames:
+            plot_func(i, **plot_kwargs)
+    finally:
+        disable()
+
+
+def _plot_function(spec):
+    module, func = spec.split(':') if ':' in spec else spec.rsplit('.', 1)
+    return getattr(importlib.import_module(module), func)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Profile the movie frames and report on the profiles.')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    p = sub.add_parser('report', help='summarise a profile file')
+    p.add_argument('profile')
+    p.add_argument('--top', type=int, default=10, help='number of slowest frames to show')
+    p.add_argument('--include-profiled', action='store_true',
+                   help='include the frames run under cProfile in the timings')
+
+    p = sub.add_parser('frames', help='render and profile some frames in this process')
+    p.add_argument('plot_func', help='e.g. plotting_ar.plot_as_datapoints')
+    p.add_argument('frames', type=int, nargs='+', help='start [stop [step]] of the frames')
+    p.add_argument('--savedir', default='./plots/')
+    p.add_argument('--output', default='profile.jsonl')
+    p.add_argument('--memory', default='rss', choices=['rss', 'tracemalloc', 'none'])
+    p.add_argument('--cprofile', type=int, default=None,
+                   help='run cProfile on every n-th frame (starting with the first)')
+    args = parser.parse_args(argv)
+
+    if args.command == 'report':
+        report(args.profile, top=args.top, include_profiled=args.include_profiled)
+        return
+
+    import matplotlib
+    matplotlib.use('Agg')
+    frames = range(*args.frames) if len(args.frames) > 1 else [args.frames[0]]
+    os.makedirs(args.savedir, exist_ok=True)
+    profile_frames(_plot_function(args.plot_func), frames, outfile=args.output,
+                   memory=None if args.memory == 'none' else args.memory,
+                   cprofile_frames=args.cprofile, savedir=args.savedir)
+    report(args.output)
+
+
+_enable_from_environment()
+
+if __name__ == '__main__':
+    # the plotting modules import `profiling`, which isn't this __main__ module
+    import profiling
+    profiling.main()
@@ -0,0 +1,238 @@
+import os
+from functools import lru_cache
+import numpy as np
+import pandas as pd
+
+# Heliographic (Stonyhurst or Carrington) positions projected to Earth-view
+# helioprojective coordinates, and helioprojective coordinates to the pixels
+# of a map, with numpy on whole arrays. It's the same as going through
+# astropy SkyCoord and the map WCS but without the overhead of each call,
+# for hundreds of thousands of points or thousands of frames.
+#
+# The projection is that of Thompson (2006, A&A 449, 791) which sunpy uses
+# (heliographic -> heliocentric -> helioprojective), and the pixels are the
+# gnomonic (TAN) projection of the FITS-WCS header. The observer (the Earth)
+# comes from the map header, or for points at any time from the B0 angle,
+# distance and L0 (the Carrington longitude of the disk centre) at 00:00
+# each day, which are worked out with sunpy a year at a time, saved to
+# OBSERVER_CACHE_DIR and interpolated. test_projection.py checks it against
+# sunpy and the astropy WCS.
+
+# sunpy.sun.constants.radius
+RSUN_KM = 695700.
+
+OBSERVER_CACHE_DIR = './.cache/observer/'
+
+ARCSEC_PER_DEG = 3600.
+_UNITS = {'deg': 1., 'arcmin': 1/60., 'arcsec': 1/3600., 'mas': 1/3.6e6}
+
+
+###################
+# the observer
+
+@lru_cache(maxsize=None)
+def _observer_year(year, cache_dir):
+    # the Earth at 00:00 on each day of a year and on the first day of the next
+    cache_file = os.path.join(cache_dir, 'earth_{:d}.npz'.format(year))
+    if os.path.exists(cache_file):
+        with np.load(cache_file) as f:
+            return {k: f[k] for k in f.files}
+
+    # only needed to make the table, once a year
+    from astropy import units as u
+    from astropy.time import Time
+    from astropy.coordinates import SkyCoord
+    from sunpy.coordinates import frames, get_earth
+    days = np.arange(np.datetime64('{:d}-01-01'.format(year)), np.datetime64('{:d}-01-02'.format(year + 1)))
+    times = Time(days.astype('datetime64[s]'))
+    earth = get_earth(times)
+    centre = SkyCoord(0*u.deg, 0*u.deg, frame=frames.HeliographicStonyhurst, obstime=times)
+    l0 = centre.transform_to(frames.HeliographicCarrington(observer='earth', obstime=times)).lon.deg
+    table = dict(times=days.astype('datetime64[ns]').astype(np.int64), b0=earth.lat.deg,
+                 lon=earth.lon.wrap_at(180*u.deg).deg, l0=l0, distance=earth.radius.to(u.km).value)
+
+    os.makedirs(cache_dir, exist_ok=True)
+    np.savez(cache_file + '.part.npz', **table)
+    os.replace(cache_file + '.part.npz', cache_file)
+    return table
+
+
+def observer(times, cache_dir=OBSERVER_CACHE_DIR):
+    """
+    The Earth as the observer at some times, interpolated between its
+    positions at 00:00 each day.
+
+    Parameters
+    ----------
+    times : array-like
+        anything `pd.to_datetime` understands.
+
+    Returns
+    -------
+    dict
+        arrays of 'b0' (the heliographic latitude of the disk centre), 'lon'
+        (the Stonyhurst longitude, 0 by definition), 'l0' (the Carrington
+        longitude of the disk centre) in degrees and 'distance' in km.
+    """
+    t = pd.to_datetime(pd.Series(np.atleast_1d(np.asarray(times)))).values.astype('datetime64[ns]')
+    if np.isnat(t).any():
+        raise ValueError('the times have to be given')
+    years = t.astype('datetime64[Y]').astype(np.int64) + 1970
+    tables = [_observer_year(int(y), cache_dir) for y in range(years.min(), years.max() + 1)]
+    # the years overlap by a day
+    table = {k: np.concatenate([tab[k][:-1] for tab in tables[:-1]] + [tables[-1][k]]) for k in tables[0]}
+
+    t = t.astype(np.int64)
+    result = {k: np.interp(t, table['times'], table[k]) for k in ('b0', 'lon', 'distance')}
+    # L0 goes down by about 13 degrees a day and wraps around
+    result['l0'] = np.mod(np.interp(t, table['times'], np.unwrap(table['l0'], period=360.)), 360.)
+    return result
+
+
+###################
+# the projections
+
+def hgs_to_hpc(lon, lat, b0, distance, observer_lon=0., radius=RSUN_KM):
+    """
+    Stonyhurst heliographic positions to helioprojective coordinates.
+
+    Parameters
+    ----------
+    lon, lat : array-like
+        the Stonyhurst longitudes and latitudes in degrees.
+    b0, distance : ~float or array
+        the heliographic latitude (degrees) and distance (km) of the observer.
+    observer_lon : ~float or array
+        the Stonyhurst longitude of the observer (0 for the Earth).
+    radius : ~float or array
+        the distance of the points from the centre of the Sun in km (on the surface by default).
+
+    Returns
+    -------
+    tx, ty : numpy.ndarray
+        the helioprojective longitude and latitude in arcsec.
+    visible : numpy.ndarray
+        bool, the point is on the side of the Sun facing the observer.
+    """
+    lon = np.radians(np.asarray(lon, dtype=float) - observer_lon)
+    lat = np.radians(np.asarray(lat, dtype=float))
+    b0 = np.radians(b0)
+    # heliocentric cartesian, z towards the observer
+    x = radius*np.cos(lat)*np.sin(lon)
+    y = radius*(np.sin(lat)*np.cos(b0) - np.cos(lat)*np.cos(lon)*np.sin(b0))
+    z = radius*(np.sin(lat)*np.sin(b0) + np.cos(lat)*np.cos(lon)*np.cos(b0))
+    dz = distance - z
+    tx = np.degrees(np.arctan2(x, dz))*ARCSEC_PER_DEG
+    ty = np.degrees(np.arctan2(y, np.hypot(x, dz)))*ARCSEC_PER_DEG
+    return tx, ty, z*distance > radius**2
+
+
+def earth_view(lon, lat, times, carrington=False, radius=RSUN_KM, cache_dir=OBSERVER_CACHE_DIR):
+    """
+    Heliographic positions seen from the Earth at their own times, e.g. the
+    hgs_x, hgs_y of the active region records at their event_starttime.
+
+    Parameters
+    ----------
+    lon, lat : array-like
+        in degrees.
+    times : array-like
+        the time of each point, or one time for all of them.
+    carrington : ~bool
+        the longitudes are Carrington (e.g. hgc_x) rather than Stonyhurst.
+
+    Returns
+    -------
+    tx, ty, visible : numpy.ndarray
+        as `hgs_to_hpc`.
+    """
+    earth = observer(times, cache_dir=cache_dir)
+    lon = np.asarray(lon, dtype=float)
+    if carrington:
+        lon = lon - earth['l0']
+    return hgs_to_hpc(lon, lat, earth['b0'], earth['distance'], observer_lon=earth['lon'], radius=radius)
+
+
+def _pc_matrix(header):
+    # the PCi_j matrix, from CROTA2 for the older headers
+    if any('pc{:d}_{:d}'.format(i, j) in header for i in (1, 2) for j in (1, 2)):
+        return np.array([[header.get('pc1_1', 1.), header.get('pc1_2', 0.)],
+                         [header.get('pc2_1', 0.), header.get('pc2_2', 1.)]], dtype=float)
+    rho = np.radians(header.get('crota2', 0.))
+    ratio = header['cdelt2']/header['cdelt1']
+    return np.array([[np.cos(rho), -ratio*np.sin(rho)], [np.sin(rho)/ratio, np.cos(rho)]])
+
+
+def hpc_to_pixel(tx, ty, header):
+    """
+    Helioprojective coordinates to the pixels of a map, as its
+    `wcs.world_to_pixel` (0 based) would give them.
+
+    Parameters
+    ----------
+    tx, ty : array-like
+        in arcsec, e.g. the hpc_x, hpc_y of the active region records.
+    header : dict
+        the FITS-WCS header of the map (e.g. `map_grid.map_header` or
+        `mapy.meta`), with a TAN projection.
+
+    Returns
+    -------
+    x, y : numpy.ndarray
+    """
+    if not (header.get('ctype1', '').endswith('-TAN') and header.get('ctype2', '').endswith('-TAN')):
+        raise ValueError('only TAN projection headers are done, not {}/{}'.format(
+                         header.get('ctype1'), header.get('ctype2')))
+    if header.get('lonpole', 180.) != 180.:
+        raise ValueError('only headers with LONPOLE 180 are done')
+    scale1, scale2 = _UNITS[header.get('cunit1', 'deg')], _UNITS[header.get('cunit2', 'deg')]
+    a0, d0 = np.radians(header.get('crval1', 0.)*scale1), np.radians(header.get('crval2', 0.)*scale2)
+    a = np.radians(np.asarray(tx, dtype=float)/ARCSEC_PER_DEG) - a0
+    d = np.radians(np.asarray(ty, dtype=float)/ARCSEC_PER_DEG)
+
+    # the gnomonic projection onto the plane touching the sky at crval
+    cos_c = np.sin(d0)*np.sin(d) + np.cos(d0)*np.cos(d)*np.cos(a)
+    px = np.degrees(np.cos(d)*np.sin(a)/cos_c)/scale1/header['cdelt1']
+    py = np.degrees((np.cos(d0)*np.sin(d) - np.sin(d0)*np.cos(d)*np.cos(a))/cos_c)/scale2/header['cdelt2']
+    inverse = np.linalg.inv(_pc_matrix(header))
+    x = inverse[0, 0]*px + inverse[0, 1]*py + header['crpix1'] - 1
+    y = inverse[1, 0]*px + inverse[1, 1]*py + header['crpix2'] - 1
+    return x, y
+
+
+def hgs_to_pixel(lon, lat, header, carrington=False, cache_dir=OBSERVER_CACHE_DIR):
+    """
+    Heliographic positions to the pixels of a map, at the time of the map
+    (like the grid lines of `map_grid.graticule`).
+
+    Parameters
+    ----------
+    lon, lat : array-like
+        in degrees.
+    header : dict
+        the map header, its observer (hglt_obs, hgln_obs, dsun_obs) is used
+        if it has one, otherwise the Earth at date-obs.
+    carrington : ~bool
+        the longitudes are Carrington rather than Stonyhurst.
+
+    Returns
+    -------
+    x, y : numpy.ndarray
+        the pixels (0 based).
+    visible : numpy.ndarray
+        bool, the point is on the side of the Sun facing the observer.
+    """
+    if carrington or not all(k in header for k in ('hglt_obs', 'hgln_obs', 'dsun_obs')):
+        earth = observer(header['date-obs'], cache_dir=cache_dir)
+    if all(k in header for k in ('hglt_obs', 'hgln_obs', 'dsun_obs')):
+        b0, observer_lon, distance = header['hglt_obs'], header['hgln_obs'], header['dsun_obs']/1e3
+    else:
+        b0, observer_lon, distance = earth['b0'][0], earth['lon'][0], earth['distance'][0]
+    lon = np.asarray(lon, dtype=float)
+    if carrington:
+        # the Carrington longitude of the Stonyhurst longitude 0 at the map time
+        lon = lon - earth['l0'][0]
+    radius = header.get('rsun_ref', RSUN_KM*1e3)/1e3
+    tx, ty, visible = hgs_to_hpc(lon, lat, b0, distance, observer_lon=observer_lon, radius=radius)
+    x, y = hpc_to_pixel(tx, ty, header)
+    return x, y, visible
@@ -0,0 +1,291 @@
+import numpy as np
+import pandas as pd
+from flare_match import goes_class_letter
+
+# Time resolved flare rates of each GOES class from the flare list
+# (since_1986_c1_solarcycle_flares.csv), and the waiting times between
+# flares in each solar cycle:
+#
+#   blocks = class_blocks(flares)                  # piecewise constant rates
+#   rates = kernel_rates(flares, bandwidth='27D')  # smooth rates
+#   waits = waiting_times(flares, solar_cycles())
+#   waiting_time_distributions(waits)
+#
+# Bayesian blocks (Scargle et al. 2013, ApJ 764, 167) is the piecewise
+# constant rate with the best fitness given a prior on the number of
+# blocks, found by dynamic programming over the sorted peak times. The
+# textbook version tries every earlier start for the last block at each
+# event, which is O(n^2). Here the starts that can't be the best any more
+# are dropped as it goes (the pruning of Killick et al. 2012, exact for the
+# Poisson likelihood), so only the cells since the last few change points
+# are looked at, and the events are counted in daily cells so the work
+# depends on the number of days rather than the number of flares.
+#
+# The kernel rate is the number of flares per bin convolved with a Gaussian
+# by FFT, divided by the same convolution of the observing window so the
+# rate doesn't drop off at the ends. Rates are per day, waiting times in hours.
+
+CLASSES = ('C', 'M', 'X', 'all')
+
+# the false alarm probability of a change point, for the block prior
+P0 = 0.05
+
+# how many cells between dropping the starts that can't win (see bayesian_blocks)
+PRUNE_EVERY = 4
+
+DAY_NS = 86400*10**9
+HOUR_NS = 3600*10**9
+
+
+def _class_times(flares, classes, time_column, flux_column):
+    # the sorted peak times (int64 ns) of the flares of each class
+    times = pd.to_datetime(flares[time_column]).values.astype('datetime64[ns]')
+    letters = goes_class_letter(flares[flux_column].values)
+    good = ~np.isnat(times)
+    by_class = {}
+    for c in classes:
+        keep = good if c == 'all' else good & (letters == c)
+        by_class[c] = np.sort(times[keep].astype(np.int64))
+    return by_class
+
+
+def bayesian_blocks(times, p0=P0, ncp_prior=None, resolution='1D'):
+    """
+    The Bayesian blocks of a list of event times.
+
+    Parameters
+    ----------
+    times : array-like
+        the event times (e.g. the flare peak times), in any order.
+    p0 : ~float
+        the false alarm probability of a change point, used to work out
+        `ncp_prior` as in Scargle et al. (2013) eq. 21.
+    ncp_prior : ~float, optional
+        the prior on the number of blocks (the fitness given up by each
+        new block), it has to be positive.
+    resolution : ~str or None
+        the events are counted in bins of this size (anything `pd.Timedelta`
+        understands) and the blocks start and end on the bin edges. None
+        makes each event time its own cell with the edges half way between
+        events, which is exact but goes like n^2 when the rate hardly
+        changes (nothing gets pruned), while the bins keep it to the
+        number of bins whatever the number of events.
+
+    Returns
+    -------
+    pandas.DataFrame
+        one row per block with its start and end, n (the number of events)
+        and rate (per day).
+    """
+    t = np.sort(pd.to_datetime(np.ravel(times)).dropna().as_unit('ns').asi8)
+    columns = ['start', 'end', 'n', 'rate']
+    if len(t) == 0:
+        return pd.DataFrame(columns=columns)
+    if resolution is None:
+        # repeated times are one cell with their count
+        cells, counts = np.unique(t, return_counts=True)
+        edges = np.r_[cells[0], cells[:-1] + (cells[1:] - cells[:-1])//2, cells[-1]]
+    else:
+        # every bin from the first event to the last is a cell, empty or not
+        width = pd.Timedelta(resolution).value
+        first = t[0]//width
+        counts = np.bincount(t//width - first)
+        edges = (first + np.arange(len(counts) + 1))*width
+    n = len(counts)
+    if ncp_prior is None:
+        ncp_prior = 4 - np.log(73.53*p0*n**-0.478)
+    if ncp_prior <= 0:
+        raise ValueError('ncp_prior has to be positive, not {:g}'.format(ncp_prior))
+
+    if n == 1:
+        starts = np.array([0])
+    else:
+        # from each edge to the end, so a block's length is a difference of two
+        to_end = (edges[-1] - edges)/DAY_NS
+        cumulative = np.r_[0, np.cumsum(counts)].astype(float)
+        best = np.zeros(n + 1)
+        last = np.zeros(n, dtype=np.int64)
+        buffer = np.zeros(n + 1, dtype=np.int64)
+        m = 1
+        for r in range(n):
+            candidates = buffer[:m]
+            count = cumulative[r + 1] - cumulative[candidates]
+            # (empty blocks have a fitness of 0, not 0*log(0))
+            length = to_end[candidates] - to_end[r + 1]
+            fitness = best[candidates] + count*np.log(np.maximum(count, 1e-300)/length)
+            i = fitness.argmax()
+            best[r + 1] = fitness[i] - ncp_prior
+            last[r] = candidates[i]
+            # a start that's already a block's worth behind can never be the
+            # best again, dropping them every few cells saves numpy calls
+            if r % PRUNE_EVERY == 0:
+                kept = candidates[fitness > best[r + 1]]
+                m = len(kept)
+                buffer[:m] = kept
+            buffer[m] = r + 1
+            m += 1
+
+        starts = []
+        r = n
+        while r > 0:
+            starts.append(last[r - 1])
+            r = last[r - 1]
+        starts = np.array(starts[::-1])
+
+    bounds = np.r_[starts, n]
+    n_events = np.add.reduceat(counts, starts)
+    width = (edges[bounds[1:]] - edges[bounds[:-1]])/DAY_NS
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rate = np.where(width > 0, n_events/width, np.nan)
+    return pd.DataFrame({'start': edges[bounds[:-1]].astype('datetime64[ns]'),
+                         'end': edges[bounds[1:]].astype('datetime64[ns]'), 'n': n_events, 'rate': rate})
+
+
+def class_blocks(flares, classes=CLASSES, p0=P0, resolution='1D', time_column='event_peaktime',
+                 flux_column='goes_class'):
+    """
+    The `bayesian_blocks` of the peak times of the flares of each class.
+
+    Returns
+    -------
+    dict
+        the blocks of each class.
+    """
+    by_class = _class_times(flares, classes, time_column, flux_column)
+    return {c: bayesian_blocks(t.astype('datetime64[ns]'), p0=p0, resolution=resolution) for c, t in by_class.items()}
+
+
+def kernel_rates(flares, bandwidth='27D', bin='1D', classes=CLASSES, start=None, end=None,
+                 time_column='event_peaktime', flux_column='goes_class'):
+    """
+    The rate of flares of each class smoothed with a Gaussian kernel.
+
+    Parameters
+    ----------
+    bandwidth : ~str
+        the standard deviation of the kernel, anything `pd.Timedelta` understands.
+    bin : ~str
+        the bins the flares are counted in before smoothing (the spacing of the result).
+    start, end : ~str, optional
+        the observing window, by default from the first to the last flare.
+
+    Returns
+    -------
+    pandas.DataFrame
+        the rate (flares per day) of each class at the start of each bin.
+    """
+    by_class = _class_times(flares, classes, time_column, flux_column)
+    width = pd.Timedelta(bin).value
+    sigma = pd.Timedelta(bandwidth).value/width
+    every = by_class['all'] if 'all' in by_class else np.sort(np.concatenate(list(by_class.values())))
+    t0 = pd.Timestamp(start).value if start is not None else (every[0] if len(every) else 0)
+    t1 = pd.Timestamp(end).value if end is not None else (every[-1] if len(every) else 0)
+    t0 = t0 - t0 % width
+    n_bins = int((t1 - t0)//width) + 1
+
+    counts = np.zeros((len(by_class), n_bins))
+    for k, t in enumerate(by_class.values()):
+        b = (t - t0)//width
+        counts[k] = np.bincount(b[(b >= 0) & (b < n_bins)], minlength=n_bins)
+
+    # the kernel out to 5 sigma, zero padded so the ends don't wrap around
+    half = int(np.ceil(5*sigma))
+    kernel = np.exp(-0.5*(np.arange(-half, half + 1)/max(sigma, 1e-9))**2)
+    kernel /= kernel.sum()
+    n_fft = 2**int(np.ceil(np.log2(n_bins + len(kernel))))
+    kernel_fft = np.fft.rfft(kernel, n_fft)
+    smooth = np.fft.irfft(np.fft.rfft(counts, n_fft, axis=1)*kernel_fft, n_fft, axis=1)[:, half:half + n_bins]
+    window = np.fft.irfft(np.fft.rfft(np.ones(n_bins), n_fft)*kernel_fft, n_fft)[half:half + n_bins]
+
+    index = pd.DatetimeIndex((t0 + np.arange(n_bins)*width).astype('datetime64[ns]'), name='times')
+    return pd.DataFrame((smooth/window).T*(DAY_NS/width), index=index, columns=list(by_class))
+
+
+def waiting_times(flares, cycles=None, classes=CLASSES, time_column='event_peaktime', flux_column='goes_class'):
+    """
+    The waiting times between one flare of a class and the next, within
+    each solar cycle.
+
+    Parameters
+    ----------
+    cycles : ~pandas.DataFrame, optional
+        the cycles from `solar_cycles.solar_cycles`, by default the whole
+        list is one (cycle 0).
+
+    Returns
+    -------
+    pandas.DataFrame
+        class, cycle, time (of the second flare) and wait (hours). Waits
+        from one cycle into the next are left out.
+    """
+    by_class = _class_times(flares, classes, time_column, flux_column)
+    if cycles is not None:
+        starts = cycles['start'].values.astype('datetime64[ns]').astype(np.int64)
+        ends = cycles['end'].values.astype('datetime64[ns]')
+        ends = np.where(np.isnat(ends), np.iinfo(np.int64).max, ends.astype(np.int64))
+
+    tables = []
+    for c, t in by_class.items():
+        if cycles is not None:
+            # the cycle each flare is in, 0 for none
+            k = np.searchsorted(starts, t, 'right') - 1
+            inside = (k >= 0) & (t < ends[np.maximum(k, 0)])
+            labels = np.where(inside, cycles.index.values[np.maximum(k, 0)], 0)
+        else:
+            labels = np.zeros(len(t), dtype=np.int64)
+        same = np.flatnonzero(labels[1:] == labels[:-1]) + 1
+        tables.append(pd.DataFrame({'class': c, 'cycle': labels[same],
+                                    'time': t[same].astype('datetime64[ns]'),
+                                    'wait': (t[same] - t[same - 1])/HOUR_NS}))
+    return pd.concat(tables, ignore_index=True)
+
+
+def waiting_time_distributions(waits, bins=None):
+    """
+    The probability density of the waiting times of each cycle and class,
+    all in one bincount.
+
+    Parameters
+    ----------
+    waits : ~pandas.DataFrame
+        from `waiting_times`.
+    bins : array, optional
+        the bin edges in hours, by default 10 per decade from the shortest
+        (non zero) to the longest wait. Waits outside the bins (like the
+        zero waits of flares peaking in the same minute) still count in the
+        total, so the density of a column sums to a bit under 1.
+
+    Returns
+    -------
+    pandas.DataFrame
+        the density (per hour) indexed by the bin centres (geometric), with
+        a column for each (cycle, class), and the mean, median and
+        coefficient of variation of each in `.attrs['stats']`.
+    """
+    wait = waits['wait'].values
+    if bins is None:
+        positive = wait[wait > 0]
+        lo, hi = (positive.min(), positive.max()) if len(positive) else (1., 10.)
+        bins = np.logspace(np.floor(np.log10(lo)*10)/10, np.ceil(np.log10(hi)*10)/10,
+                           int(np.ceil(np.log10(hi)*10) - np.floor(np.log10(lo)*10)) + 1)
+    bins = np.asarray(bins, dtype=float)
+    n_bins = len(bins) - 1
+
+    group, groups = pd.MultiIndex.from_frame(waits[['cycle', 'class']]).factorize(sort=True)
+    b = np.searchsorted(bins, wait, 'right') - 1
+    inside = (b >= 0) & (b < n_bins)
+    counts = np.bincount(group[inside]*n_bins + b[inside], minlength=len(groups)*n_bins)
+    counts = counts.reshape(len(groups), n_bins).astype(float)
+    totals = np.bincount(group, minlength=len(groups))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        density = counts/totals[:, None]/np.diff(bins)
+
+    table = pd.DataFrame(density.T, index=pd.Index(np.sqrt(bins[:-1]*bins[1:]), name='wait'),
+                         columns=pd.MultiIndex.from_tuples(list(groups), names=['cycle', 'class']))
+
+    grouped = waits.groupby(['cycle', 'class'])['wait']
+    stats = pd.DataFrame({'n': grouped.size(), 'mean': grouped.mean(), 'median': grouped.median(),
+                          'cv': grouped.std()/grouped.mean()})
+    table.attrs['stats'] = stats
+    table.attrs['bins'] = bins
+    return table
@@ -0,0 +1,204 @@
+import os
+import importlib
+import subprocess
+import multiprocessing
+from profiling import stage
+
+# Driver for rendering the movie frames in parallel. The plotting
+# functions (e.g. plotting_ar.plot_as_datapoints) are module level
+# functions that take the frame index, so they can be sent to a pool of
+# worker processes. Each worker imports the plotting module and loads its
+# dataset once, and then renders whatever frames it is handed.
+
+
+def frame_path(savedir, filename, i):
+    """
+    The path of the png for frame i, filename is a format string like 'test_{:04d}.png'.
+    """
+    return os.path.join(savedir, filename.format(i))
+
+
+# the last 8 bytes of every png (the IEND chunk and its crc)
+PNG_END = b'IEND\xaeB`\x82'
+
+
+def save_png(path, fig=None, **savefig_kwargs):
+    """
+    Save a figure (the current pyplot one by default) to path, written
+    under a temporary name and renamed into place, so that a frame that's
+    cut off half way (e.g. the run is killed) is never left as the png.
+    """
+    if fig is None:
+        import matplotlib.pyplot as plt
+        fig = plt.gcf()
+    root, ext = os.path.splitext(path)
+    part = '{:s}.part-{:d}{:s}'.format(root, os.getpid(), ext)
+    try:
+        fig.savefig(part, **savefig_kwargs)
+        os.replace(part, path)
+    finally:
+        if os.path.exists(part):
+            os.remove(part)
+
+
+def _png_complete(path):
+    # a png that was cut off doesn't end with the IEND chunk
+    with open(path, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        if f.tell() < len(PNG_END):
+            return False
+        f.seek(-len(PNG_END), os.SEEK_END)
+        return f.read() == PNG_END
+
+
+def frame_is_current(path, data_mtime=None):
+    """
+    Check if a frame already exists, is a whole png and is newer than the input data.
+
+    Parameters
+    ----------
+    path : ~str
+        the path of the png.
+    data_mtime : ~float, optional
+        modification time of the input data. If None any existing frame counts.
+
+    Returns
+    -------
+    bool
+    """
+    if not os.path.exists(path) or not _png_complete(path):
+        return False
+    if data_mtime is None:
+        return True
+    return os.path.getmtime(path) > data_mtime
+
+
+def missing_frames(frames, savedir, filename, data_file=None):
+    """
+    Return the frame indices that still need to be rendered, i.e. that
+    have no png or whose png is older than the data_file.
+    """
+    data_mtime = os.path.getmtime(data_file) if data_file is not None else None
+    return [i for i in frames
+            if not frame_is_current(frame_path(savedir, filename, i), data_mtime)]
+
+
+def _init_worker(module_name, worker_init=None):
+    # no display in the workers, and the dataset of the plotting
+    # module is loaded here, once per process.
+    import matplotlib
+    matplotlib.use('Agg')
+    module = importlib.import_module(module_name)
+    if worker_init is not None:
+        worker_init(module)
+    if hasattr(module, 'dataset'):
+        module.dataset().ar_days
+
+
+def _render_frame(args):
+    plot_func, i, savedir, plot_kwargs = args
+    plot_func(i, savedir=savedir, **plot_kwargs)
+    return i
+
+
+def render_frames(plot_func, frames, savedir='./plots/', filename='test_{:04d}.png',
+                  data_file=None, processes=None, worker_init=None, mp_context=None, **plot_kwargs):
+    """
+    Render frames over a pool of processes, skipping the ones that are
+    already done so that an interrupted run can be restarted.
+
+    Parameters
+    ----------
+    plot_func : function
+        a module level plotting function called as plot_func(i, savedir=savedir, **plot_kwargs).
+    frames : iterable of ~int
+        the frame indices to render (can be a sub-range of the movie).
+    savedir : ~str
+        where the pngs are saved.
+    filename : ~str
+        format string of the png names, must match what plot_func saves.
+    data_file : ~str, optional
+        the input data file, frames older than it are rendered again.
+    processes : ~int, optional
+        number of worker processes, defaults to the number of cpus.
+    worker_init : function, optional
+        called with the plotting module in each worker before its dataset
+        is loaded, e.g. to point it at another data file. It has to be
+        picklable (a module level function or a functools.partial of one).
+    mp_context : ~str, optional
+        the multiprocessing start method of the pool, e.g. 'spawn' when
+        rendering from a thread.
+
+    Returns
+    -------
+    list
+        the frame indices that were rendered.
+    """
+    todo = missing_frames(frames, savedir, filename, data_file=data_file)
+    if len(todo) == 0:
+        return todo
+
+    os.makedirs(savedir, exist_ok=True)
+    tasks = [(plot_func, i, savedir, plot_kwargs) for i in todo]
+    context = multiprocessing.get_context(mp_context)
+    with context.Pool(processes, initializer=_init_worker,
+                      initargs=(plot_func.__module__, worker_init)) as pool:
+        for i in pool.imap_unordered(_render_frame, tasks):
+            print(i)
+    return todo
+
+
+def encode_movie(frames, outfile, savedir='./plots/', filename='test_{:04d}.png', fps=10):
+    """
+    Run ffmpeg over the pngs to make the movie. This is only done if
+    every frame is there, otherwise a ValueError is raised. A RuntimeError
+    is raised if ffmpeg fails.
+
+    Parameters
+    ----------
+    frames : range
+        all the frames of the movie, in order.
+    outfile : ~str
+        the name of the movie file.
+    """
+    missing = missing_frames(frames, savedir, filename)
+    if len(missing) > 0:
+        raise ValueError('{:d} frames are missing (first is {:d}), '
+                         'not making the movie'.format(len(missing), missing[0]))
+
+    with stage('ffmpeg'):
+        returncode = subprocess.call(['ffmpeg', '-r', str(fps), '-f', 'image2', '-s', '1920x1080',
+                                      '-start_number', str(frames[0]),
+                                      '-i', os.path.join(savedir, filename.replace('{:04d}', '%04d')),
+                                      '-vcodec', 'libx264', '-crf', '25', '-pix_fmt', 'yuv420p', outfile])
+    if returncode != 0:
+        raise RuntimeError('ffmpeg failed making {:s} (exit code {:d})'.format(outfile, returncode))
+
+
+def render_movie(plot_func, frames, outfile, savedir='./plots/', filename='test_{:04d}.png',
+                 data_file=None, subset=None, processes=None, fps=10, **plot_kwargs):
+    """
+    Render the frames of a movie in parallel and make the movie once all of
+    them exist.
+
+    Parameters
+    ----------
+    plot_func : function
+        the module level plotting function, see `render_frames`.
+    frames : range
+        all the frames of the movie.
+    outfile : ~str
+        the name of the movie file.
+    subset : range, optional
+        only render these frames now. The movie is still only made
+        when all of `frames` have been rendered.
+
+    The other parameters are passed to `render_frames`.
+    """
+    render_frames(plot_func, frames if subset is None else subset, savedir=savedir,
+                  filename=filename, data_file=data_file, processes=processes, **plot_kwargs)
+
+    if len(missing_frames(frames, savedir, filename, data_file=data_file)) == 0:
+        encode_movie(frames, outfile, savedir=savedir, filename=filename, fps=fps)
+    else:
+        print('not all frames rendered yet, skipping ffmpeg')
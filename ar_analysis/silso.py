@@ -0,0 +1,63 @@
+import numpy as np
+import pandas as pd
+from data_cache import load_csv
+
+# Reader for the SILSO sunspot number files (https://www.sidc.be/silso/datafiles),
+# both the monthly SN_m_tot_V2.0.csv and the daily SN_d_tot_V2.0.csv. Missing
+# values are given as -1 in these files, they are masked as NaN here.
+
+MONTHLY_COLUMNS = ['year', 'month', 'decimal_date', 'ssn', 'ssn_dev', 'number_obs', 'indicator']
+DAILY_COLUMNS = ['year', 'month', 'day', 'decimal_date', 'ssn', 'ssn_dev', 'number_obs', 'indicator']
+
+DTYPES = dict(year=np.int16, month=np.int8, day=np.int8, decimal_date=np.float64,
+              ssn=np.float64, ssn_dev=np.float32, number_obs='Int32', indicator=np.int8)
+
+
+def silso_columns(filename):
+    """
+    Get the column names of the file from the number of fields in the first line.
+    """
+    with open(filename) as f:
+        n_fields = len(f.readline().split(';'))
+    if n_fields == len(DAILY_COLUMNS):
+        return DAILY_COLUMNS
+    if n_fields == len(MONTHLY_COLUMNS):
+        return MONTHLY_COLUMNS
+    raise ValueError('{:s} is not a SILSO daily or monthly file'.format(filename))
+
+
+def read_silso(filename, cache=False):
+    """
+    Read a SILSO daily or monthly sunspot number file.
+
+    Parameters
+    ----------
+    filename : ~str
+        the file, e.g. '../SN_d_tot_V2.0.csv' or '../SN_m_tot_V2.0.csv'.
+    cache : ~bool
+        load the file through the columnar cache (see `data_cache.load_csv`).
+
+    Returns
+    -------
+    pandas.DataFrame
+        indexed by `times` (the day, or the first of the month for the monthly file),
+        with the -1 missing values of ssn, ssn_dev and number_obs masked.
+    """
+    names = silso_columns(filename)
+    if cache:
+        ssn = load_csv(filename, names=names, delimiter=';')
+    else:
+        ssn = pd.read_csv(filename, names=names, delimiter=';')
+
+    ssn = ssn.astype({k: v for k, v in DTYPES.items() if k in names})
+    for col in ['ssn', 'ssn_dev', 'number_obs']:
+        ssn[col] = ssn[col].mask(ssn[col] < 0)
+
+    # build the dates as datetime64 month + day offsets rather than one datetime per row
+    months = (ssn['year'].values.astype(np.int64) - 1970)*12 + ssn['month'].values - 1
+    times = months.astype('datetime64[M]').astype('datetime64[D]')
+    if 'day' in names:
+        times = times + (ssn['day'].values.astype(np.int64) - 1)
+    ssn['times'] = times.astype('datetime64[ns]')
+
+    return ssn.set_index('times')
@@ -0,0 +1,233 @@
+from functools import lru_cache
+import numpy as np
+import pandas as pd
+from silso import read_silso
+from ar_counts import SMOOTH_13_MONTH
+
+# The solar cycles found from the sunspot number rather than typed in: the
+# minima of the 13-month smoothed monthly SILSO sunspot number (back to
+# 1749) are the starts of the cycles, numbered from cycle 1 which started
+# in February 1755. Tables of active regions or flares are split up by
+# cycle with one sort by time and a searchsorted of the minima (see
+# `CyclePartition`), so any cycle or set of cycles is a slice.
+
+SSN_FILE = '../SN_m_tot_V2.0.csv'
+
+# the minimum at the start of solar cycle 1
+CYCLE_1_START = '1755-02-01'
+
+# the smoothed SSN is a cycle minimum if it's the lowest within this many
+# months either side (cycles are 9 to 14 years long)
+MINIMUM_WINDOW = 42
+
+
+def smoothed_ssn(monthly):
+    """
+    The 13-month smoothed sunspot number (the tapered 13-month running mean,
+    NaN for the first and last 6 months) of a monthly series.
+    """
+    smoothed = np.full(len(monthly), np.nan)
+    if len(monthly) >= len(SMOOTH_13_MONTH):
+        smoothed[6:-6] = np.convolve(np.asarray(monthly, dtype=float), SMOOTH_13_MONTH, mode='valid')
+    return pd.Series(smoothed, index=monthly.index)
+
+
+def find_minima(smoothed, window=MINIMUM_WINDOW):
+    """
+    The cycle minima of a smoothed sunspot number series: the points that are
+    the lowest within `window` samples either side. Where the lowest value is
+    repeated (e.g. the months of zeros in 1810) the middle one is used.
+
+    Returns
+    -------
+    pandas.DataFrame
+        indexed by the time of each minimum, with the smoothed `ssn` and
+        `provisional`, True if it's within `window` samples of the end of the
+        series so that a lower value could still come.
+    """
+    valid = smoothed.dropna()
+    values = valid.values
+    lowest = valid.rolling(2*window + 1, center=True, min_periods=1).min().values
+    is_min = values == lowest
+
+    # runs of equal lowest values count once, at their middle
+    run_start = np.flatnonzero(is_min & ~np.r_[False, is_min[:-1] & (values[1:] == values[:-1])])
+    run_end = np.flatnonzero(is_min & ~np.r_[is_min[1:] & (values[1:] == values[:-1]), False])
+    middle = (run_start + run_end)//2
+
+    return pd.DataFrame({'ssn': values[middle], 'provisional': middle >= len(values) - window},
+                        index=valid.index[middle])
+
+
+def cycles_from_minima(minima, smoothed, first_cycle_start=CYCLE_1_START):
+    """
+    The table of the solar cycles between the minima.
+
+    Returns
+    -------
+    pandas.DataFrame
+        indexed by cycle number: start and end (the minima, the end of the
+        last cycle is NaT), max_time and max_ssn (the smoothed maximum, NaN
+        for the last cycle as it hasn't ended), min_ssn, length_years and
+        provisional (the cycle ends or starts on a provisional minimum).
+    """
+    starts = minima.index
+    # number the cycles from the minimum nearest the start of cycle 1
+    first = np.argmin(np.abs(starts - pd.Timestamp(first_cycle_start)))
+    numbers = np.arange(len(starts)) - first + 1
+    ends = starts[1:].append(pd.DatetimeIndex([pd.NaT]))
+
+    max_time, max_ssn = [], []
+    for start, end in zip(starts, ends):
+        during = smoothed[start:end].dropna() if end is not pd.NaT else []
+        max_time.append(during.idxmax() if len(during) else pd.NaT)
+        max_ssn.append(during.max() if len(during) else np.nan)
+
+    provisional = minima['provisional'].values
+    cycles = pd.DataFrame({'start': starts, 'end': ends, 'max_time': max_time, 'max_ssn': max_ssn,
+                           'min_ssn': minima['ssn'].values,
+                           'length_years': (ends - starts).days/365.25,
+                           'provisional': provisional | np.r_[provisional[1:], False]},
+                          index=pd.Index(numbers, name='cycle'))
+    return cycles
+
+
+@lru_cache(maxsize=None)
+def solar_cycles(ssn_file=SSN_FILE, window=MINIMUM_WINDOW):
+    """
+    The solar cycles found in a SILSO monthly sunspot number file (see
+    `cycles_from_minima`), worked out once per file.
+    """
+    smoothed = smoothed_ssn(read_silso(ssn_file)['ssn'])
+    return cycles_from_minima(find_minima(smoothed, window=window), smoothed)
+
+
+def cycle_windows(cycles, numbers=None):
+    """
+    The [start, end) windows of the cycles as used by flare_distribution,
+    e.g. {'sc23': (start, end), ...}. The open end of the last cycle is left
+    far in the future.
+    """
+    if numbers is not None:
+        cycles = cycles.loc[list(numbers)]
+    far = pd.Timestamp('2262-01-01')
+    return {'sc{:d}'.format(n): (row.start, far if pd.isna(row.end) else row.end)
+            for n, row in cycles.iterrows()}
+
+
+class CyclePartition:
+    """
+    A table (of active regions, flares ...) split up by solar cycle. It's
+    sorted by time once and the rows of each cycle are found with a
+    searchsorted of the cycle starts, so each cycle is a contiguous slice.
+
+    Parameters
+    ----------
+    table : ~pandas.DataFrame
+        the table.
+    cycles : ~pandas.DataFrame
+        the cycles, from `solar_cycles`.
+    time_column : ~str
+        the times to split on, e.g. 'event_starttime' or 'event_peaktime'.
+
+    Attributes
+    ----------
+    data : ~pandas.DataFrame
+        the table sorted by time.
+    bounds : ~pandas.DataFrame
+        the first and last + 1 rows of `data` in each cycle.
+    labels : ~numpy.ndarray
+        the cycle number of each row of `data` (0 if it's in none of them).
+    """
+
+    def __init__(self, table, cycles, time_column='event_starttime'):
+        times = pd.to_datetime(table[time_column]).values.astype('datetime64[ns]')
+        order = np.argsort(times, kind='stable')
+        self.data = table.iloc[order]
+        self.cycles = cycles
+        self.time_column = time_column
+        times = times[order]
+
+        starts = cycles['start'].values.astype('datetime64[ns]')
+        ends = cycles['end'].values.astype('datetime64[ns]')
+        lo = np.searchsorted(times, starts, 'left')
+        hi = np.where(np.isnat(ends), len(times), np.searchsorted(times, ends, 'left'))
+        self.bounds = pd.DataFrame({'lo': lo, 'hi': hi}, index=cycles.index)
+
+        self.labels = np.zeros(len(times), dtype=np.int64)
+        for n, (a, b) in self.bounds.iterrows():
+            self.labels[a:b] = n
+        self._slices = {}
+
+    def __len__(self):
+        return len(self.data)
+
+    def __getitem__(self, number):
+        return self.cycle(number)
+
+    @property
+    def present(self):
+        """
+        The numbers of the cycles with any rows in the table.
+        """
+        return list(self.bounds.index[self.bounds['hi'] > self.bounds['lo']])
+
+    def cycle(self, number):
+        """
+        The rows of the table in cycle `number` (kept, so asking again is free).
+        """
+        if number not in self._slices:
+            lo, hi = self.bounds.loc[number]
+            self._slices[number] = self.data.iloc[lo:hi]
+        return self._slices[number]
+
+    def cycles_of(self, numbers):
+        """
+        The rows in any of the cycles, in time order.
+        """
+        return self.data[np.isin(self.labels, list(numbers))]
+
+    def groupby(self):
+        """
+        `data` grouped by cycle number, for statistics of every cycle at once.
+        """
+        return self.data.groupby(pd.Series(self.labels, index=self.data.index, name='cycle'))
+
+
+def ar_cycle_stats(partition):
+    """
+    Statistics of the active regions in each cycle of a `CyclePartition` of an
+    active region table: the number of daily records and of NOAA regions, the
+    mean absolute latitude, area at disk centre and number of spots.
+    """
+    data = partition.data
+    cycle = pd.Series(partition.labels, index=data.index, name='cycle')
+    grouped = data.groupby(cycle)
+    stats = pd.DataFrame({'n_records': grouped.size(),
+                          'n_regions': grouped['ar_noaanum'].nunique(),
+                          'mean_abs_latitude': data['hgs_y'].abs().groupby(cycle).mean(),
+                          'mean_area': grouped['area_atdiskcenter'].mean(),
+                          'mean_spots': grouped['ar_numspots'].mean()})
+    return _with_cycles(stats, partition)
+
+
+def flare_cycle_stats(partition, flux_column='goes_class'):
+    """
+    Statistics of the flares in each cycle of a `CyclePartition` of a flare
+    table: the number of flares, of each GOES class, and the largest flux.
+    """
+    from flare_match import goes_class_letter, GOES_CLASSES
+    data = partition.data
+    letters = pd.Series(goes_class_letter(data[flux_column].values), index=data.index)
+    cycle = pd.Series(partition.labels, index=data.index, name='cycle')
+    stats = pd.crosstab(cycle, letters).reindex(columns=GOES_CLASSES, fill_value=0)
+    stats.insert(0, 'n_flares', cycle.value_counts())
+    stats['max_flux'] = data[flux_column].astype(float).groupby(cycle).max()
+    return _with_cycles(stats, partition)
+
+
+def _with_cycles(stats, partition):
+    # the stats of the cycles with data, with their start/end, and without the rows in no cycle
+    stats = stats.drop(index=0, errors='ignore').reindex(partition.present)
+    stats.index.name = 'cycle'
+    return partition.cycles[['start', 'end']].join(stats, how='inner')
@@ -0,0 +1,261 @@
+import os
+import hashlib
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+from scipy.signal import lombscargle
+
+# Spectral analysis of the sunspot number (or any other evenly sampled series,
+# e.g. the daily AR counts). The daily SILSO series has missing days before
+# 1849 (NaN from silso.read_silso), these are linearly interpolated for the
+# FFT based methods and just left out by the Lomb-Scargle periodogram. Times
+# are in days and frequencies in cycles per day throughout.
+#
+# The slow transforms are saved to SPECTRAL_CACHE_DIR keyed on a hash of the
+# input and the parameters, so e.g. replotting the wavelet spectrum doesn't
+# recompute it.
+
+SPECTRAL_CACHE_DIR = './.cache/spectral/'
+DAYS_PER_YEAR = 365.25
+
+# the most array elements worked on at once in the batched transforms
+MAX_BATCH_SIZE = 2**22
+
+
+def _values(series):
+    # the values as floats and the mean sample spacing in days (from the index
+    # if it has times, the months of the monthly series average 30.44 days)
+    values = np.asarray(series, dtype=float)
+    dt = None
+    if isinstance(series, pd.Series) and isinstance(series.index, pd.DatetimeIndex) and len(series) > 1:
+        dt = (series.index[-1] - series.index[0]).total_seconds()/86400./(len(series) - 1)
+    return values, dt
+
+
+def fill_gaps(values):
+    """
+    Linearly interpolate over the NaNs (the ends are held at the first/last
+    good value).
+
+    Returns
+    -------
+    filled : numpy.ndarray
+    missing : numpy.ndarray
+        bool, True where the values were missing.
+    """
+    values = np.asarray(values, dtype=float)
+    missing = ~np.isfinite(values)
+    if not missing.any():
+        return values.copy(), missing
+    good = np.flatnonzero(~missing)
+    filled = values.copy()
+    filled[missing] = np.interp(np.flatnonzero(missing), good, values[good])
+    return filled, missing
+
+
+def _cached(name, compute, arrays, params, cache_dir):
+    # run compute() (which returns a dict of arrays), or load it if it's been done before
+    if cache_dir is None:
+        return compute()
+    h = hashlib.sha1()
+    for a in arrays:
+        h.update(np.ascontiguousarray(a).tobytes())
+    h.update(repr(sorted(params.items())).encode())
+    cache_file = os.path.join(cache_dir, '{:s}_{:s}.npz'.format(name, h.hexdigest()[:16]))
+    if os.path.exists(cache_file):
+        with np.load(cache_file) as f:
+            return {k: f[k] for k in f.files}
+
+    result = compute()
+    os.makedirs(cache_dir, exist_ok=True)
+    np.savez(cache_file + '.part.npz', **result)
+    os.replace(cache_file + '.part.npz', cache_file)
+    return result
+
+
+def _taper(n, taper):
+    return np.hanning(n) if taper else np.ones(n)
+
+
+def _one_sided(n):
+    # rfft power is doubled for the one sided spectrum, except at zero
+    # frequency (and the Nyquist frequency when n is even)
+    weights = np.full(n//2 + 1, 2.)
+    weights[0] = 1
+    if n % 2 == 0:
+        weights[-1] = 1
+    return weights
+
+
+def periodogram(series, dt=None, taper=True):
+    """
+    The power spectral density from the real FFT of an evenly sampled series.
+
+    Parameters
+    ----------
+    series : ~pandas.Series or array
+        e.g. the monthly or daily sunspot number, missing values as NaN.
+    dt : ~float, optional
+        the sample spacing in days, by default from the DatetimeIndex of the series (or 1).
+    taper : ~bool
+        apply a Hann window before the FFT.
+
+    Returns
+    -------
+    dict
+        'freq' (cycles per day) and 'power' (one sided, units of value^2 per cycle per day).
+    """
+    values, index_dt = _values(series)
+    dt = dt or index_dt or 1.
+    x, _ = fill_gaps(values)
+    w = _taper(len(x), taper)
+    power = np.abs(np.fft.rfft((x - x.mean())*w))**2*dt/(w**2).sum()*_one_sided(len(x))
+    return dict(freq=np.fft.rfftfreq(len(x), dt), power=power)
+
+
+def lomb_scargle(series, times=None, freq=None, n_freq=4000, cache_dir=SPECTRAL_CACHE_DIR):
+    """
+    The Lomb-Scargle periodogram, for unevenly sampled or gapped data. The
+    missing (NaN) values are left out rather than filled.
+
+    Parameters
+    ----------
+    series : ~pandas.Series or array
+        the values, with a DatetimeIndex if `times` isn't given.
+    times : array, optional
+        the times in days.
+    freq : array, optional
+        the frequencies (cycles per day), by default `n_freq` log spaced between
+        1/(length of the series) and the Nyquist frequency of the median spacing.
+
+    Returns
+    -------
+    dict
+        'freq' and 'power' (normalised, between 0 and 1).
+    """
+    values = np.asarray(series, dtype=float)
+    if times is None:
+        times = (series.index - series.index[0]).total_seconds().values/86400.
+    times = np.asarray(times, dtype=float)
+    good = np.isfinite(values)
+    t, y = times[good], values[good]
+    if freq is None:
+        freq = np.geomspace(1/(t[-1] - t[0]), 0.5/np.median(np.diff(t)), n_freq)
+    freq = np.asarray(freq, dtype=float)
+
+    def compute():
+        # scipy works on (times x frequencies) at once, so the frequencies are done in batches
+        batch = max(1, MAX_BATCH_SIZE//len(t))
+        power = np.concatenate([lombscargle(t, y - y.mean(), 2*np.pi*freq[k:k + batch], normalize=True)
+                                for k in range(0, len(freq), batch)])
+        return dict(freq=freq, power=power)
+
+    return _cached('lomb_scargle', compute, [t, y, freq], {}, cache_dir)
+
+
+def sliding_spectrum(series, window, step=1, dt=None, taper=True, cache_dir=SPECTRAL_CACHE_DIR):
+    """
+    The short-time spectrum: the `periodogram` of each window of `window`
+    samples, moved along `step` samples at a time. The windows are strided
+    views of the series and go through the FFT together (in batches of
+    MAX_BATCH_SIZE elements so the memory doesn't blow up for step=1).
+
+    Parameters
+    ----------
+    series : ~pandas.Series or array
+        the evenly sampled series, missing values as NaN (they're interpolated).
+    window : ~int
+        number of samples in each window, e.g. 11*365 for the daily series.
+    step : ~int
+        number of samples between windows.
+
+    Returns
+    -------
+    dict
+        'freq' (cycles per day), 'power' (n_windows, n_freq), 'centre' (the
+        sample at the middle of each window) and 'missing' (the fraction of
+        interpolated samples in each window).
+    """
+    values, index_dt = _values(series)
+    dt = dt or index_dt or 1.
+
+    def compute():
+        x, missing = fill_gaps(values)
+        frames = sliding_window_view(x, window)[::step]
+        w = _taper(window, taper)
+        norm = dt/(w**2).sum()*_one_sided(window)
+
+        batch = max(1, MAX_BATCH_SIZE//window)
+        power = np.empty((len(frames), window//2 + 1))
+        for k in range(0, len(frames), batch):
+            f = frames[k:k + batch]
+            power[k:k + batch] = np.abs(np.fft.rfft((f - f.mean(axis=1, keepdims=True))*w,
+                                                    axis=1))**2*norm
+
+        starts = np.arange(len(frames))*step
+        n_missing = np.r_[0, np.cumsum(missing)]
+        return dict(freq=np.fft.rfftfreq(window, dt), power=power, centre=starts + window//2,
+                    missing=(n_missing[starts + window] - n_missing[starts])/window)
+
+    return _cached('sliding', compute, [values], dict(window=window, step=step, dt=dt, taper=taper),
+                   cache_dir)
+
+
+def morlet_fourier_factor(omega0=6.):
+    """
+    Fourier period / wavelet scale of the Morlet wavelet (Torrence & Compo 1998, table 1).
+    """
+    return 4*np.pi/(omega0 + np.sqrt(2 + omega0**2))
+
+
+def cwt(series, periods=None, dt=None, omega0=6., n_periods=120, cache_dir=SPECTRAL_CACHE_DIR):
+    """
+    The continuous wavelet transform with a Morlet wavelet, done in Fourier
+    space as in Torrence & Compo (1998), so the whole 1818-present daily
+    series takes a few FFTs per batch of scales.
+
+    Parameters
+    ----------
+    series : ~pandas.Series or array
+        the evenly sampled series, missing values as NaN (they're interpolated).
+    periods : array, optional
+        the Fourier periods in days, by default `n_periods` log spaced from
+        4 samples to a third of the length of the series.
+    omega0 : ~float
+        the Morlet frequency parameter.
+
+    Returns
+    -------
+    dict
+        'periods' (days), 'power' (n_periods, len(series)) the wavelet power
+        |W|^2 as float32, and 'coi' the e-folding time of the cone of influence
+        at each sample (days), power at longer periods than this is affected
+        by the ends of the series.
+    """
+    values, index_dt = _values(series)
+    dt = dt or index_dt or 1.
+    n = len(values)
+    factor = morlet_fourier_factor(omega0)
+    if periods is None:
+        periods = np.geomspace(4*dt, n*dt/3, n_periods)
+    periods = np.asarray(periods, dtype=float)
+
+    def compute():
+        x, _ = fill_gaps(values)
+        # zero pad to a power of 2 at least twice as long to stop it wrapping around
+        n_pad = 2**int(np.ceil(np.log2(2*n)))
+        x_hat = np.fft.fft(x - x.mean(), n_pad)
+        omega = 2*np.pi*np.fft.fftfreq(n_pad, dt)
+        scales = periods/factor
+
+        batch = max(1, MAX_BATCH_SIZE//n_pad)
+        power = np.empty((len(scales), n), dtype=np.float32)
+        for k in range(0, len(scales), batch):
+            s = scales[k:k + batch, None]
+            psi_hat = np.sqrt(2*np.pi*s/dt)*np.pi**-0.25*np.exp(-(s*omega - omega0)**2/2)*(omega > 0)
+            power[k:k + batch] = np.abs(np.fft.ifft(x_hat*psi_hat, axis=1)[:, :n])**2
+
+        edge = np.minimum(np.arange(n), np.arange(n)[::-1])
+        return dict(periods=periods, power=power, coi=factor/np.sqrt(2)*dt*edge)
+
+    return _cached('cwt', compute, [values, periods], dict(dt=dt, omega0=omega0), cache_dir)
@@ -0,0 +1,247 @@
+import os
+import contextlib
+import subprocess
+import numpy as np
+import matplotlib.pyplot as plt
+from matplotlib import dates
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from frame_aggregates import LatitudeHistograms, ButterflyRaster
+from render_frames import save_png
+import profiling
+
+# Renderer for the 3-panel active region movies (disk, histogram and
+# butterfly diagram) that builds the figure once and then only updates
+# the data of the scatter plots, the histogram bars, the butterfly image and
+# the current day line for each frame (the histograms and the butterfly
+# image come precomputed from frame_aggregates). The frames can be saved as pngs like before, or the raw
+# RGBA buffer of each frame can be piped straight into ffmpeg.
+
+# the look of plotting_ar.plot_as_datapoints
+DATAPOINTS_STYLE = dict(style=None, cmap='Reds', butterfly_cmap='Reds',
+                        hist_color='darkred', line_color='k', limb_color='k',
+                        plot_day=True, dark=False)
+
+# the look of active_region_movie.plot_ar_butterfly
+BUTTERFLY_STYLE = dict(style='dark_background', cmap='binary', butterfly_cmap='binary_r',
+                       hist_color='lightgrey', line_color='w', limb_color='w',
+                       plot_day=False, dark=True)
+
+
+def _style_context(style):
+    if style is None:
+        return contextlib.nullcontext()
+    return plt.style.context(style)
+
+
+def _offsets(x, y):
+    return np.column_stack([np.asarray(x, dtype=float), np.asarray(y, dtype=float)])
+
+
+class ARFrameRenderer:
+    """
+    Persistent figure for the active region movie frames.
+
+    Parameters
+    ----------
+    ar_days : ar_store.ARDayStore
+        the day-indexed active region data, needs the `times`, `tt` and
+        `area_arcsec` columns added in the plotting scripts.
+    tlims : ~tuple
+        the (start, end) datetimes of the butterfly diagram.
+    look : ~dict
+        DATAPOINTS_STYLE or BUTTERFLY_STYLE.
+    dpi : ~int
+        the resolution of the frames.
+    butterfly : ~str
+        'raster' to draw the butterfly diagram from a frame_aggregates.ButterflyRaster,
+        or 'scatter' to scatter all the past active regions each frame.
+    lat_histograms : frame_aggregates.LatitudeHistograms, optional
+        the histograms of `ar_days` if they're already made (e.g.
+        `ar_dataset.ARDataset.lat_histograms`), otherwise they're made here.
+    raster : frame_aggregates.ButterflyRaster, optional
+        the same for the butterfly raster (it has to be for the same dpi).
+    """
+
+    def __init__(self, ar_days, tlims, look=DATAPOINTS_STYLE, dpi=200, butterfly='raster',
+                 lat_histograms=None, raster=None):
+        self.ar_days = ar_days
+        self.look = dict(look)
+        self.dpi = dpi
+        self.lat_histograms = lat_histograms if lat_histograms is not None else LatitudeHistograms(ar_days)
+        self.raster = None
+        if butterfly == 'raster':
+            self.raster = raster if raster is not None else ButterflyRaster(ar_days, tlims, dpi=dpi)
+
+        with _style_context(self.look['style']):
+            self._build(tlims)
+
+    @classmethod
+    def from_dataset(cls, data, look=DATAPOINTS_STYLE, dpi=200, butterfly='raster'):
+        """
+        The renderer for an `ar_dataset.ARDataset`, using the histograms and
+        butterfly raster it has (or loaded) rather than making them again.
+        """
+        raster = data.butterfly_raster if butterfly == 'raster' and data.butterfly_raster.dpi == dpi else None
+        return cls(data.ar_days, data.tlims, look=look, dpi=dpi, butterfly=butterfly,
+                   lat_histograms=data.lat_histograms, raster=raster)
+
+    def _build(self, tlims):
+        look = self.look
+        empty = np.empty((0, 2))
+
+        fig = Figure(figsize=(7, 8), dpi=self.dpi)
+        FigureCanvasAgg(fig)
+        ax1 = fig.add_axes([0.12, 0.02, 0.62, 0.62])
+        ax2 = fig.add_axes([0.75, 0.0595, 0.22, 0.542], sharey=ax1)
+        ax3 = fig.add_axes([0.12, 0.66, 0.62, 0.33])
+
+        # the draw order on the disk has to be the same as in the plot functions
+        limb = plt.Circle((0, 0), 960, color=look['limb_color'], fill=False,
+                          zorder=0 if look['dark'] else 1)
+        if look['dark']:
+            ax1.add_artist(limb)
+        self.past = ax1.scatter(empty[:, 0], empty[:, 1], c=[], alpha=0.1, cmap=look['cmap'],
+                                edgecolor='k', lw=0.4)
+        self.day = None
+        if look['plot_day']:
+            self.day = ax1.scatter(empty[:, 0], empty[:, 1], color='k')
+        self.recent = ax1.scatter(empty[:, 0], empty[:, 1], c=[], cmap=look['cmap'],
+                                  edgecolor='k', lw=0.4)
+        if not look['dark']:
+            ax1.add_artist(limb)
+
+        ax1.set_aspect('equal', adjustable='box') # make square
+        ax1.set_xlim(-1101, 1101)
+        ax1.set_ylim(-1101, 1101)
+        ax1.set_xlabel('Helioprojective Longitude (arcsec)')
+        ax1.set_ylabel('Helioprojective Latitude (arcsec)')
+        ax1.tick_params(which='both', direction='in')
+
+        ax2.set_ylim(-1101, 1101)
+        ax2.tick_params(labelleft=False, which='both', direction='in')
+        ax2.set_xlabel('No. active regions')
+        ax2.set_xlim(0, 300)
+        # the bars are moved to each day's histogram in update
+        self.hist = self.lat_histograms.draw(ax2, 0, color=look['hist_color'])
+
+        ax3.xaxis_date()
+        if self.raster is not None:
+            self.butterfly = self.raster.draw(ax3, 0, cmap=look['butterfly_cmap'])
+        else:
+            self.butterfly = ax3.scatter(empty[:, 0], empty[:, 1], c=[], alpha=0.3,
+                                         edgecolor='k', lw=0.4, cmap=look['butterfly_cmap'])
+        self.now = ax3.axvline(tlims[0], color=look['line_color'], ls='dashed')
+        ax3.set_xlabel('Time (UT)')
+        ax3.set_ylabel('Latitude (deg)')
+        ax3.tick_params(which='both', direction='in')
+        ax3.set_xlim(*tlims)
+        if look['dark']:
+            ax3.xaxis.set_major_locator(dates.YearLocator(2))
+            ax3.xaxis.set_minor_locator(dates.YearLocator(1))
+            ax3.xaxis.set_major_formatter(dates.DateFormatter('%Y'))
+        ax3.set_ylim(-45, 45)
+
+        if look['dark']:
+            fig.patch.set_alpha(0.0)
+            for ax in (ax1, ax2, ax3):
+                ax.patch.set_alpha(0.0)
+
+        self.fig, self.ax1, self.ax2, self.ax3 = fig, ax1, ax2, ax3
+
+    @staticmethod
+    def _set_scatter(sc, data, x, y, sizes):
+        sc.set_offsets(_offsets(data[x], data[y]))
+        sc.set_sizes(np.asarray(sizes, dtype=float))
+        if sc.get_array() is not None:
+            times = np.asarray(data['times'], dtype=float)
+            sc.set_array(times)
+            # scatter normalises the colours to the range of the data plotted
+            if len(times) > 0:
+                sc.set_clim(times.min(), times.max())
+
+    def update(self, i):
+        """
+        Update the figure to show the data for day i.
+        """
+        ar_days = self.ar_days
+        data_for_day = ar_days.day(i)
+        data_for_days = ar_days.previous(i, 10)
+        data_for_past = ar_days.previous(i, 100)
+
+        self._set_scatter(self.past, data_for_past, 'hpc_x', 'hpc_y',
+                          2*np.sqrt(data_for_past['area_arcsec']))
+        if self.day is not None:
+            self.day.set_offsets(_offsets(data_for_day['hpc_x'], data_for_day['hpc_y']))
+            self.day.set_sizes(np.asarray(2*np.sqrt(data_for_day['area_arcsec']), dtype=float))
+        self._set_scatter(self.recent, data_for_days, 'hpc_x', 'hpc_y',
+                          2*np.sqrt(data_for_days['area_arcsec']))
+
+        self.lat_histograms.update_bars(self.hist, i)
+
+        if self.raster is not None:
+            self.butterfly.set_data(self.raster.rgba(i, cmap=self.look['butterfly_cmap']))
+        else:
+            data_all_past = ar_days.all_past(i)
+            self.butterfly.set_offsets(_offsets(dates.date2num(data_all_past['tt']),
+                                                data_all_past['hgc_y']))
+            self.butterfly.set_sizes(np.asarray(np.sqrt(data_all_past['area_arcsec']), dtype=float))
+            times = np.asarray(data_all_past['times'], dtype=float)
+            self.butterfly.set_array(times)
+            if len(times) > 0:
+                self.butterfly.set_clim(times.min(), times.max())
+
+        day = dates.date2num(ar_days.days[i])
+        self.now.set_xdata([day, day])
+
+    def save_frame(self, i, savedir='./plots/', filename='test_{:04d}.png'):
+        """
+        Update to day i and save the frame as a png, like the plot functions do.
+        """
+        with profiling.frame(i):
+            self.update(i)
+            profiling.checkpoint('update')
+            with _style_context(self.look['style']):
+                save_png(os.path.join(savedir, filename.format(i)), fig=self.fig, dpi=self.dpi)
+            profiling.checkpoint('savefig')
+
+    def frame_rgba(self, i):
+        """
+        Update to day i and return the rendered frame as a (height, width, 4) uint8 array.
+        """
+        self.update(i)
+        profiling.checkpoint('update')
+        self.fig.canvas.draw()
+        profiling.checkpoint('draw')
+        return np.asarray(self.fig.canvas.buffer_rgba())
+
+    def stream_movie(self, frames, outfile, fps=10):
+        """
+        Render the frames and pipe the raw RGBA buffers to ffmpeg, so that
+        no pngs are written.
+
+        Parameters
+        ----------
+        frames : iterable of ~int
+            the frame indices, in order.
+        outfile : ~str
+            the name of the movie file.
+        fps : ~int
+            frames per second of the movie.
+        """
+        width, height = self.fig.canvas.get_width_height()
+        ffmpeg = subprocess.Popen(['ffmpeg', '-y', '-f', 'rawvideo', '-pix_fmt', 'rgba',
+                                   '-s', '{:d}x{:d}'.format(width, height), '-r', str(fps),
+                                   '-i', '-', '-vcodec', 'libx264', '-crf', '25',
+                                   '-pix_fmt', 'yuv420p', outfile], stdin=subprocess.PIPE)
+        try:
+            for i in frames:
+                with profiling.frame(i):
+                    rgba = self.frame_rgba(i)
+                    with profiling.stage('ffmpeg_write'):
+                        ffmpeg.stdin.write(rgba.tobytes())
+        finally:
+            ffmpeg.stdin.close()
+            returncode = ffmpeg.wait()
+        if returncode != 0:
+            raise RuntimeError('ffmpeg failed making {:s} (exit code {:d})'.format(outfile, returncode))
@@ -0,0 +1,48 @@
+import numpy as np
+import pandas as pd
+import pytest
+from ar_store import ARDayStore
+
+
+@pytest.fixture
+def ar_data():
+    # a few regions a day over three weeks in no particular order, with some
+    # rows that aren't on the day grid (they never matched the isin filters)
+    rng = np.random.default_rng(0)
+    days = pd.date_range('2012-03-01', periods=21, freq='D')
+    start = np.repeat(days, 3)
+    start = start.append(pd.DatetimeIndex(['2012-03-04T12:00:00', '2012-03-10T00:00:01', '2012-03-15T23:59:59']))
+    data = pd.DataFrame({'event_starttime': start.strftime('%Y-%m-%dT%H:%M:%S'),
+                         'event_endtime': (start + pd.Timedelta('23:59:59')).strftime('%Y-%m-%dT%H:%M:%S'),
+                         'ar_noaanum': rng.integers(11400, 11500, len(start))})
+    return data.iloc[rng.permutation(len(data))].reset_index(drop=True)
+
+
+def _isin(data, time_over):
+    return data[data['event_starttime'].isin(time_over)]
+
+
+def _same_rows(a, b):
+    pd.testing.assert_frame_equal(a.sort_index(), b.sort_index())
+
+
+def test_slices_match_isin(ar_data):
+    store = ARDayStore(ar_data)
+    time_over = store.time_over
+    assert time_over[0] == '2012-03-01T00:00:00'
+    for i in range(len(store)):
+        _same_rows(store.day(i), _isin(ar_data, time_over[i:i + 1]))
+        _same_rows(store.previous(i, 5), _isin(ar_data, time_over[max(i - 5, 0):i]))
+        _same_rows(store.all_past(i), _isin(ar_data, time_over[0:i]))
+
+
+def test_off_grid_rows_dropped(ar_data):
+    store = ARDayStore(ar_data)
+    assert len(store.data) == 63
+    assert len(store.days_between(0, len(store))) == len(_isin(ar_data, store.time_over))
+
+
+def test_day_keeps_row_order(ar_data):
+    store = ARDayStore(ar_data)
+    for i in range(len(store)):
+        assert list(store.day(i).index) == list(_isin(ar_data, store.time_over[i:i + 1]).index)
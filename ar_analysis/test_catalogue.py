@@ -0,0 +1,50 @@
+import os
+import pandas as pd
+from catalogue import Catalogue, CSV_TEXT
+from pipeline import merge_stage
+
+HEADER = 'event_starttime,ar_noaanum,SOL_standard,area_atdiskcenter\n'
+
+
+def _csv(path, rows):
+    with open(path, 'w') as f:
+        f.write(HEADER + ''.join(r + '\n' for r in rows))
+    return str(path)
+
+
+def test_update_counts_when_nothing_to_fetch(tmp_path):
+    catalogue = Catalogue(str(tmp_path / 'concat.csv'))
+    added = catalogue.add_csv(_csv(tmp_path / 'a.csv', ['2012-03-01T00:00:00,11420,SOL2012-03-01T00:00:00L100C80,1']))
+    nothing = catalogue.update(until='2012-01-01', fetch=lambda tstart, tend: None)
+    assert set(nothing) == set(added)
+    assert nothing == dict(added=0, repeated=0, older=0, no_time=0)
+
+
+def test_merge_and_catalogue_agree_on_events(tmp_path):
+    # the event on the edge of the two files is written differently in the
+    # second (the area as a float), and the first file has a row twice
+    first = _csv(tmp_path / 'first.csv', ['2012-03-01T00:00:00,11420,SOL2012-03-01T00:00:00L100C80,1',
+                                          '2012-03-01T00:00:00,11420,SOL2012-03-01T00:00:00L100C80,1',
+                                          '2012-03-02T00:00:00,11421,SOL2012-03-02T00:00:00L120C70,2'])
+    second = _csv(tmp_path / 'second.csv', ['2012-03-02T00:00:00,11421,SOL2012-03-02T00:00:00L120C70,2.0',
+                                            '2012-03-03T00:00:00,11422,SOL2012-03-03T00:00:00L140C60,3'])
+    outdir = tmp_path / 'merge'
+    outdir.mkdir()
+    merged, = merge_stage(str(outdir), {'input:first': dict(outputs=[first]),
+                                        'input:second': dict(outputs=[second])})
+    with open(merged) as f:
+        lines = f.read().splitlines()
+    assert lines == [HEADER.strip(), '2012-03-01T00:00:00,11420,SOL2012-03-01T00:00:00L100C80,1',
+                     '2012-03-01T00:00:00,11420,SOL2012-03-01T00:00:00L100C80,1',
+                     '2012-03-02T00:00:00,11421,SOL2012-03-02T00:00:00L120C70,2',
+                     '2012-03-03T00:00:00,11422,SOL2012-03-03T00:00:00L140C60,3']
+
+    catalogue = Catalogue(str(tmp_path / 'concat.csv'))
+    catalogue.add_csv(first)
+    catalogue.add_csv(second)
+    table = pd.read_csv(catalogue.filename, **CSV_TEXT)
+    merged = pd.read_csv(merged, **CSV_TEXT)
+    # the same events, the catalogue also drops the repeat within the first file
+    assert list(table['SOL_standard']) == list(merged['SOL_standard'].drop_duplicates())
+    assert len(merged) == len(table) + 1
+    assert os.path.exists(catalogue.state_file)
@@ -0,0 +1,36 @@
+import numpy as np
+import pandas as pd
+from flare_match import match_flares, flare_productivity
+
+
+def _ar_data():
+    return pd.DataFrame({'event_starttime': ['1999-05-03T00:00:00', '2010-08-17T00:00:00', '2010-08-18T00:00:00',
+                                             '2010-08-18T00:00:00'],
+                         'ar_noaanum': [8525, 11099, 11099, 11100],
+                         'hpc_x': [100., -300., -280., 500.], 'hpc_y': [200., 150., 150., -100.]})
+
+
+def test_wrapped_numbers_match():
+    # the flare list has 4 digit numbers after 2002, like 1099 for 11099
+    flares = pd.DataFrame({'event_peaktime': ['1999-05-03T10:00:00', '2010-08-18T00:01:00', '2010-08-19T05:00:00',
+                                              '2010-08-18T12:00:00'],
+                           'ar_noaanum': [8525, 1099, 1099, 11100],
+                           'goes_class': [1e-6, 2e-6, 1e-5, 3e-6]})
+    matched = match_flares(flares, _ar_data(), ar_columns=['ar_noaanum'])
+    assert list(matched['match']) == ['number']*4
+    assert list(matched['ar_row']) == [0, 2, 2, 3]
+    assert list(matched['match_days']) == [0, 0, -1, 0]
+    assert list(matched['ar_noaanum_ar']) == [8525, 11099, 11099, 11100]
+
+    productivity = flare_productivity(matched, _ar_data())
+    assert list(productivity.index) == [8525, 11099, 11100]
+    assert list(productivity['n_flares']) == [1, 2, 1]
+    np.testing.assert_allclose(productivity.loc[11099, 'flare_index'], (2 + 10)/2)
+
+
+def test_wrapped_number_not_matched_before_2002():
+    # a 4 digit number before the wrap is a region of its own
+    flares = pd.DataFrame({'event_peaktime': ['1999-05-03T10:00:00'], 'ar_noaanum': [1099]})
+    matched = match_flares(flares, _ar_data().assign(event_starttime='1999-05-03T00:00:00'),
+                           ar_columns=['ar_noaanum'])
+    assert list(matched['match']) == ['none']
@@ -0,0 +1,138 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+netcdf = pytest.importorskip('scipy.io')
+from goes_xrs import read_flare_list, FLARE_LIST_COLUMNS
+
+EPOCH = np.datetime64('2000-01-01T12:00:00', 's')
+UNITS = 'seconds since 2000-01-01 12:00:00'
+BACKGROUND = 1e-7
+
+
+def _write(path, variables):
+    # a netCDF3 file with these variables along time, strings as char arrays
+    with netcdf.netcdf_file(str(path), 'w') as f:
+        n = len(variables['time'])
+        f.createDimension('time', n)
+        for name, values in variables.items():
+            values = np.asarray(values)
+            if values.dtype.kind in 'UO':
+                values = values.astype('S')
+                width = max(values.dtype.itemsize, 1)
+                if 'strlen{:d}'.format(width) not in f.dimensions:
+                    f.createDimension('strlen{:d}'.format(width), width)
+                var = f.createVariable(name, 'c', ('time', 'strlen{:d}'.format(width)))
+                var[:] = values.view('S1').reshape(n, width)
+            else:
+                var = f.createVariable(name, values.dtype, ('time',))
+                var[:] = values
+            if name == 'time':
+                var.units = UNITS
+
+
+def _seconds(times):
+    return (np.asarray(times, dtype='datetime64[s]') - EPOCH).astype(float)
+
+
+def _summary_file(path, records):
+    times, status, counter, flare_class, flux = zip(*records)
+    _write(path, {'time': _seconds(times), 'status': np.array(status), 'flare_counter': np.array(counter, dtype='i4'),
+                  'flare_class': np.array(flare_class), 'xrsb_flux': np.array(flux)})
+
+
+def _flare(peak):
+    # the minutes of a flare (NOAA SWPC definition) starting at the first of
+    # them, peaking at the sixth and ending at the ninth
+    b = BACKGROUND
+    return np.array([b, 2*b, 5*b, 10*b, 0.6*peak, peak, 0.8*peak, 0.6*peak, 0.45*peak, 0.2*peak, 0.1*peak])
+
+
+def _lightcurve(start, minutes, flares, flagged=()):
+    # 1-min flux on a flat background with flares at (minute, peak), and
+    # flagged (bad) flares
+    flux = np.full(minutes, BACKGROUND)
+    flag = np.zeros(minutes, dtype='i2')
+    for at, peak in list(flares) + list(flagged):
+        profile = _flare(peak)
+        flux[at:at + len(profile)] = profile
+    for at, peak in flagged:
+        flag[at:at + len(_flare(peak))] = 1
+    times = np.datetime64(start, 's') + np.arange(minutes)*np.timedelta64(60, 's')
+    return times, flux, flag
+
+
+def test_flare_summaries(tmp_path):
+    # counter 2 ends the next day, counter 0 started before the first file,
+    # counter 5 hasn't ended by the last and counter 4 is below C1.0
+    _summary_file(tmp_path / 'sci_xrsf-l2-flsum_g16_d20170906_v2-0-1.nc', [
+        ('2017-09-06T00:05', 'EVENT_END', 0, '', np.nan),
+        ('2017-09-06T02:00', 'EVENT_START', 1, '', np.nan),
+        ('2017-09-06T02:10', 'EVENT_PEAK', 1, 'M1.2', 1.2e-5),
+        ('2017-09-06T02:30', 'EVENT_END', 1, '', np.nan),
+        ('2017-09-06T12:00', 'EVENT_START', 4, '', np.nan),
+        ('2017-09-06T12:04', 'EVENT_PEAK', 4, 'B5.0', 5e-7),
+        ('2017-09-06T12:10', 'EVENT_END', 4, '', np.nan),
+        ('2017-09-06T23:40', 'EVENT_START', 2, '', np.nan),
+        ('2017-09-06T23:55', 'EVENT_PEAK', 2, '', 3.4e-6)])
+    _summary_file(tmp_path / 'sci_xrsf-l2-flsum_g16_d20170907_v2-0-1.nc', [
+        ('2017-09-07T00:20', 'EVENT_END', 2, '', np.nan),
+        ('2017-09-07T05:00', 'EVENT_START', 3, '', np.nan),
+        ('2017-09-07T05:05', 'EVENT_PEAK', 3, 'X1.1', 1.1e-4),
+        ('2017-09-07T05:30', 'EVENT_END', 3, '', np.nan),
+        ('2017-09-07T23:00', 'EVENT_START', 5, '', np.nan)])
+
+    flares = read_flare_list(str(tmp_path), processes=1, batch=1)
+    assert list(flares.columns) == FLARE_LIST_COLUMNS
+    expected = pd.DataFrame({
+        'event_starttime': ['2017-09-06T02:00:00', '2017-09-06T23:40:00', '2017-09-07T05:00:00'],
+        'event_peaktime': ['2017-09-06T02:10:00', '2017-09-06T23:55:00', '2017-09-07T05:05:00'],
+        'event_endtime': ['2017-09-06T02:30:00', '2017-09-07T00:20:00', '2017-09-07T05:30:00'],
+        'fl_goescls': ['M1.2', 'C3.4', 'X1.1'],
+        'ar_noaanum': 0,
+        'goes_class': [1.2e-5, 3.4e-6, 1.1e-4],
+        'flare_times': ['2017-09-06 02:10:00', '2017-09-06 23:55:00', '2017-09-07 05:05:00']})
+    pd.testing.assert_frame_equal(flares, expected, check_dtype=False)
+
+
+@pytest.fixture
+def lightcurve_files(tmp_path):
+    # two days of 1-min data, a C5.0 flare, an M2.0 flare over midnight and
+    # a flagged one that isn't real
+    times, flux, flag = _lightcurve('2017-09-06', 2*1440, [(600, 5e-6), (1437, 2e-5)], flagged=[(2000, 1e-4)])
+    files = []
+    for day in range(2):
+        path = tmp_path / 'sci_xrsf-l2-avg1m_g16_d2017090{:d}_v2-2-0.nc'.format(6 + day)
+        rows = slice(day*1440, (day + 1)*1440)
+        _write(path, {'time': _seconds(times[rows]), 'xrsb_flux': flux[rows], 'xrsb_flag': flag[rows]})
+        files.append(str(path))
+    return files
+
+
+LIGHTCURVE_FLARES = pd.DataFrame({
+    'event_starttime': ['2017-09-06T10:00:00', '2017-09-06T23:57:00'],
+    'event_peaktime': ['2017-09-06T10:05:00', '2017-09-07T00:02:00'],
+    'event_endtime': ['2017-09-06T10:08:00', '2017-09-07T00:05:00'],
+    'fl_goescls': ['C5.0', 'M2.0'],
+    'ar_noaanum': 0,
+    'goes_class': [5e-6, 2e-5],
+    'flare_times': ['2017-09-06 10:05:00', '2017-09-07 00:02:00']})
+
+
+@pytest.mark.parametrize('processes, chunk_rows', [(1, 2**16), (1, 100), (2, 100)])
+def test_lightcurve_flares(lightcurve_files, processes, chunk_rows):
+    flares = read_flare_list(lightcurve_files, processes=processes, chunk_rows=chunk_rows)
+    assert list(flares.columns) == FLARE_LIST_COLUMNS
+    pd.testing.assert_frame_equal(flares, LIGHTCURVE_FLARES, check_dtype=False)
+
+
+def test_one_second_data_averaged(tmp_path):
+    # the 1-min light curve as 1-s samples that average to it, read in
+    # chunks that don't line up with the minutes
+    times, flux, flag = _lightcurve('2017-09-06T09:00', 120, [(60, 5e-6)])
+    noise = np.tile(np.linspace(-0.05, 0.05, 60), 120)
+    path = tmp_path / 'sci_xrsf-l1b_g16_d20170906_v1.nc'
+    _write(path, {'time': _seconds(times[0]) + np.arange(120*60), 'xrsb_flux': np.repeat(flux, 60)*(1 + noise),
+                  'xrsb_flag': np.repeat(flag, 60)})
+    flares = read_flare_list([str(path)], processes=1, chunk_rows=1000)
+    pd.testing.assert_frame_equal(flares, LIGHTCURVE_FLARES.iloc[:1], check_dtype=False)
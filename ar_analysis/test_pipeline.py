@@ -0,0 +1,28 @@
+import os
+import time
+import numpy as np
+from pipeline import hash_files, code_modules, build_stages
+
+
+def test_npz_hash_is_the_arrays(tmp_path):
+    arrays = dict(counts=np.arange(12).reshape(3, 4), edges=np.linspace(-1, 1, 5))
+    np.savez(tmp_path / 'a.npz', **arrays)
+    first = hash_files([str(tmp_path / 'a.npz')])
+    # the zip entries of a later save have another time in them
+    time.sleep(2.1)
+    np.savez(tmp_path / 'a.npz', **arrays)
+    assert hash_files([str(tmp_path / 'a.npz')]) == first
+    np.savez(tmp_path / 'a.npz', **dict(arrays, edges=arrays['edges'] + 1))
+    assert hash_files([str(tmp_path / 'a.npz')]) != first
+
+
+def test_render_code_has_the_modules_it_imports():
+    stages = {s.name: s for s in build_stages(inputs=[os.path.abspath(__file__)], movies=['datapoints'])}
+    render = code_modules(stages['render:datapoints'].code)
+    for module in ('plotting_ar', 'render_frames', 'stream_render', 'frame_aggregates', 'map_grid',
+                   'projection', 'profiling', 'data_cache', 'ar_dataset', 'ar_store'):
+        assert module in render
+    # the merge is pipeline and catalogue (and what that imports), not every stage pipeline imports
+    merge = code_modules(stages['merge'].code)
+    assert 'catalogue' in merge and 'pipeline' in merge
+    assert 'plotting_ar' not in merge and 'render_frames' not in merge
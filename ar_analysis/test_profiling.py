@@ -0,0 +1,38 @@
+import os
+import pytest
+import profiling
+
+
+@profiling.profiled(frame=True)
+def _plot(i):
+    sum(range(1000))
+
+
+def _profiled_frames(outfile):
+    cprofile_dir = os.path.splitext(str(outfile))[0] + '_cprofile'
+    return sorted(int(f.split('_')[1]) for f in os.listdir(cprofile_dir))
+
+
+@pytest.fixture(autouse=True)
+def no_profiler():
+    yield
+    profiling.disable()
+
+
+@pytest.mark.parametrize('frames, expected', [
+    (range(0, 3885, 100), [0, 500, 1000, 1500, 2000, 2500, 3000, 3500]),
+    (range(7, 30), [7, 12, 17, 22, 27]),
+    (range(3, 60, 4), [3, 23, 43]),
+])
+def test_every_n_counts_rendered_frames(tmp_path, frames, expected):
+    outfile = tmp_path / 'profile.jsonl'
+    profiling.profile_frames(_plot, frames, outfile=str(outfile), cprofile_frames=5)
+    assert _profiled_frames(outfile) == expected
+    records = profiling.load_records(outfile)
+    assert sorted(records.loc[records['cprofile'], 'frame'].astype(int)) == expected
+
+
+def test_frame_list(tmp_path):
+    outfile = tmp_path / 'profile.jsonl'
+    profiling.profile_frames(_plot, range(7, 30), outfile=str(outfile), cprofile_frames=[5, 8, 20])
+    assert _profiled_frames(outfile) == [8, 20]
@@ -0,0 +1,70 @@
+import numpy as np
+import pytest
+
+pytest.importorskip('sunpy')
+from astropy import units as u
+from astropy.time import Time
+from astropy.coordinates import SkyCoord
+from astropy.wcs import WCS
+from sunpy.coordinates import frames
+from projection import observer, earth_view, hgs_to_pixel
+from map_grid import map_header
+
+# sub-arcsecond, and a hundredth of a pixel
+ARCSEC_TOLERANCE = 0.1
+PIXEL_TOLERANCE = 0.01
+
+
+@pytest.fixture(scope='module')
+def cache_dir(tmp_path_factory):
+    # the observer tables are made again (with sunpy) rather than taken from ./.cache
+    return str(tmp_path_factory.mktemp('observer'))
+
+
+@pytest.fixture(scope='module')
+def points():
+    # random points on the visible disk at random times 1996-2020
+    rng = np.random.default_rng(0)
+    n = 2000
+    lon, lat = rng.uniform(-89, 89, n), np.degrees(np.arcsin(rng.uniform(-0.99, 0.99, n)))
+    times = np.datetime64('1996-01-01', 's') + rng.integers(0, 25*365*86400, n).astype('timedelta64[s]')
+    return lon, lat, times
+
+
+@pytest.mark.parametrize('carrington', [False, True])
+def test_earth_view_matches_sunpy(points, cache_dir, carrington):
+    lon, lat, times = points
+    obstime = Time(times)
+    if carrington:
+        lon = np.mod(lon + observer(times, cache_dir=cache_dir)['l0'], 360)
+        frame = frames.HeliographicCarrington(observer='earth', obstime=obstime)
+    else:
+        frame = frames.HeliographicStonyhurst(obstime=obstime)
+    expected = SkyCoord(lon*u.deg, lat*u.deg, frame=frame).transform_to(
+        frames.Helioprojective(observer='earth', obstime=obstime))
+    tx, ty, _ = earth_view(lon, lat, times, carrington=carrington, cache_dir=cache_dir)
+    assert np.abs(tx - expected.Tx.arcsec).max() < ARCSEC_TOLERANCE
+    assert np.abs(ty - expected.Ty.arcsec).max() < ARCSEC_TOLERANCE
+
+
+def _rotated_header(header):
+    # off centre, another scale and CROTA2 rather than a PC matrix
+    rotated = dict(header, crval1=120., crval2=-250., crpix1=600.5, crpix2=900.5, cdelt1=0.6, cdelt2=0.6)
+    for k in ('pc1_1', 'pc1_2', 'pc2_1', 'pc2_2'):
+        rotated.pop(k)
+    rotated['crota2'] = 12.
+    return rotated
+
+
+@pytest.mark.parametrize('rotate', [False, True])
+def test_hgs_to_pixel_matches_wcs(points, cache_dir, rotate):
+    lon, lat, times = points
+    header = map_header(times[0], scale=2, shape=(1500, 1500))
+    if rotate:
+        header = _rotated_header(header)
+    coords = SkyCoord(lon*u.deg, lat*u.deg, frame=frames.HeliographicStonyhurst(obstime=header['date-obs']))
+    hpc = coords.transform_to(frames.Helioprojective(observer='earth', obstime=header['date-obs']))
+    expected_x, expected_y = WCS(header).world_to_pixel(hpc)
+    x, y, _ = hgs_to_pixel(lon, lat, header, cache_dir=cache_dir)
+    assert np.abs(x - expected_x).max() < PIXEL_TOLERANCE
+    assert np.abs(y - expected_y).max() < PIXEL_TOLERANCE
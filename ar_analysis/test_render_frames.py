@@ -0,0 +1,34 @@
+import os
+import pytest
+from render_frames import encode_movie, PNG_END
+
+
+def _fake_ffmpeg(tmp_path, monkeypatch, exit_code):
+    # an ffmpeg on the PATH that only exits with exit_code
+    bindir = tmp_path / 'bin'
+    bindir.mkdir()
+    ffmpeg = bindir / 'ffmpeg'
+    ffmpeg.write_text('#!/bin/sh\nexit {:d}\n'.format(exit_code))
+    ffmpeg.chmod(0o755)
+    monkeypatch.setenv('PATH', str(bindir) + os.pathsep + os.environ.get('PATH', ''))
+
+
+def _frames(tmp_path, frames):
+    for i in frames:
+        (tmp_path / 'test_{:04d}.png'.format(i)).write_bytes(b'\x89PNG' + PNG_END)
+    return str(tmp_path) + '/'
+
+
+@pytest.mark.skipif(os.name != 'posix', reason='the fake ffmpeg is a shell script')
+def test_encode_movie_raises_when_ffmpeg_fails(tmp_path, monkeypatch):
+    _fake_ffmpeg(tmp_path, monkeypatch, 1)
+    savedir = _frames(tmp_path, range(3))
+    with pytest.raises(RuntimeError, match='exit code 1'):
+        encode_movie(range(3), str(tmp_path / 'movie.mp4'), savedir=savedir)
+
+
+@pytest.mark.skipif(os.name != 'posix', reason='the fake ffmpeg is a shell script')
+def test_encode_movie_ffmpeg_succeeds(tmp_path, monkeypatch):
+    _fake_ffmpeg(tmp_path, monkeypatch, 0)
+    savedir = _frames(tmp_path, range(3))
+    encode_movie(range(3), str(tmp_path / 'movie.mp4'), savedir=savedir)
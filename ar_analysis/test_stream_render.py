@@ -0,0 +1,45 @@
+import os
+import numpy as np
+import pytest
+
+matplotlib = pytest.importorskip('matplotlib')
+matplotlib.use('Agg')
+import matplotlib.image as mpimg
+
+import plotting_ar
+from stream_render import ARFrameRenderer, DATAPOINTS_STYLE
+
+DATA_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), plotting_ar.data_file)
+
+# out of order and two days running, so a scatter, bar or day line left
+# over from the previous frame shows (days next to each other differ in
+# 0.05% of the image on average)
+FRAMES = [1500, 0, 400, 401]
+
+
+@pytest.fixture
+def frames_dir(tmp_path, monkeypatch):
+    if not os.path.exists(DATA_FILE):
+        pytest.skip('no {:s}'.format(plotting_ar.data_file))
+    # the data is read (and its column cache made) in a temporary directory
+    os.symlink(DATA_FILE, tmp_path / plotting_ar.data_file)
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'old').mkdir()
+    (tmp_path / 'new').mkdir()
+    return tmp_path
+
+
+@pytest.mark.parametrize('butterfly', ['raster', 'scatter'])
+def test_frames_match_plot_as_datapoints(frames_dir, butterfly):
+    data = plotting_ar.dataset()
+    renderer = ARFrameRenderer.from_dataset(data, look=DATAPOINTS_STYLE, butterfly=butterfly)
+    for i in FRAMES:
+        plotting_ar.plot_as_datapoints(i, savedir='./old/', butterfly=butterfly)
+        renderer.save_frame(i, savedir='./new/')
+        old = mpimg.imread(frames_dir / 'old' / 'test_{:04d}.png'.format(i))
+        new = mpimg.imread(frames_dir / 'new' / 'test_{:04d}.png'.format(i))
+        assert old.shape == new.shape
+        assert np.array_equal(old, new), i
+        # and the buffer that stream_movie pipes to ffmpeg
+        streamed = renderer.frame_rgba(i)
+        assert np.array_equal(np.round(old*255).astype(np.uint8), streamed), i
@@ -0,0 +1,328 @@
+import os
+import argparse
+import multiprocessing
+import numpy as np
+import pandas as pd
+from goes_xrs import _NetCDF, xrs_files, decode_times, CHUNK_ROWS
+from flare_match import GOES_FLUX
+
+# Daily and monthly indices of the GOES XRS-B flux made from the high cadence
+# light curves (1-s or 1-min), to put next to the SILSO sunspot number:
+#
+#   python xrs_indices.py ./goes15_avg1m/ --output xrs_daily.csv --monthly xrs_monthly.csv
+#   python xrs_indices.py ./goes15_avg1m/ --output xrs_daily.csv --ssn ../SN_d_tot_V2.0.csv
+#
+# For each day (or month):
+#   - mean_flux, the time weighted mean flux (W m^-2)
+#   - background, the lowest 1-min mean flux
+#   - max_flux, the highest sample
+#   - fluence, the flux integrated over the day (J m^-2)
+#   - minutes_C, minutes_M, minutes_X, the minutes with a 1-min mean of at
+#     least C1.0, M1.0 and X1.0
+#   - n_samples, seconds (of data) and coverage (the fraction of the day with data)
+#
+# The light curve goes through a `FluxAggregator` a chunk at a time, which
+# only keeps the sums of the day it's on and the samples of the minute it's
+# on, so the memory doesn't depend on the length of the light curve. Each
+# file is read a chunk at a time on a process pool into its own daily sums,
+# which are then added up, so reading the files is the slow part.
+
+MINUTE_NS = 60*10**9
+DAY_NS = 86400*10**9
+
+# the classes counted in minutes_<class>
+CLASSES = ('C', 'M', 'X')
+
+# how the sums of the same day from different chunks (or files), and the
+# days of a month, are put together (the minutes_<class> counts are added)
+COMBINE = {'n_samples': np.add, 'seconds': np.add, 'fluence': np.add,
+           'max_flux': np.fmax, 'background': np.fmin}
+
+
+def _combine_with(name):
+    return COMBINE.get(name, np.add)
+
+
+class FluxAggregator:
+    """
+    Running daily sums of a light curve added in time order, a chunk at a time.
+
+    Parameters
+    ----------
+    cadence : ~str, optional
+        the time between samples, anything `pd.Timedelta` understands (e.g.
+        '1s' or '1min'). Each sample counts for the time since the sample
+        before, up to one cadence, so gaps in the data aren't filled in. By
+        default it's the typical step of the first chunk.
+    classes : tuple of ~str
+        the GOES classes whose minutes are counted.
+
+    Examples
+    --------
+    >>> aggregator = FluxAggregator()
+    >>> for times, flux in chunks:
+    ...     aggregator.add(times, flux)
+    >>> daily = aggregator.finish()
+    """
+
+    def __init__(self, cadence=None, classes=CLASSES):
+        self.cadence = pd.Timedelta(cadence).value if cadence is not None else None
+        self.classes = tuple(classes)
+        self.fields = list(COMBINE) + ['minutes_' + c for c in self.classes]
+        self._last = None
+        # the samples (times, flux, seconds) of the minute that isn't over yet
+        self._minute = (np.array([], dtype=np.int64), np.array([]), np.array([]))
+        # the day that isn't over yet and its sums
+        self._open = None
+        self._days = []
+
+    def add(self, times, flux):
+        """
+        Add a chunk of the light curve, after the chunks before it.
+
+        Parameters
+        ----------
+        times : array-like
+            datetime64 times, in order.
+        flux : array-like
+            the flux, bad samples (flagged, fill values) as NaN.
+        """
+        times = np.asarray(times, dtype='datetime64[ns]')
+        flux = np.asarray(flux, dtype=float)
+        good = ~np.isnat(times)
+        t, f = times[good].astype(np.int64), flux[good]
+        if len(t) == 0:
+            return
+        if (t[1:] < t[:-1]).any() or (self._last is not None and t[0] < self._last):
+            raise ValueError('the light curve has to be added in time order')
+
+        if self.cadence is None:
+            steps = np.diff(t)
+            steps = steps[steps > 0]
+            self.cadence = int(np.median(steps)) if len(steps) else MINUTE_NS
+        previous = np.r_[self._last if self._last is not None else t[0] - self.cadence, t[:-1]]
+        seconds = np.minimum(t - previous, self.cadence)/1e9
+        self._last = t[-1]
+
+        # bad samples move the time on but aren't counted
+        ok = np.isfinite(f) & (f > 0)
+        t = np.r_[self._minute[0], t[ok]]
+        f = np.r_[self._minute[1], f[ok]]
+        seconds = np.r_[self._minute[2], seconds[ok]]
+        if len(t) == 0:
+            return
+        # the last minute might go on in the next chunk, so it's kept back
+        held = np.searchsorted(t, t[-1] - t[-1] % MINUTE_NS)
+        self._minute = (t[held:], f[held:], seconds[held:])
+        self._add_minutes(t[:held], f[:held], seconds[:held])
+
+    def _add_minutes(self, t, f, seconds):
+        # the daily sums of whole minutes of samples
+        if len(t) == 0:
+            return
+        minute = t//MINUTE_NS
+        minute_starts = np.flatnonzero(np.r_[True, minute[1:] != minute[:-1]])
+        means = np.add.reduceat(f, minute_starts)/np.diff(np.r_[minute_starts, len(t)])
+
+        day = t//DAY_NS
+        day_starts = np.flatnonzero(np.r_[True, day[1:] != day[:-1]])
+        days = day[day_starts]
+        # the first minute of each day
+        first_minute = np.searchsorted(day[minute_starts], days)
+
+        sums = {'n_samples': np.diff(np.r_[day_starts, len(t)]),
+                'seconds': np.add.reduceat(seconds, day_starts),
+                'fluence': np.add.reduceat(f*seconds, day_starts),
+                'max_flux': np.maximum.reduceat(f, day_starts),
+                'background': np.minimum.reduceat(means, first_minute)}
+        for c in self.classes:
+            above = (means >= GOES_FLUX[c]*(1 - 1e-9)).astype(np.int64)
+            sums['minutes_' + c] = np.add.reduceat(above, first_minute)
+        self._merge(days, sums)
+
+    def _merge(self, days, sums):
+        # the first day might be the open one, all but the last are over
+        if self._open is not None:
+            open_day, open_sums = self._open
+            if days[0] == open_day:
+                for name in self.fields:
+                    sums[name][0] = _combine_with(name)(open_sums[name], sums[name][0])
+            else:
+                self._days.append(([open_day], {name: [v] for name, v in open_sums.items()}))
+        if len(days) > 1:
+            self._days.append((days[:-1], {name: v[:-1] for name, v in sums.items()}))
+        self._open = (days[-1], {name: v[-1] for name, v in sums.items()})
+
+    def daily(self):
+        """
+        The indices of the days that are over (see the top of the module).
+        """
+        days = [np.asarray(d, dtype=np.int64) for d, _ in self._days]
+        sums = {name: np.concatenate([np.asarray(s[name]) for _, s in self._days]) if days else []
+                for name in self.fields}
+        index = pd.DatetimeIndex((np.concatenate(days) if days else np.array([], dtype=np.int64))*DAY_NS,
+                                 name='times')
+        return _with_means(pd.DataFrame(sums, index=index), np.full(len(index), 86400.))
+
+    def finish(self):
+        """
+        Close the last minute and day, and return the daily indices.
+        """
+        t, f, seconds = self._minute
+        self._minute = (np.array([], dtype=np.int64), np.array([]), np.array([]))
+        self._add_minutes(t, f, seconds)
+        if self._open is not None:
+            day, sums = self._open
+            self._days.append(([day], {name: [v] for name, v in sums.items()}))
+            self._open = None
+        return self.daily()
+
+
+def _with_means(sums, period_seconds):
+    # the mean flux and the coverage from the sums
+    table = sums[[c for c in sums.columns if c not in ('mean_flux', 'coverage')]].copy()
+    with np.errstate(invalid='ignore', divide='ignore'):
+        table.insert(0, 'mean_flux', table['fluence'].values/table['seconds'].values)
+    table['coverage'] = table['seconds'].values/period_seconds
+    return table
+
+
+def _combine(table, groups):
+    # the rows of a table sorted by group put together with COMBINE
+    starts = np.flatnonzero(np.r_[True, groups[1:] != groups[:-1]])
+    sums = {name: _combine_with(name).reduceat(table[name].values, starts)
+            for name in table.columns if name not in ('mean_flux', 'coverage')}
+    return pd.DataFrame(sums), starts
+
+
+def combine_daily(tables):
+    """
+    Daily indices from the daily indices of parts of a light curve (e.g. one
+    per file), days in more than one of them put together.
+    """
+    tables = [t for t in tables if t is not None and len(t)]
+    if not tables:
+        return FluxAggregator().daily()
+    table = pd.concat(tables)
+    table = table.iloc[np.argsort(table.index.values, kind='stable')]
+    sums, starts = _combine(table, table.index.values)
+    sums.index = table.index[starts]
+    return _with_means(sums, np.full(len(sums), 86400.))
+
+
+def monthly_indices(daily):
+    """
+    Monthly indices from the daily ones, indexed by the first of the month
+    like the SILSO monthly file (see `silso.read_silso`). The background is
+    the lowest of the month, the coverage is of the whole month.
+    """
+    months = daily.index.values.astype('datetime64[M]')
+    sums, starts = _combine(daily, months)
+    index = pd.DatetimeIndex(months[starts].astype('datetime64[ns]'), name='times')
+    sums.index = index
+    days_in_month = ((months[starts] + 1).astype('datetime64[D]') - months[starts].astype('datetime64[D]'))
+    return _with_means(sums, days_in_month.astype(np.int64)*86400.)
+
+
+def with_ssn(indices, ssn):
+    """
+    The indices on the days (or months) of a SILSO table from
+    `silso.read_silso` over the time they cover, with the sunspot number
+    as the first column. Days without XRS data are NaN.
+    """
+    ssn = ssn.loc[indices.index.min():indices.index.max()] if len(indices) else ssn.iloc[:0]
+    table = indices.reindex(ssn.index)
+    table.insert(0, 'ssn', ssn['ssn'].values)
+    return table
+
+
+def write_indices(table, filename):
+    """
+    Write the indices as csv (through a .part file, so a partly written file is never left).
+    """
+    table.to_csv(filename + '.part', float_format='%.6g', date_format='%Y-%m-%d')
+    os.replace(filename + '.part', filename)
+
+
+def _file_indices(args):
+    # in the pool: the daily indices of one light curve file, read a chunk at a time
+    path, flux_variable, flag_variable, cadence, chunk_rows = args
+    with _NetCDF(path) as nc:
+        if flux_variable not in nc.variables or 'status' in nc.variables:
+            # e.g. a flare summary
+            return None
+        names = ['time', flux_variable] + ([flag_variable] if flag_variable in nc.variables else [])
+        units = nc.attribute('time', 'units')
+        aggregator = FluxAggregator(cadence=cadence)
+        for chunk in nc.chunks(names, chunk_rows=chunk_rows):
+            flux = chunk[flux_variable].astype(float)
+            if flag_variable in chunk:
+                flux[chunk[flag_variable] != 0] = np.nan
+            aggregator.add(decode_times(chunk['time'], units), flux)
+    return aggregator.finish()
+
+
+def read_indices(files, processes=None, flux_variable='xrsb_flux', flag_variable='xrsb_flag',
+                 cadence=None, chunk_rows=CHUNK_ROWS, mp_context=None):
+    """
+    The daily indices of GOES XRS light curve files.
+
+    Parameters
+    ----------
+    files : ~str or list of ~str
+        a directory (see `goes_xrs.xrs_files`) or the files. Files without
+        the flux (e.g. flare summaries) are skipped.
+    processes : ~int, optional
+        the number of processes reading the files, by default the number of
+        CPUs. With 1 no pool is used.
+    flux_variable, flag_variable : ~str
+        the flux and its quality flag (non zero is bad).
+    cadence : ~str, optional
+        see `FluxAggregator`, by default found from each file.
+    chunk_rows : ~int
+        the rows read at a time.
+
+    Returns
+    -------
+    pandas.DataFrame
+        indexed by day, see the top of the module.
+    """
+    if isinstance(files, str):
+        files = xrs_files(files)
+    processes = processes or os.cpu_count() or 1
+    args = [(f, flux_variable, flag_variable, cadence, chunk_rows) for f in files]
+    if processes > 1 and len(args) > 1:
+        with multiprocessing.get_context(mp_context).Pool(processes) as pool:
+            # in order, a few files per task, and only one row per day comes back
+            tables = list(pool.imap(_file_indices, args, chunksize=4))
+    else:
+        tables = [_file_indices(a) for a in args]
+    return combine_daily(tables)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Daily and monthly GOES XRS flux indices.')
+    parser.add_argument('directory')
+    parser.add_argument('--satellite', type=int, default=None, help='e.g. 15, if the directory has more than one')
+    parser.add_argument('--processes', type=int, default=None)
+    parser.add_argument('--flux', default='xrsb_flux', help='the flux variable, e.g. b_flux for GOES 13-15')
+    parser.add_argument('--output', default='xrs_daily.csv', help='csv file for the daily indices')
+    parser.add_argument('--monthly', default=None, help='csv file for the monthly indices')
+    parser.add_argument('--ssn', default=None, help='SILSO file to put the indices on, e.g. ../SN_d_tot_V2.0.csv')
+    args = parser.parse_args()
+
+    daily = read_indices(xrs_files(args.directory, satellite=args.satellite), processes=args.processes,
+                         flux_variable=args.flux)
+    monthly = monthly_indices(daily)
+    if args.ssn:
+        from silso import read_silso
+        ssn = read_silso(args.ssn)
+        # the daily or the monthly file
+        if 'day' in ssn.columns:
+            daily = with_ssn(daily, ssn)
+        else:
+            monthly = with_ssn(monthly, ssn)
+    print('{:d} days, {:d} months'.format(len(daily), len(monthly)))
+    write_indices(daily, args.output)
+    if args.monthly:
+        write_indices(monthly, args.monthly)